@@ -1,4 +1,4 @@
-from app.api import ai, auth, emails, gmail, ingestion, mailbox, outlook
+from app.api import ai, auth, emails, gmail, ingestion, mailbox, metrics, outlook
 
 __all__ = [
     "ai",
@@ -7,5 +7,6 @@ __all__ = [
     "gmail",
     "ingestion",
     "mailbox",
+    "metrics",
     "outlook",
 ]
@@ -1,4 +1,8 @@
+import json
+
 from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from app import deps
@@ -12,7 +16,8 @@ from app.schemas import (
     ChatSessionListResponse,
     SourceFragment,
 )
-from app.services.answer_engine import answer_question
+from app.db.session import SessionLocal
+from app.services.answer_engine import answer_question_async, answer_question_stream
 from app.services.chat_history import (
     ensure_chat_session_with_title,
     format_chat_history_text,
@@ -25,17 +30,18 @@ router = APIRouter(prefix="/ai", tags=["ai"])
 
 
 @router.post("/ask", response_model=AskResponse)
-def ask_endpoint(
+async def ask_endpoint(
     payload: AskRequest,
     db: Session = Depends(get_db),
     user_id: str = Depends(deps.get_current_user_id),
 ):
+    # async 路由：等待 LLM / ES 时不占用线程池；同步的 DB 操作放进线程池执行
     chat_id = payload.chat_id or "default"
-    ensure_chat_session_with_title(db, user_id, chat_id, payload.question)
-    history_records = get_chat_history(db, user_id, chat_id)
+    await run_in_threadpool(ensure_chat_session_with_title, db, user_id, chat_id, payload.question)
+    history_records = await run_in_threadpool(get_chat_history, db, user_id, chat_id)
     history_text = format_chat_history_text(history_records)
 
-    answer, frags = answer_question(
+    answer, frags = await answer_question_async(
         db,
         user_id=user_id,
         question=payload.question,
@@ -47,10 +53,65 @@ def ask_endpoint(
     # Convert Pydantic objects to dicts for JSON storage
     sources_data = [f.dict() for f in frags] if frags else []
     
-    save_chat_turn(db, user_id, chat_id, payload.question, answer, sources=sources_data)
+    await run_in_threadpool(save_chat_turn, db, user_id, chat_id, payload.question, answer, sources=sources_data)
     return AskResponse(answer=answer, sources=frags)
 
 
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/ask/stream")
+async def ask_stream_endpoint(
+    payload: AskRequest,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(deps.get_current_user_id),
+):
+    """
+    /ai/ask 的流式版本（Server-Sent Events）：
+    检索完成后先推送 tools / sources，再逐段推送 token，结束时推送 done 并保存本轮对话。
+    """
+    chat_id = payload.chat_id or "default"
+    await run_in_threadpool(ensure_chat_session_with_title, db, user_id, chat_id, payload.question)
+    history_records = await run_in_threadpool(get_chat_history, db, user_id, chat_id)
+    history_text = format_chat_history_text(history_records)
+
+    async def event_stream():
+        # 响应体在依赖清理之后仍可能在发送，流内使用独立的 DB 会话
+        stream_db = SessionLocal()
+        try:
+            async for event, data in answer_question_stream(
+                stream_db,
+                user_id=user_id,
+                question=payload.question,
+                current_thread_id=payload.current_thread_id,
+                chat_id=chat_id,
+                chat_history=history_text,
+            ):
+                if event == "done":
+                    await run_in_threadpool(
+                        save_chat_turn,
+                        stream_db,
+                        user_id,
+                        chat_id,
+                        payload.question,
+                        data["answer"],
+                        sources=data["sources"],
+                    )
+                yield _sse_event(event, data)
+        except Exception as e:
+            print(f"⚠️ /ai/ask/stream error: {type(e).__name__}: {e}")
+            yield _sse_event("error", {"detail": f"{type(e).__name__}: {e}"})
+        finally:
+            await run_in_threadpool(stream_db.close)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/chat-sessions", response_model=ChatSessionListResponse)
 def list_chat_sessions_endpoint(
     limit: int = 100,
@@ -4,11 +4,17 @@ from sqlalchemy.orm import Session
 from app import deps
 from app.api.dependencies import get_db
 from app.schemas.gmail import GmailConnectRequest, GmailSyncRequest, GmailSyncResponse
-from app.services.gmail_ingest import initial_gmail_import, sync_gmail_incremental
+from app.db import models
+from app.services.job_queue import enqueue_mailbox_job
 
 router = APIRouter(prefix="/gmail", tags=["gmail"])
 
 
+def _to_job_response(job: models.IngestionJob) -> GmailSyncResponse:
+    # 导入在后台 worker 中执行，这里只返回任务信息；结果见 /ingestion/jobs/{job_id}
+    return GmailSyncResponse(ingested=0, job_id=job.id, job_status=job.status, session_id=job.session_id)
+
+
 @router.post("/connect", response_model=GmailSyncResponse)
 def gmail_connect(
     payload: GmailConnectRequest,
@@ -18,15 +24,14 @@ def gmail_connect(
     """
     åˆæ¬¡æŽ¥å…¥ Gmailï¼šä½¿ç”¨ access_token æ‹‰å–æœ€è¿‘ N å¤©é‚®ä»¶ï¼ˆé»˜è®¤ 90 å¤©ï¼‰ï¼Œå¹¶ä¿å­˜ historyIdã€‚
     """
-    ingested, history_id, last_synced_at = initial_gmail_import(
+    job = enqueue_mailbox_job(
         db,
         user_id=user_id,
-        email=payload.email,
-        access_token=payload.access_token,
-        refresh_token=payload.refresh_token,
-        days_back=payload.days_back,
+        provider="gmail",
+        initial=True,
+        payload=payload.model_dump(),
     )
-    return GmailSyncResponse(ingested=ingested, history_id=history_id, last_synced_at=last_synced_at)
+    return _to_job_response(job)
 
 
 @router.post("/sync", response_model=GmailSyncResponse)
@@ -40,12 +45,11 @@ def gmail_sync(
     - ä¼˜å…ˆä½¿ç”¨å·²æœ‰ historyId å¢žé‡åŒæ­¥
     - å¦‚æ—  historyIdï¼Œåˆ™å›žé€€æŠ“å–æœ€è¿‘ fallback_days_back å¤©
     """
-    ingested, history_id, last_synced_at = sync_gmail_incremental(
+    job = enqueue_mailbox_job(
         db,
         user_id=user_id,
-        email=payload.email,
-        access_token=payload.access_token,
-        refresh_token=payload.refresh_token,
-        fallback_days_back=payload.fallback_days_back,
+        provider="gmail",
+        initial=False,
+        payload=payload.model_dump(),
     )
-    return GmailSyncResponse(ingested=ingested, history_id=history_id, last_synced_at=last_synced_at)
+    return _to_job_response(job)
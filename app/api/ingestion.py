@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
 from app import deps
@@ -10,8 +10,10 @@ from app.schemas import (
     FullIngestionStartRequest,
     FullIngestionStartResponse,
     FullIngestionStatusResponse,
+    IngestionJobResponse,
 )
-from app.services.full_ingestion import ingest_full_batch, start_full_ingestion
+from app.services.full_ingestion import get_active_session, start_full_ingestion
+from app.services.job_queue import enqueue_job, get_job
 
 router = APIRouter(prefix="/ingestion", tags=["ingestion"])
 
@@ -69,19 +71,25 @@ def full_ingestion_batch(
     - next_checkpoint: å¤–éƒ¨é‚®ç®±æœåŠ¡çš„â€œä¸‹ä¸€é¡µâ€æ¸¸æ ‡
     - mark_completed: å¦‚æžœè¿™æ˜¯æœ€åŽä¸€æ‰¹ï¼Œå¯ä»¥ç½® true
     """
-    session_before = get_ingestion_session(db, payload.session_id, user_id)
-    processed_before = session_before.processed_count
-
-    session_after = ingest_full_batch(db, payload, user_id=user_id)
-    ingested_in_batch = session_after.processed_count - processed_before
-
+    session = get_ingestion_session(db, payload.session_id, user_id)
+    get_active_session(db, session.id, user_id=user_id)
+    job = enqueue_job(
+        db,
+        user_id=user_id,
+        kind="full_batch",
+        payload=payload.model_dump(mode="json"),
+        session_id=session.id,
+    )
+    # 批次在后台 worker 中写入，这里立即返回；结果通过 /ingestion/jobs/{job_id} 查询
     return FullIngestionBatchResponse(
-        session_id=session_after.id,
-        ingested_in_batch=ingested_in_batch,
-        total_processed_count=session_after.processed_count,
-        status=session_after.status,
-        checkpoint_token=session_after.checkpoint_token,
-        updated_at=session_after.updated_at,
+        session_id=session.id,
+        ingested_in_batch=0,
+        total_processed_count=session.processed_count,
+        status=session.status,
+        checkpoint_token=session.checkpoint_token,
+        updated_at=session.updated_at,
+        job_id=job.id,
+        job_status=job.status,
     )
 
 
@@ -97,3 +105,32 @@ def full_ingestion_status(
     """
     session = get_ingestion_session(db, session_id, user_id)
     return _to_full_ingestion_status_response(session)
+
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobResponse)
+def ingestion_job_status(
+    job_id: int,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(deps.get_current_user_id),
+):
+    """
+    查询后台导入任务状态；进度（processed_count / checkpoint_token）取自关联的 IngestionSession。
+    """
+    job = get_job(db, job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job not found")
+    session = db.get(models.IngestionSession, job.session_id) if job.session_id else None
+    return IngestionJobResponse(
+        job_id=job.id,
+        kind=job.kind,
+        status=job.status,
+        session_id=job.session_id,
+        session_status=session.status if session else None,
+        processed_count=session.processed_count if session else 0,
+        checkpoint_token=session.checkpoint_token if session else None,
+        result=job.result,
+        last_error=job.last_error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
@@ -0,0 +1,27 @@
+from fastapi import APIRouter
+
+from app.services.answer_cache import answer_cache
+from app.services.embedding_cache import get_embedding_cache
+from app.services.http_clients import pool_stats
+from app.services.llm_cache import get_llm_cache
+from app.services.query_classifier import rewrite_counter
+from app.services.rank_fusion import fusion_stats
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("")
+def metrics_endpoint():
+    """
+    进程内缓存与快速通道的计数（不含任何用户数据）。
+    """
+    embedding_cache = get_embedding_cache()
+    llm_cache = get_llm_cache()
+    return {
+        "answer_cache": answer_cache.stats(),
+        "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+        "http_pools": pool_stats(),
+        "llm_cache": llm_cache.stats() if llm_cache else None,
+        "query_rewrite": rewrite_counter.stats(),
+        "search_fusion": fusion_stats.stats(),
+    }
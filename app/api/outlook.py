@@ -4,11 +4,17 @@ from sqlalchemy.orm import Session
 from app import deps
 from app.api.dependencies import get_db
 from app.schemas.outlook import OutlookConnectRequest, OutlookSyncRequest, OutlookSyncResponse
-from app.services.outlook_ingest import initial_outlook_import, sync_outlook_incremental
+from app.db import models
+from app.services.job_queue import enqueue_mailbox_job
 
 router = APIRouter(prefix="/outlook", tags=["outlook"])
 
 
+def _to_job_response(job: models.IngestionJob) -> OutlookSyncResponse:
+    # 导入在后台 worker 中执行，这里只返回任务信息；结果见 /ingestion/jobs/{job_id}
+    return OutlookSyncResponse(ingested=0, job_id=job.id, job_status=job.status, session_id=job.session_id)
+
+
 @router.post("/connect", response_model=OutlookSyncResponse)
 def outlook_connect(
     payload: OutlookConnectRequest,
@@ -18,15 +24,14 @@ def outlook_connect(
     """
     åˆæ¬¡æŽ¥å…¥ Outlookï¼šä½¿ç”¨ access_token æ‹‰å–æœ€è¿‘ N å¤©é‚®ä»¶ï¼ˆé»˜è®¤ 90 å¤©ï¼‰ï¼Œå¹¶ä¿å­˜ delta linkã€‚
     """
-    ingested, delta_link, last_synced_at = initial_outlook_import(
+    job = enqueue_mailbox_job(
         db,
         user_id=user_id,
-        email=payload.email,
-        access_token=payload.access_token,
-        refresh_token=payload.refresh_token,
-        days_back=payload.days_back,
+        provider="outlook",
+        initial=True,
+        payload=payload.model_dump(),
     )
-    return OutlookSyncResponse(ingested=ingested, delta_link=delta_link, last_synced_at=last_synced_at)
+    return _to_job_response(job)
 
 
 @router.post("/sync", response_model=OutlookSyncResponse)
@@ -40,12 +45,11 @@ def outlook_sync(
     - ä¼˜å…ˆä½¿ç”¨å·²æœ‰ delta_link å¢žé‡åŒæ­¥
     - å¦‚æ—  delta_linkï¼Œåˆ™å›žé€€æŠ“å–æœ€è¿‘ fallback_days_back å¤©
     """
-    ingested, delta_link, last_synced_at = sync_outlook_incremental(
+    job = enqueue_mailbox_job(
         db,
         user_id=user_id,
-        email=payload.email,
-        access_token=payload.access_token,
-        refresh_token=payload.refresh_token,
-        fallback_days_back=payload.fallback_days_back,
+        provider="outlook",
+        initial=False,
+        payload=payload.model_dump(),
     )
-    return OutlookSyncResponse(ingested=ingested, delta_link=delta_link, last_synced_at=last_synced_at)
+    return _to_job_response(job)
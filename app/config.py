@@ -8,21 +8,116 @@ class Settings:
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL_GPT: str = os.getenv("OPENAI_MODEL_GPT", "gpt-4.1-mini")
     OPENAI_MODEL_EMBEDDING: str = os.getenv("OPENAI_MODEL_EMBEDDING", "text-embedding-3-large")
+    # 向量维度：小于模型原生维度时通过 embeddings API 的 dimensions 参数截断（text-embedding-3 系列支持）
+    # ES mapping 的 dims 也取这个值，修改后需用 scripts/reindex_vectors.py 迁移已有索引
+    EMBED_DIM: int = int(os.getenv("EMBED_DIM", "3072"))
+    # 对不在内置 Matryoshka 列表（text-embedding-3-*）里的模型也发送 dimensions；确认 provider 支持该参数时再打开
+    EMBED_SEND_DIMENSIONS: bool = os.getenv("EMBED_SEND_DIMENSIONS", "false").lower() == "true"
     OPENAI_PROXY: str = os.getenv("OPENAI_PROXY", None)
     OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "")
+    # 校验 OpenAI（含 embeddings）的 TLS 证书；只有经过会替换证书的代理时才设为 false
+    OPENAI_VERIFY_SSL: bool = os.getenv("OPENAI_VERIFY_SSL", "true").lower() == "true"
+    # 共享 HTTP 客户端（app/services/http_clients.py）：每个上游一个连接池
+    HTTP_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_TIMEOUT_SECONDS", "30"))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+    OPENAI_HTTP_MAX_CONNECTIONS: int = int(os.getenv("OPENAI_HTTP_MAX_CONNECTIONS", "100"))
+    GMAIL_HTTP_MAX_CONNECTIONS: int = int(os.getenv("GMAIL_HTTP_MAX_CONNECTIONS", "50"))
+    OUTLOOK_HTTP_MAX_CONNECTIONS: int = int(os.getenv("OUTLOOK_HTTP_MAX_CONNECTIONS", "50"))
+    # HTTP/2 需要可选依赖 h2（pip install "httpx[http2]"），默认关闭；未安装 h2 时即使打开也回退到 HTTP/1.1
+    HTTP2_ENABLED: bool = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+    # chat_completion 响应缓存（可选，默认关闭）："memory"（进程内 LRU）| "sqlite"（本地文件）| "none"
+    # /ai/ask 的最终回答始终不走这个缓存，由按邮箱版本失效的 answer_cache 负责
+    LLM_CACHE_BACKEND: str = os.getenv("LLM_CACHE_BACKEND", "none").lower()
+    LLM_CACHE_PATH: str = os.getenv("LLM_CACHE_PATH", "./llm_cache.db")
+    LLM_CACHE_TTL_SECONDS: float = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(60 * 60 * 24)))
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+    # Embedding 批量请求：单次请求的最大条数与估算 token 上限
+    EMBED_BATCH_SIZE: int = int(os.getenv("EMBED_BATCH_SIZE", "96"))
+    EMBED_BATCH_MAX_TOKENS: int = int(os.getenv("EMBED_BATCH_MAX_TOKENS", "100000"))
+    # 邮件正文切分（app/services/chunking.py）：每个 chunk 的 token 上限、相邻 chunk 的重叠 token 数、是否去掉引用与签名
+    CHUNK_MAX_TOKENS: int = int(os.getenv("CHUNK_MAX_TOKENS", "512"))
+    CHUNK_OVERLAP_TOKENS: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+    CHUNK_STRIP_QUOTED: bool = os.getenv("CHUNK_STRIP_QUOTED", "true").lower() == "true"
+    # 同一线程内已在较早邮件出现过的段落不再 embedding / 索引（SQL 中仍保存完整正文）
+    CHUNK_THREAD_DEDUP: bool = os.getenv("CHUNK_THREAD_DEDUP", "true").lower() == "true"
+    # 本地持久化 embedding 缓存（SQLite 文件），按 (model, 归一化文本) 命中
+    EMBED_CACHE_ENABLED: bool = os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true"
+    EMBED_CACHE_PATH: str = os.getenv("EMBED_CACHE_PATH", "./embedding_cache.db")
+    EMBED_CACHE_MAX_ENTRIES: int = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+    # /ai/ask 工具并发执行：线程池大小与单个工具的超时（秒），超时的工具按空结果处理；
+    # 同时在跑的同步工具（含超时后仍未结束的）达到 TOOL_MAX_WORKERS 时，新工具直接降级为空结果
+    TOOL_MAX_WORKERS: int = int(os.getenv("TOOL_MAX_WORKERS", "8"))
+    TOOL_TIMEOUT_SECONDS: float = float(os.getenv("TOOL_TIMEOUT_SECONDS", "20"))
+    # 响应头带上 Server-Timing（pick_tools / ai_search / answer_completion 等阶段耗时），压测与排查时打开
+    SERVER_TIMING_ENABLED: bool = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+    # AI Search 的 query 理解："combined" 一次 LLM 调用同时改写与抽取特征；"two_step" 为原先的两次调用
+    AI_SEARCH_QUERY_MODE: str = os.getenv("AI_SEARCH_QUERY_MODE", "combined").lower()
+    # /ai/ask 语义答案缓存：按用户、问题向量余弦相似度 + 上下文 hash + 邮箱版本命中
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_SIMILARITY: float = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+    ANSWER_CACHE_TTL_SECONDS: float = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "900"))
+    ANSWER_CACHE_MAX_ENTRIES_PER_USER: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES_PER_USER", "200"))
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./email_ai.db")
     ENABLE_CROSS_ENCODER: bool = os.getenv("ENABLE_CROSS_ENCODER", "false").lower() == "true"
     AUTH_SECRET: str = os.getenv("AUTH_SECRET", "change-me")
     AUTH_TOKEN_TTL_SECONDS: int = int(os.getenv("AUTH_TOKEN_TTL_SECONDS", str(60 * 60 * 24 * 30)))
+    # 检索后端："elasticsearch" | "local"（进程内 SQLite FTS5 + 每个租户一个 NumPy memmap 向量文件，无需 ES）
+    SEARCH_BACKEND: str = os.getenv("SEARCH_BACKEND", "elasticsearch").lower()
+    LOCAL_INDEX_PATH: str = os.getenv("LOCAL_INDEX_PATH", "./local_index")
+    # 检索结果按 email_id 折叠（每封邮件一条），并为每封邮件带回最多这么多条同邮件内的备选 snippet
+    SEARCH_COLLAPSE: bool = os.getenv("SEARCH_COLLAPSE", "true").lower() == "true"
+    SEARCH_ALTERNATIVE_SNIPPETS: int = int(os.getenv("SEARCH_ALTERNATIVE_SNIPPETS", "2"))
+    # snippet 由 ES highlight 生成（最多 SEARCH_SNIPPET_CHARS 个字符）；关闭时按 chunk 偏移从 DB 正文截取
+    SEARCH_HIGHLIGHT: bool = os.getenv("SEARCH_HIGHLIGHT", "true").lower() == "true"
+    SEARCH_SNIPPET_CHARS: int = int(os.getenv("SEARCH_SNIPPET_CHARS", "400"))
+    # BM25 与向量结果的融合方式："linear"（0.65/0.35 加权，单次查询）| "rrf"（ES rrf retriever）
+    # | "client_rrf"（两路并发查询，在应用内做 RRF，可看到每一路的耗时与名次），见 app/services/rank_fusion.py
+    SEARCH_FUSION: str = os.getenv("SEARCH_FUSION", "linear").lower()
+    SEARCH_RRF_RANK_CONSTANT: int = int(os.getenv("SEARCH_RRF_RANK_CONSTANT", "60"))
+    # RRF 模式下每一路的候选深度（linear 模式沿用按 size 推算的旧值）
+    SEARCH_LEXICAL_DEPTH: int = int(os.getenv("SEARCH_LEXICAL_DEPTH", "50"))
+    SEARCH_KNN_DEPTH: int = int(os.getenv("SEARCH_KNN_DEPTH", "50"))
+    SEARCH_KNN_NUM_CANDIDATES: int = int(os.getenv("SEARCH_KNN_NUM_CANDIDATES", "100"))
+    # rerank 前丢弃低相关命中：linear 模式比较 ES 原始分数（SEARCH_BACKEND=local 时用 LOCAL_SEARCH_MIN_SCORE）；RRF 模式比较归一化分数（某一路第 1 名 = 1.0），默认不过滤
+    SEARCH_MIN_SCORE: float = float(os.getenv("SEARCH_MIN_SCORE", "50"))
+    # 本地后端 linear 分数（0.65 * BM25 + 0.35 * 向量相似度）与 ES 不在一个量级，单独设置阈值
+    LOCAL_SEARCH_MIN_SCORE: float = float(os.getenv("LOCAL_SEARCH_MIN_SCORE", "0"))
+    SEARCH_RRF_MIN_SCORE: float = float(os.getenv("SEARCH_RRF_MIN_SCORE", "0"))
     # Elasticsearch
     ELASTICSEARCH_URL: str = os.getenv("ELASTICSEARCH_URL", "http://localhost:9200")
     ELASTICSEARCH_INDEX_EMAILS: str = os.getenv("ELASTICSEARCH_INDEX_EMAILS", "emails_ai")
+    # embedding 字段的 HNSW 存储方式："hnsw"（float32）| "int8_hnsw" | "int4_hnsw" | "bbq_hnsw"（ES 8.16+，dims >= 64）
+    ES_VECTOR_PROFILE: str = os.getenv("ES_VECTOR_PROFILE", "int8_hnsw").lower()
+    # 租户路由（app/services/index_routing.py）：共享索引按 user_id 做 _routing；新建索引的主分片数
+    # ⚠️ 已有的多分片索引若此前未按 routing 写入，开启前需先用 scripts/reindex_vectors.py 重建
+    ES_ROUTING_ENABLED: bool = os.getenv("ES_ROUTING_ENABLED", "true").lower() == "true"
+    ES_INDEX_SHARDS: int = int(os.getenv("ES_INDEX_SHARDS", "1"))
+    # 新建索引时不在 _source 中保存 embedding（只影响新索引，已有索引需 scripts/reindex_vectors.py 重建）
+    ES_SOURCE_EXCLUDE_EMBEDDING: bool = os.getenv("ES_SOURCE_EXCLUDE_EMBEDDING", "false").lower() == "true"
+    # 独立租户索引（别名）是否存在的缓存时间（秒）
+    ES_TENANT_ALIAS_CACHE_SECONDS: float = float(os.getenv("ES_TENANT_ALIAS_CACHE_SECONDS", "60"))
+    # _bulk 批量写入：按条数 / 字节数触发 flush；refresh 可选 "false" | "wait_for" | "true"
+    ES_BULK_CHUNK_SIZE: int = int(os.getenv("ES_BULK_CHUNK_SIZE", "500"))
+    ES_BULK_MAX_BYTES: int = int(os.getenv("ES_BULK_MAX_BYTES", str(10 * 1024 * 1024)))
+    ES_BULK_MAX_RETRIES: int = int(os.getenv("ES_BULK_MAX_RETRIES", "3"))
+    ES_BULK_REFRESH: str = os.getenv("ES_BULK_REFRESH", "false").lower()
+    # 后台导入 worker 数量（0 表示本进程不消费队列，可用 python -m app.services.job_queue 单独运行）
+    INGESTION_WORKERS: int = int(os.getenv("INGESTION_WORKERS", "2"))
+    # running 任务的租约时长（秒）；worker 每 1/3 租约续一次心跳，超时未续的任务由任意 worker 重新排队
+    INGESTION_LEASE_SECONDS: int = int(os.getenv("INGESTION_LEASE_SECONDS", "120"))
     # Outlook / Microsoft Graph
     OUTLOOK_GRAPH_BASE_URL: str = os.getenv("OUTLOOK_GRAPH_BASE_URL", "https://graph.microsoft.com/v1.0")
     OUTLOOK_PAGE_SIZE: int = int(os.getenv("OUTLOOK_PAGE_SIZE", "50"))
     # Gmail
     GMAIL_API_BASE_URL: str = os.getenv("GMAIL_API_BASE_URL", "https://gmail.googleapis.com/gmail/v1")
     GMAIL_PAGE_SIZE: int = int(os.getenv("GMAIL_PAGE_SIZE", "100"))
+    # 并发拉取 message 详情；可选走 Gmail multipart batch 端点（每个 batch 最多 GMAIL_BATCH_SIZE 个子请求）
+    GMAIL_FETCH_CONCURRENCY: int = int(os.getenv("GMAIL_FETCH_CONCURRENCY", "8"))
+    GMAIL_USE_BATCH_API: bool = os.getenv("GMAIL_USE_BATCH_API", "false").lower() == "true"
+    GMAIL_BATCH_URL: str = os.getenv("GMAIL_BATCH_URL", "https://gmail.googleapis.com/batch/gmail/v1")
+    GMAIL_BATCH_SIZE: int = int(os.getenv("GMAIL_BATCH_SIZE", "50"))
+    GMAIL_MAX_RETRIES: int = int(os.getenv("GMAIL_MAX_RETRIES", "5"))
 
 
 settings = Settings()
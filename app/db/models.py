@@ -41,8 +41,8 @@ class Email(Base):
     is_promotion = Column(Integer, default=0)  # 0 or 1
 
 
-# 组合索引，强化隔离和查询效率
-Index("ix_email_user_external", Email.user_id, Email.external_id)
+# 组合索引，强化隔离和查询效率；(user_id, external_id) 唯一，保证并发重试时不会重复插入
+Index("ix_email_user_external", Email.user_id, Email.external_id, unique=True)
 Index("ix_email_user_thread", Email.user_id, Email.thread_id)
 
 
@@ -57,7 +57,7 @@ class IngestionSession(Base):
     user_id = Column(String, index=True)
     provider = Column(String, index=True)  # 比如 "gmail", "imap", "shortwave"
 
-    # 当前会话状态: "in_progress" | "completed" | "failed"
+    # 当前会话状态: "queued" | "in_progress" | "completed" | "failed"
     status = Column(String, default="in_progress", index=True)
 
     # 外部邮箱服务的游标，比如 Gmail 的 nextPageToken / historyId
@@ -73,6 +73,45 @@ class IngestionSession(Base):
     updated_at = Column(DateTime, default=datetime.utcnow)
 
 
+class IngestionJob(Base):
+    """
+    后台导入任务（SQLite 持久化的本地队列），由 job_queue 的 worker 池按 user_id 轮询执行。
+    进度与断点信息记录在关联的 IngestionSession 上。
+    """
+
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, index=True)
+    # "gmail_import" | "gmail_sync" | "outlook_import" | "outlook_sync" | "full_batch"
+    kind = Column(String, index=True)
+    payload = Column(JSON, nullable=True)
+    # "queued" | "running" | "completed" | "failed"
+    status = Column(String, default="queued", index=True)
+    session_id = Column(Integer, index=True, nullable=True)
+    result = Column(JSON, nullable=True)
+    last_error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+    # 租约：领取任务的 worker 及其最近心跳；心跳超时的 running 任务才会被重新排队
+    worker_id = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class MailboxVersion(Base):
+    """
+    每个用户邮箱内容的版本号；导入新邮件时递增，用于让 /ai/ask 的答案缓存失效。
+    """
+
+    __tablename__ = "mailbox_versions"
+
+    user_id = Column(String, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
 class MailboxSyncState(Base):
     """
     记录外部邮箱（如 Outlook）的同步状态与令牌，用于增量同步。
@@ -7,3 +7,65 @@ engine = create_engine(
     connect_args={"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {},
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def ensure_email_unique_index() -> None:
+    """
+    老库里 (user_id, external_id) 是普通索引，create_all 不会改已有表，这里把它升级为唯一索引。
+    如果历史数据里已经有重复行，则保留原索引并打印告警。
+    """
+    from sqlalchemy import inspect
+    from sqlalchemy.exc import IntegrityError
+
+    from app.db import models
+
+    index = next(i for i in models.Email.__table__.indexes if i.name == "ix_email_user_external")
+    existing = {i["name"]: i for i in inspect(engine).get_indexes(models.Email.__tablename__)}
+    current = existing.get(index.name)
+    if current is None or current.get("unique"):
+        return
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"DROP INDEX {index.name}")
+        try:
+            with conn.begin_nested():
+                index.create(conn)
+        except IntegrityError:
+            print("⚠️ emails has duplicate (user_id, external_id) rows; keeping non-unique index")
+            conn.exec_driver_sql(
+                f"CREATE INDEX {index.name} ON {models.Email.__tablename__} (user_id, external_id)"
+            )
+
+
+RUNNING_JOB_USER_INDEX = "ux_ingestion_jobs_running_user"
+
+
+def ensure_ingestion_job_lease() -> None:
+    """
+    给老库的 ingestion_jobs 补上租约列（worker_id / heartbeat_at）；
+    sqlite / postgres 上再建 "每个用户最多一个 running 任务" 的部分唯一索引，多进程领取时由数据库兜底。
+    """
+    from sqlalchemy import inspect
+    from sqlalchemy.exc import IntegrityError
+
+    from app.db import models
+
+    table = models.IngestionJob.__tablename__
+    columns = {c["name"] for c in inspect(engine).get_columns(table)}
+    with engine.begin() as conn:
+        if "worker_id" not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN worker_id VARCHAR")
+        if "heartbeat_at" not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN heartbeat_at TIMESTAMP")
+
+    if engine.dialect.name not in ("sqlite", "postgresql"):
+        return
+    with engine.begin() as conn:
+        try:
+            with conn.begin_nested():
+                conn.exec_driver_sql(
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS {RUNNING_JOB_USER_INDEX} "
+                    f"ON {table} (user_id) WHERE status = 'running'"
+                )
+        except IntegrityError:
+            print(f"⚠️ {table} has users with several running jobs; skipping {RUNNING_JOB_USER_INDEX}")
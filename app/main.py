@@ -1,14 +1,20 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.api import ai, auth, emails, gmail, ingestion, mailbox, outlook
+from app.api import ai, auth, emails, gmail, ingestion, mailbox, metrics, outlook
+from app.config import settings
 from app.db import models
 from app.db.base import Base
-from app.db.session import engine
-from app.services.search_index_es import ensure_email_index
+from app.db.session import engine, ensure_email_unique_index, ensure_ingestion_job_lease
+from app.services.http_clients import aclose_http_clients, close_http_clients
+from app.services.job_queue import worker_pool
+from app.services.search_backend import ensure_email_index
+from app.services.stage_timing import ServerTimingMiddleware
 
 # åˆ›å»º DB è¡?
 Base.metadata.create_all(bind=engine)
+ensure_email_unique_index()
+ensure_ingestion_job_lease()
 
 app = FastAPI(title="Email AI Agent (Shortwave-style) with ES & Multitenancy")
 
@@ -21,6 +27,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.SERVER_TIMING_ENABLED:
+    # Per-stage timings in a Server-Timing header (read by scripts/load_test.py)
+    app.add_middleware(ServerTimingMiddleware)
+
 app.include_router(ingestion.router)
 app.include_router(emails.router)
 app.include_router(ai.router)
@@ -28,9 +38,19 @@ app.include_router(outlook.router)
 app.include_router(gmail.router)
 app.include_router(mailbox.router)
 app.include_router(auth.router)
+app.include_router(metrics.router)
 
 
 @app.on_event("startup")
 def on_startup():
     # åˆå§‹åŒ– ES ç´¢å¼•
     ensure_email_index()
+    # 启动后台导入 worker（INGESTION_WORKERS=0 时不启动）
+    worker_pool.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    worker_pool.stop()
+    close_http_clients()
+    await aclose_http_clients()
@@ -20,5 +20,6 @@ from .ingestion import (
     FullIngestionBatchRequest,
     FullIngestionBatchResponse,
     FullIngestionStatusResponse,
+    IngestionJobResponse,
 )
 from .auth import LoginRequest, LoginResponse
@@ -22,3 +22,7 @@ class GmailSyncResponse(BaseModel):
     ingested: int
     history_id: Optional[str] = None
     last_synced_at: Optional[datetime] = None
+    # 后台任务信息：接口立即返回，进度通过 /ingestion/jobs/{job_id} 查询
+    job_id: Optional[int] = None
+    job_status: Optional[str] = None
+    session_id: Optional[int] = None
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 
 from .email import EmailIngestItem
@@ -39,6 +39,9 @@ class FullIngestionBatchResponse(BaseModel):
     status: str
     checkpoint_token: Optional[str] = None
     updated_at: datetime
+    # 批次在后台任务中处理时，ingested_in_batch 为 0，结果通过 /ingestion/jobs/{job_id} 查询
+    job_id: Optional[int] = None
+    job_status: Optional[str] = None
 
 
 class FullIngestionStatusResponse(BaseModel):
@@ -51,3 +54,18 @@ class FullIngestionStatusResponse(BaseModel):
     last_error: Optional[str]
     created_at: datetime
     updated_at: datetime
+
+
+class IngestionJobResponse(BaseModel):
+    job_id: int
+    kind: str
+    status: str
+    session_id: Optional[int] = None
+    session_status: Optional[str] = None
+    processed_count: int = 0
+    checkpoint_token: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    last_error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
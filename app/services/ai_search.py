@@ -1,17 +1,22 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import List, Optional
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
+import asyncio
 import json
 
 from sqlalchemy.orm import Session
 from dateutil.parser import parse as parse_dt
 
+from app.config import settings
 from app.db import models
-from app.services.llm_provider import chat_completion
-from app.services.embeddings import embed_text
-from app.services.search_index_es import search_email_documents
+from app.services.llm_provider import chat_completion, chat_completion_async
+from app.services.embeddings import embed_text, embed_text_async
+from app.services.query_classifier import needs_query_rewrite, rewrite_counter
+from app.services.search_backend import linear_min_score, search_email_documents, search_email_documents_async
+from app.services.rank_fusion import fusion_mode, normalized_rrf_score
+from app.services.stage_timing import stage
 from app.services.text_normalization import to_simplified
 
 
@@ -30,9 +35,15 @@ class EmailFragment:
     email: models.Email
     snippet: str
     score: float
+    # 同一封邮件里其它命中的 chunk（ES collapse 的 inner_hits）
+    alternative_snippets: List[str] = field(default_factory=list)
 
 
-def _llm_query_rewrite(question: str, chat_history: Optional[str] = None, current_thread: Optional[str] = None) -> str:
+def _query_rewrite_prompts(
+        question: str,
+        chat_history: Optional[str] = None,
+        current_thread: Optional[str] = None,
+) -> Tuple[str, str]:
     system_prompt = f"""
         You are a Query Resolver for an email search engine.
         Your goal is to make the user's query standalone by resolving pronouns and relative time references based on the context, WITHOUT changing the original intent or key terms.
@@ -67,12 +78,26 @@ def _llm_query_rewrite(question: str, chat_history: Optional[str] = None, curren
     if current_thread:
         context.append(f"Current thread:\n{current_thread}")
     user_prompt = "\n\n".join(context + [f"User question: {question}"])
-    msg = chat_completion(system_prompt, user_prompt)
+    return system_prompt, user_prompt
+
+
+def _llm_query_rewrite(question: str, chat_history: Optional[str] = None, current_thread: Optional[str] = None) -> str:
+    msg = chat_completion(*_query_rewrite_prompts(question, chat_history, current_thread))
     return msg.get("content", question)
 
 
-def _llm_feature_extract(query: str) -> QueryFeatures:
-    current_time = datetime.now().isoformat()
+async def _llm_query_rewrite_async(
+        question: str,
+        chat_history: Optional[str] = None,
+        current_thread: Optional[str] = None,
+) -> str:
+    msg = await chat_completion_async(*_query_rewrite_prompts(question, chat_history, current_thread))
+    return msg.get("content", question)
+
+
+def _feature_extract_system_prompt() -> str:
+    # 精确到分钟，同一分钟内相同的问题可以命中 LLM 响应缓存
+    current_time = datetime.now().isoformat(timespec="minutes")
     system_prompt = f"""You extract structured search features from a user query about email.
 
         Return ONLY a raw JSON object string.
@@ -92,15 +117,30 @@ def _llm_feature_extract(query: str) -> QueryFeatures:
         - confidence is float 0-1.
         
         Current time: {current_time}"""
-    msg = chat_completion(system_prompt, query)
+    return system_prompt
+
+
+def _parse_features(msg: dict) -> QueryFeatures:
     raw = msg.get("content", "{}")
     try:
         data = json.loads(raw)
     except json.JSONDecodeError:
         return QueryFeatures()
+    return _features_from_json(data)
 
+
+def _llm_feature_extract(query: str) -> QueryFeatures:
+    return _parse_features(chat_completion(_feature_extract_system_prompt(), query))
+
+
+async def _llm_feature_extract_async(query: str) -> QueryFeatures:
+    return _parse_features(await chat_completion_async(_feature_extract_system_prompt(), query))
+
+
+def _features_from_json(data: dict) -> QueryFeatures:
     date_start = date_end = None
-    dr = data.get("date_range") or {}
+    # prompt 里叫 sent_date_range，兼容旧的 date_range
+    dr = data.get("sent_date_range") or data.get("date_range") or {}
     if dr.get("start"):
         date_start = parse_dt(dr["start"])
     if dr.get("end"):
@@ -116,13 +156,186 @@ def _llm_feature_extract(query: str) -> QueryFeatures:
     )
 
 
-def _chunk_snippet(text: str, max_len: int = 400) -> str:
+def _query_understand_prompts(
+        question: str,
+        chat_history: Optional[str] = None,
+        current_thread: Optional[str] = None,
+) -> Tuple[str, str]:
+    # 精确到分钟，同一分钟内相同的问题可以命中 LLM 响应缓存
+    current_time = datetime.now().isoformat(timespec="minutes")
+    system_prompt = f"""You are the query understanding step of an email search engine.
+
+        Return ONLY a raw JSON object with keys: rewritten_query, sent_date_range, people, keywords, recency_bias, confidence.
+
+        - rewritten_query: the user's question made standalone.
+          * REPLACE pronouns (he, she, it, they, that) with the names or entities they refer to from the context.
+          * REPLACE relative dates (yesterday, last Friday) with absolute dates if known; otherwise keep them as is.
+          * DO NOT rephrase the question type, DO NOT add keywords that were not implied, KEEP the original sentence structure.
+          * If there is nothing to resolve, return the question unchanged.
+
+        - sent_date_range is {{"start": "ISO8601", "end": "ISO8601"}} or null objects.
+          * IMPORTANT: This represents when the email was SENT/RECEIVED, not when the event happens.
+          * If the user queries a future event (e.g., "When is my next meeting?"), keep sent_date_range null (search all history) and set recency_bias to true.
+          * Only set dates if the user explicitly restricts the search window (e.g., "emails from last week").
+
+        - people, keywords are string arrays, extracted from the rewritten query.
+          * Include synonyms for keywords (e.g., if "meeting", also add "sync", "call").
+        - recency_bias is boolean.
+        - confidence is float 0-1.
+
+        Current time: {current_time}"""
+    context = []
+    if chat_history:
+        context.append(f"Chat history:\n{chat_history}")
+    if current_thread:
+        context.append(f"Current thread:\n{current_thread}")
+    user_prompt = "\n\n".join(context + [f"User question: {question}"])
+    return system_prompt, user_prompt
+
+
+def _parse_query_understand(msg: dict, question: str) -> Tuple[str, QueryFeatures]:
+    try:
+        data = json.loads(msg.get("content") or "{}")
+    except json.JSONDecodeError:
+        return question, QueryFeatures()
+    if not isinstance(data, dict):
+        return question, QueryFeatures()
+    rewritten = (data.get("rewritten_query") or "").strip() or question
+    return rewritten, _features_from_json(data)
+
+
+def _llm_query_understand(
+        question: str,
+        chat_history: Optional[str] = None,
+        current_thread: Optional[str] = None,
+) -> Tuple[str, QueryFeatures]:
+    """
+    一次 LLM 调用同时完成 query rewrite 与 feature extract（AI_SEARCH_QUERY_MODE=combined）。
+    返回 (rewritten_query, features)；解析失败时退回原问题与默认特征。
+    """
+    msg = chat_completion(
+        *_query_understand_prompts(question, chat_history, current_thread),
+        response_format={"type": "json_object"},
+    )
+    return _parse_query_understand(msg, question)
+
+
+async def _llm_query_understand_async(
+        question: str,
+        chat_history: Optional[str] = None,
+        current_thread: Optional[str] = None,
+) -> Tuple[str, QueryFeatures]:
+    msg = await chat_completion_async(
+        *_query_understand_prompts(question, chat_history, current_thread),
+        response_format={"type": "json_object"},
+    )
+    return _parse_query_understand(msg, question)
+
+
+def _understand_query(
+        question: str,
+        chat_history: Optional[str] = None,
+        current_thread: Optional[str] = None,
+) -> Tuple[str, QueryFeatures]:
+    # 快速通道：没有上下文或问题里没有指代/相对时间时，不做改写，只抽取特征
+    rewrite = needs_query_rewrite(question, chat_history=chat_history, current_thread=current_thread)
+    rewrite_counter.record(rewrite)
+    if not rewrite:
+        return question, _llm_feature_extract(question)
+    if settings.AI_SEARCH_QUERY_MODE == "two_step":
+        reformulated = _llm_query_rewrite(question, chat_history=chat_history, current_thread=current_thread)
+        return reformulated, _llm_feature_extract(reformulated)
+    return _llm_query_understand(question, chat_history=chat_history, current_thread=current_thread)
+
+
+async def _understand_query_async(
+        question: str,
+        chat_history: Optional[str] = None,
+        current_thread: Optional[str] = None,
+) -> Tuple[str, QueryFeatures]:
+    rewrite = needs_query_rewrite(question, chat_history=chat_history, current_thread=current_thread)
+    rewrite_counter.record(rewrite)
+    if not rewrite:
+        return question, await _llm_feature_extract_async(question)
+    if settings.AI_SEARCH_QUERY_MODE == "two_step":
+        reformulated = await _llm_query_rewrite_async(question, chat_history=chat_history, current_thread=current_thread)
+        return reformulated, await _llm_feature_extract_async(reformulated)
+    return await _llm_query_understand_async(question, chat_history=chat_history, current_thread=current_thread)
+
+
+def _matched_chunk_text(src: dict, email: models.Email) -> str:
+    """
+    命中的 chunk 原文：按索引时记录的偏移从 DB 里的 body_text 截取（保留原始简繁与格式），
+    旧文档没有偏移时退回 ES 里存的 chunk 文本。
+    """
+    start, end = src.get("chunk_start"), src.get("chunk_end")
+    body = email.body_text or ""
+    if start is not None and end is not None and 0 <= start < end <= len(body):
+        return body[start:end]
+    return src.get("body_text") or body or email.subject or ""
+
+
+def _hit_snippet(hit: dict, email: models.Email) -> str:
+    """
+    优先用 ES highlight 给出的最相关片段（高亮作用于简体化后的 body_text），能在原文 chunk 中定位时换回原文写法；
+    没有 highlight 时退回 chunk 开头。
+    """
+    src = hit.get("_source") or {}
+    chunk = _matched_chunk_text(src, email)
+    fragment = ((hit.get("highlight") or {}).get("body_text") or [None])[0]
+    if not fragment:
+        return _chunk_snippet(chunk)
+    fragment = fragment.strip()
+    # 简繁转换大多逐字对应，长度一致时可以按位置映射回原文
+    simplified = to_simplified(chunk)
+    pos = simplified.find(fragment) if len(simplified) == len(chunk) else -1
+    if pos >= 0:
+        fragment = chunk[pos:pos + len(fragment)]
+    return _chunk_snippet(fragment)
+
+
+def _alternative_snippets(hit: dict, email: models.Email, snippet: str) -> List[str]:
+    inner = ((hit.get("inner_hits") or {}).get("chunks") or {}).get("hits", {}).get("hits", [])
+    main_chunk = hit["_source"].get("chunk_id")
+    snippets: List[str] = []
+    for inner_hit in inner:
+        src = inner_hit.get("_source") or {}
+        if src.get("chunk_id") == main_chunk:
+            continue
+        alt = _hit_snippet(inner_hit, email)
+        if alt and alt != snippet and alt not in snippets:
+            snippets.append(alt)
+    return snippets[:settings.SEARCH_ALTERNATIVE_SNIPPETS]
+
+
+def _chunk_snippet(text: str, max_len: Optional[int] = None) -> str:
+    max_len = max_len or settings.SEARCH_SNIPPET_CHARS
     text = text.strip()
     if len(text) <= max_len:
         return text
     return text[:max_len] + "..."
 
 
+def _relevance(hit: dict) -> float:
+    """
+    检索分数：linear 模式为 ES 原始分数；RRF 模式换算成「某一路第 1 名 = 1.0」，与下面的 rerank 加权项同量级。
+    """
+    score = float(hit.get("_score") or 0.0)
+    if fusion_mode() == "linear":
+        return score
+    return normalized_rrf_score(score)
+
+
+def _min_relevance() -> float:
+    # linear 分数的量级取决于后端（ES 原始分数 / 本地 BM25 + 向量加权），阈值由后端给出
+    return linear_min_score() if fusion_mode() == "linear" else settings.SEARCH_RRF_MIN_SCORE
+
+
+def _search_size(max_results: int) -> int:
+    # 按 email_id 折叠后每条命中就是一封不同的邮件，不需要再多取；未折叠时多取一些 chunk 供去重与 rerank
+    return max_results if settings.SEARCH_COLLAPSE else max_results * 3
+
+
 def ai_search(
         db: Session,
         user_id: str,
@@ -133,34 +346,80 @@ def ai_search(
 ) -> List[EmailFragment]:
     """
     使用 LLM + Elasticsearch 实现 Shortwave 风格 AI Search：
-    1) Query rewrite
-    2) Feature extract
-    3) ES hybrid search (filter + match + knn)
-    4) 简单 heuristic rerank
+    1) Query rewrite + feature extract（默认合并为一次 LLM 调用，AI_SEARCH_QUERY_MODE=two_step 时分两次）
+    2) ES hybrid search (filter + match + knn)
+    3) 简单 heuristic rerank
     """
-    # 1. Query rewrite
-    reformulated = _llm_query_rewrite(
-        question,
-        chat_history=chat_history,
-        current_thread=current_thread_text,
-    )
-    # reformulated = question
-    # 2. Feature extraction
-    features = _llm_feature_extract(reformulated)
+    # 1/2. Query rewrite + feature extraction
+    with stage("query_understand"):
+        reformulated, features = _understand_query(
+            question,
+            chat_history=chat_history,
+            current_thread=current_thread_text,
+        )
 
     # 3. Embed query for knn（keywords 仅用于 filter，不混入向量/文本查询）
-    query_vec = embed_text(reformulated)
+    with stage("embed_query"):
+        query_vec = embed_text(reformulated)
 
     # 4. 调用 ES 搜索（keywords 放在 filter 阶段）
-    hits = search_email_documents(
-        user_id=user_id,
-        query_text=reformulated,
-        query_embedding=query_vec,
-        date_start=features.date_start,
-        date_end=features.date_end,
-        keywords=features.keywords,
-        size=max_results * 3,  # 取多一点供 rerank
-    )
+    with stage("search"):
+        hits = search_email_documents(
+            user_id=user_id,
+            query_text=reformulated,
+            query_embedding=query_vec,
+            date_start=features.date_start,
+            date_end=features.date_end,
+            keywords=features.keywords,
+            size=_search_size(max_results),
+            collapse=settings.SEARCH_COLLAPSE,
+        )
+    with stage("rerank"):
+        return _rerank_hits(db, user_id, hits, features, max_results)
+
+
+async def ai_search_async(
+        db: Session,
+        user_id: str,
+        question: str,
+        current_thread_text: Optional[str] = None,
+        chat_history: Optional[str] = None,
+        max_results: int = 20,
+) -> List[EmailFragment]:
+    """
+    ai_search 的 async 版本：LLM / embedding / ES 走异步客户端，
+    只有最后的 DB 读取与 rerank 放到线程里执行。
+    """
+    with stage("query_understand"):
+        reformulated, features = await _understand_query_async(
+            question,
+            chat_history=chat_history,
+            current_thread=current_thread_text,
+        )
+    with stage("embed_query"):
+        query_vec = await embed_text_async(reformulated)
+    with stage("search"):
+        hits = await search_email_documents_async(
+            user_id=user_id,
+            query_text=reformulated,
+            query_embedding=query_vec,
+            date_start=features.date_start,
+            date_end=features.date_end,
+            keywords=features.keywords,
+            size=_search_size(max_results),
+            collapse=settings.SEARCH_COLLAPSE,
+        )
+    with stage("rerank"):
+        return await asyncio.to_thread(_rerank_hits, db, user_id, hits, features, max_results)
+
+
+def _rerank_hits(
+        db: Session,
+        user_id: str,
+        hits: List[dict],
+        features: QueryFeatures,
+        max_results: int,
+) -> List[EmailFragment]:
     if not hits:
         return []
 
@@ -168,8 +427,20 @@ def ai_search(
     now = datetime.utcnow()
     fragments: List[EmailFragment] = []
 
+    # 每封邮件只保留得分最高的一条（未折叠时同一封邮件可能有多个 chunk 命中），
+    # 低相关的命中不参与 ORM 装配
+    # Skip low-relevance results to reduce LLM context noise and provenance storage.
+    min_score = _min_relevance()
+    best_hits: Dict[int, dict] = {}
+    for hit in hits:
+        if _relevance(hit) < min_score:
+            continue
+        best_hits.setdefault(hit["_source"]["email_id"], hit)
+    if not best_hits:
+        return []
+
     # 预取所有涉及的 email_id
-    email_ids = [hit["_source"]["email_id"] for hit in hits]
+    email_ids = list(best_hits)
     emails = (
         db.query(models.Email)
         .filter(models.Email.user_id == user_id, models.Email.id.in_(email_ids))
@@ -177,18 +448,13 @@ def ai_search(
     )
     id2email = {e.id: e for e in emails}
 
-    for hit in hits:
+    for email_id, hit in best_hits.items():
         src = hit["_source"]
-        es_score = float(hit.get("_score") or 0.0)
-        # Skip low-relevance results to reduce LLM context noise and provenance storage.
-        if es_score < 50:
-            continue
-        email_id = src["email_id"]
         e = id2email.get(email_id)
         if not e:
             continue
 
-        score = es_score
+        score = _relevance(hit)
 
         # recency bias
         if features.recency_bias:
@@ -203,9 +469,10 @@ def ai_search(
         if e.is_promotion:
             score -= 0.2
 
-        snippet_source = src.get("body_text") or e.body_text or e.subject or ""
-        snippet = _chunk_snippet(snippet_source)
-        fragments.append(EmailFragment(email=e, snippet=snippet, score=score))
+        snippet = _hit_snippet(hit, e)
+        fragments.append(
+            EmailFragment(email=e, snippet=snippet, score=score, alternative_snippets=_alternative_snippets(hit, e, snippet))
+        )
 
     fragments.sort(key=lambda f: f.score, reverse=True)
     return fragments[:max_results]
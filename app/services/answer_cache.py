@@ -0,0 +1,141 @@
+"""
+Semantic answer cache for /ai/ask.
+- Per-user, in-process. A question hits when a cached entry has cosine similarity >= ANSWER_CACHE_SIMILARITY
+  and the same context hash (chat history + current thread + date) and mailbox version.
+- Ingesting new mail bumps the user's MailboxVersion, so stale answers stop matching.
+- Entries expire after ANSWER_CACHE_TTL_SECONDS; each user keeps at most ANSWER_CACHE_MAX_ENTRIES_PER_USER (LRU).
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.schemas import SourceFragment
+
+
+@dataclass
+class _CachedAnswer:
+    vector: np.ndarray
+    context_hash: str
+    mailbox_version: int
+    answer: str
+    sources: List[SourceFragment]
+    created_at: float
+
+
+def context_hash(chat_history: Optional[str], current_thread_id: Optional[str]) -> str:
+    # 日期也算进上下文："今天有什么事" 的答案不应跨天命中
+    today = datetime.utcnow().date().isoformat()
+    raw = f"{today}\x00{current_thread_id or ''}\x00{chat_history or ''}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _normalize(vector: List[float]) -> Optional[np.ndarray]:
+    vec = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    if norm == 0.0:
+        # embedding 失败时返回的是零向量，不参与缓存
+        return None
+    return vec / norm
+
+
+class SemanticAnswerCache:
+    def __init__(self, max_entries_per_user: int, ttl_seconds: float, similarity_threshold: float):
+        self.max_entries_per_user = max_entries_per_user
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._entries: Dict[str, "OrderedDict[int, _CachedAnswer]"] = {}
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def lookup(
+        self,
+        user_id: str,
+        question_vector: List[float],
+        ctx_hash: str,
+        mailbox_version: int,
+    ) -> Optional[Tuple[str, List[SourceFragment]]]:
+        vec = _normalize(question_vector)
+        now = time.time()
+        with self._lock:
+            entries = self._entries.get(user_id)
+            best_id, best_score = None, self.similarity_threshold
+            if entries and vec is not None:
+                for entry_id in list(entries):
+                    entry = entries[entry_id]
+                    if now - entry.created_at > self.ttl_seconds or entry.mailbox_version != mailbox_version:
+                        # 过期或邮箱已更新的条目顺手清掉
+                        del entries[entry_id]
+                        self.expirations += 1
+                        continue
+                    if entry.context_hash != ctx_hash or entry.vector.shape != vec.shape:
+                        continue
+                    score = float(np.dot(entry.vector, vec))
+                    if score >= best_score:
+                        best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            entries.move_to_end(best_id)
+            self.hits += 1
+            hit = entries[best_id]
+            return hit.answer, list(hit.sources)
+
+    def store(
+        self,
+        user_id: str,
+        question_vector: List[float],
+        ctx_hash: str,
+        mailbox_version: int,
+        answer: str,
+        sources: List[SourceFragment],
+    ) -> None:
+        vec = _normalize(question_vector)
+        if vec is None:
+            return
+        with self._lock:
+            entries = self._entries.setdefault(user_id, OrderedDict())
+            self._next_id += 1
+            entries[self._next_id] = _CachedAnswer(
+                vector=vec,
+                context_hash=ctx_hash,
+                mailbox_version=mailbox_version,
+                answer=answer,
+                sources=list(sources),
+                created_at=time.time(),
+            )
+            while len(entries) > self.max_entries_per_user:
+                entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "users": len(self._entries),
+                "entries": sum(len(e) for e in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+answer_cache = SemanticAnswerCache(
+    max_entries_per_user=settings.ANSWER_CACHE_MAX_ENTRIES_PER_USER,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY,
+)
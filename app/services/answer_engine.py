@@ -1,42 +1,108 @@
-from typing import List, Tuple, Optional
-from sqlalchemy.orm import Session
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, AsyncIterator, Dict, List, Tuple, Optional
+from sqlalchemy.orm import Session, sessionmaker
 
+from app.config import settings
 from app.schemas import SourceFragment
-from app.tools.base import ToolContext
-from app.services.tool_selector import pick_tools, instantiate_tools
-from app.services.llm_provider import chat_completion
+from app.tools.base import BaseTool, ToolContext, ToolResult
+from app.services.tool_selector import pick_tools, pick_tools_async, instantiate_tools, tool_timeout
+from app.services.llm_provider import chat_completion, chat_completion_async, chat_completion_stream_async
+from app.services.answer_cache import answer_cache, context_hash
+from app.services.embeddings import embed_text, embed_text_async
+from app.services.mailbox_version import get_mailbox_version
 from app.services.ai_search import EmailFragment
+from app.services.stage_timing import stage
 from app.db import models
 
+# 进程内共享的工具线程池；超时的工具不会阻塞请求（线程在后台跑完后自行释放 DB 会话）
+_tool_executor = ThreadPoolExecutor(max_workers=settings.TOOL_MAX_WORKERS, thread_name_prefix="ai-tool")
+# 在跑的工具线程数（包括已超时、仍未结束的）；占满时新工具直接降级为空结果，
+# 而不是排在卡住的线程后面把每个请求都拖到超时
+_tool_slots = threading.BoundedSemaphore(settings.TOOL_MAX_WORKERS)
 
-def answer_question(
-        db: Session,
-        user_id: str,
-        question: str,
-        current_thread_id: Optional[str] = None,
-        chat_id: str = "default",
-        chat_history: Optional[str] = None,
-) -> Tuple[str, List[SourceFragment]]:
+
+def _submit_tool(fn, *args) -> Optional[Future]:
+    if not _tool_slots.acquire(blocking=False):
+        return None
+    # copy_context 让工具线程继承请求上下文中的 contextvars
+    run_ctx = contextvars.copy_context()
+    future = _tool_executor.submit(run_ctx.run, fn, *args)
+    future.add_done_callback(lambda _: _tool_slots.release())
+    return future
+
+
+def _shed_result(name: str) -> ToolResult:
+    print(f"⚠️ tool pool saturated ({settings.TOOL_MAX_WORKERS} in flight), skipping tool {name}")
+    return ToolResult(name=name, content="", metadata={"shed": True})
+
+
+def _run_tool_with_own_session(session_factory: sessionmaker, name: str, ctx: ToolContext) -> Optional[ToolResult]:
+    # Session 不是线程安全的，每个工具在自己的线程里用独立会话
+    tool_db = session_factory()
+    try:
+        tools = instantiate_tools(tool_db, [name])
+        if not tools:
+            return None
+        return tools[0].run(ctx)
+    finally:
+        tool_db.close()
+
+
+def run_tools_parallel(db: Session, tool_names: List[str], ctx: ToolContext) -> List[ToolResult]:
     """
-    High-level pipeline:
-    1) Tool selection (LLM)
-    2) Run tools in parallel (here sequential for simplicity)
-    3) Call LLM once with all context to generate answer
+    并发执行选中的工具，总耗时取决于最慢的工具而不是各工具之和。
+    - 每个工具使用独立的 DB 会话（与 db 绑定同一个 engine）
+    - 每个工具有自己的超时；超时或异常时返回空结果，其余工具的结果照常使用
+    - 工具线程池占满（TOOL_MAX_WORKERS 个工具在跑）时，该工具直接返回空结果
     """
-    ctx = ToolContext(
-        user_id=user_id,
-        question=question,
-        current_thread_id=current_thread_id,
-        chat_id=chat_id,
-        chat_history=chat_history,
-    )
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())
+    start = time.monotonic()
+    futures = []
+    for name in dict.fromkeys(tool_names):
+        futures.append((name, _submit_tool(_run_tool_with_own_session, session_factory, name, ctx)))
+
+    results: List[ToolResult] = []
+    for name, future in futures:
+        if future is None:
+            results.append(_shed_result(name))
+            continue
+        timeout = tool_timeout(name, settings.TOOL_TIMEOUT_SECONDS)
+        remaining = max(0.0, start + timeout - time.monotonic())
+        try:
+            result = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            print(f"⚠️ tool {name} timed out after {timeout:.1f}s, using empty result")
+            result = ToolResult(name=name, content="", metadata={"timed_out": True})
+        except Exception as e:
+            print(f"⚠️ tool {name} failed: {type(e).__name__}: {e}")
+            result = ToolResult(name=name, content="", metadata={"error": f"{type(e).__name__}: {e}"})
+        if result is not None:
+            results.append(result)
+    return results
 
-    tool_names = pick_tools(ctx)
-    tools = instantiate_tools(db, tool_names)
 
-    # Run tools (sequential)
-    tool_results = [t.run(ctx) for t in tools]
+def _cache_answer(
+        user_id: str,
+        cache_key,
+        answer: str,
+        source_fragments: List[SourceFragment],
+        tool_results: List[ToolResult],
+) -> None:
+    """
+    写入答案缓存。有工具超时、失败或被降级跳过时答案只基于部分结果，不缓存，避免在 TTL 内把残缺答案返回给相似问题。
+    """
+    if cache_key is None or not answer:
+        return
+    if any(tr.metadata.get(k) for tr in tool_results for k in ("timed_out", "error", "shed")):
+        return
+    answer_cache.store(user_id, *cache_key, answer=answer, sources=source_fragments)
 
+
+def _collect_sources(tool_results: List[ToolResult]) -> List[SourceFragment]:
     # Collect AI Search matches for source citations if any
     source_fragments: List[SourceFragment] = []
     for tr in tool_results:
@@ -52,7 +118,15 @@ def answer_question(
                     sender=m.get("sender"),
                 )
                 source_fragments.append(fragment)
+    return source_fragments
+
 
+def _answer_prompts(
+        question: str,
+        chat_id: str,
+        chat_history: Optional[str],
+        tool_results: List[ToolResult],
+) -> Tuple[str, str]:
     # Build mega prompt
     tool_context_blocks = []
     for tr in tool_results:
@@ -75,12 +149,212 @@ def answer_question(
         f"--- Tool context ---\n{context_text}\n\n"
         "Now answer the question. If you reference specific emails, summarize them in your own words."
     )
+    return system_prompt, user_prompt
+
 
-    msg = chat_completion(system_prompt, user_prompt)
+def answer_question(
+        db: Session,
+        user_id: str,
+        question: str,
+        current_thread_id: Optional[str] = None,
+        chat_id: str = "default",
+        chat_history: Optional[str] = None,
+) -> Tuple[str, List[SourceFragment]]:
+    """
+    High-level pipeline:
+    0) Semantic answer cache (question embedding + context hash + mailbox version)
+    1) Tool selection (LLM)
+    2) Run tools in parallel (thread pool, one DB session and timeout per tool)
+    3) Call LLM once with all context to generate answer
+    """
+    ctx = ToolContext(
+        user_id=user_id,
+        question=question,
+        current_thread_id=current_thread_id,
+        chat_id=chat_id,
+        chat_history=chat_history,
+    )
+
+    cache_key = None
+    if settings.ANSWER_CACHE_ENABLED:
+        with stage("answer_cache"):
+            cache_key = (
+                embed_text(question),
+                context_hash(chat_history, current_thread_id),
+                get_mailbox_version(db, user_id),
+            )
+            cached = answer_cache.lookup(user_id, *cache_key)
+        if cached is not None:
+            return cached
+
+    with stage("pick_tools"):
+        tool_names = pick_tools(ctx)
+
+    # Run tools (parallel)
+    with stage("tools"):
+        tool_results = run_tools_parallel(db, tool_names, ctx)
+    source_fragments = _collect_sources(tool_results)
+
+    with stage("answer_completion"):
+        # 最终回答不走 LLM 响应缓存：答案缓存（answer_cache）按邮箱版本失效，LLM 缓存不会
+        msg = chat_completion(*_answer_prompts(question, chat_id, chat_history, tool_results), cache=False)
     answer = msg.get("content", "")
 
     # For response sources: re-run AI search with small k to show top citations
     # from app.services.ai_search import ai_search as ai_search_func
     # fragments = ai_search_func(db, user_id, question, max_results=5)
 
+    _cache_answer(user_id, cache_key, answer, source_fragments, tool_results)
+
     return answer, source_fragments
+
+
+async def _run_tool_async(session_factory: sessionmaker, name: str, ctx: ToolContext) -> Optional[ToolResult]:
+    tool_db = session_factory()
+    tools = instantiate_tools(tool_db, [name])
+    if not tools:
+        tool_db.close()
+        return None
+    timeout = tool_timeout(name, settings.TOOL_TIMEOUT_SECONDS)
+    if type(tools[0]).arun is BaseTool.arun:
+        # 只有同步实现的工具走有上限的工具线程池，不占用默认 executor（asyncio.to_thread 等共用它）
+        future = _submit_tool(tools[0].run, ctx)
+        if future is None:
+            tool_db.close()
+            return _shed_result(name)
+        task = asyncio.wrap_future(future)
+    else:
+        task = asyncio.ensure_future(tools[0].arun(ctx))
+    # 超时不取消任务：工具可能还在线程里使用会话，等它自己结束后再关闭会话
+    task.add_done_callback(lambda _: tool_db.close())
+    done, _ = await asyncio.wait({task}, timeout=timeout)
+    if not done:
+        print(f"⚠️ tool {name} timed out after {timeout:.1f}s, using empty result")
+        return ToolResult(name=name, content="", metadata={"timed_out": True})
+    try:
+        return task.result()
+    except Exception as e:
+        print(f"⚠️ tool {name} failed: {type(e).__name__}: {e}")
+        return ToolResult(name=name, content="", metadata={"error": f"{type(e).__name__}: {e}"})
+
+
+async def run_tools_async(db: Session, tool_names: List[str], ctx: ToolContext) -> List[ToolResult]:
+    """
+    run_tools_parallel 的 async 版本：工具在同一个事件循环里并发，每个工具独立 DB 会话与超时。
+    有 async 实现的工具（EmailHistory）直接在事件循环上跑；同步工具共享工具线程池的上限与降级策略。
+    """
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())
+    results = await asyncio.gather(
+        *(_run_tool_async(session_factory, name, ctx) for name in dict.fromkeys(tool_names))
+    )
+    return [r for r in results if r is not None]
+
+
+async def _retrieve_async(db: Session, ctx: ToolContext):
+    """
+    答案缓存查询 + 工具选择 + 并发执行工具。
+    返回 (cache_key, cached, tool_names, tool_results)；命中缓存时 cached 为 (answer, sources)。
+    """
+    cache_key = None
+    if settings.ANSWER_CACHE_ENABLED:
+        with stage("answer_cache"):
+            cache_key = (
+                await embed_text_async(ctx.question),
+                context_hash(ctx.chat_history, ctx.current_thread_id),
+                await asyncio.to_thread(get_mailbox_version, db, ctx.user_id),
+            )
+            cached = answer_cache.lookup(ctx.user_id, *cache_key)
+        if cached is not None:
+            return cache_key, cached, [], []
+
+    with stage("pick_tools"):
+        tool_names = await pick_tools_async(ctx)
+    with stage("tools"):
+        tool_results = await run_tools_async(db, tool_names, ctx)
+    return cache_key, None, tool_names, tool_results
+
+
+async def answer_question_async(
+        db: Session,
+        user_id: str,
+        question: str,
+        current_thread_id: Optional[str] = None,
+        chat_id: str = "default",
+        chat_history: Optional[str] = None,
+) -> Tuple[str, List[SourceFragment]]:
+    """
+    answer_question 的 async 版本：LLM / embedding / ES 都走异步客户端，
+    等待上游时不占用线程；同步的 DB 操作放到线程里执行。
+    """
+    ctx = ToolContext(
+        user_id=user_id,
+        question=question,
+        current_thread_id=current_thread_id,
+        chat_id=chat_id,
+        chat_history=chat_history,
+    )
+
+    cache_key, cached, _, tool_results = await _retrieve_async(db, ctx)
+    if cached is not None:
+        return cached
+    source_fragments = _collect_sources(tool_results)
+
+    with stage("answer_completion"):
+        msg = await chat_completion_async(*_answer_prompts(question, chat_id, chat_history, tool_results), cache=False)
+    answer = msg.get("content", "")
+
+    _cache_answer(user_id, cache_key, answer, source_fragments, tool_results)
+
+    return answer, source_fragments
+
+
+async def answer_question_stream(
+        db: Session,
+        user_id: str,
+        question: str,
+        current_thread_id: Optional[str] = None,
+        chat_id: str = "default",
+        chat_history: Optional[str] = None,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    流式问答，依次 yield (event, data)：
+    - ("tools", {"tools": [...], "cached": bool})   工具选择完成
+    - ("sources", {"sources": [...]})               检索完成，引用片段
+    - ("token", {"text": "..."})                    回答的增量文本
+    - ("done", {"answer": "...", "sources": [...]}) 完整回答
+    """
+    ctx = ToolContext(
+        user_id=user_id,
+        question=question,
+        current_thread_id=current_thread_id,
+        chat_id=chat_id,
+        chat_history=chat_history,
+    )
+
+    cache_key, cached, tool_names, tool_results = await _retrieve_async(db, ctx)
+    if cached is not None:
+        answer, source_fragments = cached
+        sources_data = [f.model_dump() for f in source_fragments]
+        yield "tools", {"tools": [], "cached": True}
+        yield "sources", {"sources": sources_data}
+        yield "token", {"text": answer}
+        yield "done", {"answer": answer, "sources": sources_data}
+        return
+
+    source_fragments = _collect_sources(tool_results)
+    sources_data = [f.model_dump() for f in source_fragments]
+    yield "tools", {"tools": [tr.name for tr in tool_results] or tool_names, "cached": False}
+    yield "sources", {"sources": sources_data}
+
+    parts: List[str] = []
+    with stage("answer_completion"):
+        async for delta in chat_completion_stream_async(
+                *_answer_prompts(question, chat_id, chat_history, tool_results), cache=False
+        ):
+            parts.append(delta)
+            yield "token", {"text": delta}
+    answer = "".join(parts)
+
+    _cache_answer(user_id, cache_key, answer, source_fragments, tool_results)
+
+    yield "done", {"answer": answer, "sources": sources_data}
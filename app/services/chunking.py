@@ -0,0 +1,343 @@
+"""
+Token-aware chunking of email bodies for embedding and snippet extraction.
+- Quoted reply history ("On ... wrote:", "-----Original Message-----", Outlook "From:/Sent:" headers,
+  "> " lines) and signatures ("-- " near the end of the body, "Sent from my ...") are dropped before chunking.
+  Forwarded messages are kept: their content is usually what the user is asking about. The header block after
+  a forward marker ("Forwarded message", "Begin forwarded message:", "转发的邮件") is not a reply header, and
+  for FW:/Fwd:/转发: subjects neither is the first Outlook header block / "Original Message" / "原始邮件" separator.
+- The body is split on paragraph, then sentence boundaries (CJK punctuation included) and packed
+  greedily up to CHUNK_MAX_TOKENS; consecutive chunks share up to CHUNK_OVERLAP_TOKENS of trailing sentences.
+- Within a thread, paragraphs already present in earlier messages (quoted without any marker,
+  e.g. pasted or re-sent text) are dropped too, see thread_fingerprints().
+- Token counts use tiktoken when it is installed, otherwise embeddings.estimate_tokens.
+- Every chunk carries [start, end) character offsets into the original body, so search results
+  can show the exact matching chunk from the stored email.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.services.embeddings import estimate_tokens
+from app.services.text_normalization import to_simplified
+
+try:
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # 未安装 tiktoken 或编码表无法加载时退回估算
+    _ENCODING = None
+
+
+@dataclass
+class Chunk:
+    text: str
+    start: int
+    end: int
+    tokens: int
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+# 这些行及其后的内容都视为引用的历史邮件
+_REPLY_HEADER_PATTERNS = [
+    re.compile(r"^\s*On\b.{0,300}\bwrote:\s*$", re.IGNORECASE),
+    re.compile(r"^\s*在.{0,300}[写寫]道[:：]\s*$"),
+    re.compile(r"^\s*-{2,}\s*(Original Message|原始邮件|原始郵件)\s*-{2,}\s*$", re.IGNORECASE),
+    re.compile(r"^\s*_{10,}\s*$"),
+]
+# 这两种分隔行在转发邮件（主题为 FW: / 转发:）里引出的是被转发的邮件
+_FORWARD_SEPARATORS = _REPLY_HEADER_PATTERNS[2:]
+# Outlook 的回复头：From: 行后几行内出现 Sent: / Date: 才算（单独的 "From:" 可能是正文）
+_OUTLOOK_FROM = re.compile(r"^\s*(From|发件人|寄件者|寄件人)\s*[:：]", re.IGNORECASE)
+_OUTLOOK_SENT = re.compile(r"^\s*(Sent|Date|发送时间|傳送時間|寄件日期|日期)\s*[:：]", re.IGNORECASE)
+# 转发标记：Gmail "---------- Forwarded message ---------"、Apple Mail "Begin forwarded message:"、中文客户端
+_FORWARD_MARKERS = [
+    re.compile(r"^\s*-*\s*Forwarded message\s*-*\s*$", re.IGNORECASE),
+    re.compile(r"^\s*Begin forwarded message\s*:?\s*$", re.IGNORECASE),
+    re.compile(r"^\s*-*\s*(转发的邮件|轉寄的郵件|转发邮件|轉發郵件)\s*-*\s*$"),
+]
+_FORWARD_SUBJECT = re.compile(r"^\s*(fwd?|转发|轉發|转寄|轉寄)\s*[:：]", re.IGNORECASE)
+# 转发头块里的字段行（被转发邮件的 From / Date / Subject / To ...）
+_HEADER_FIELD = re.compile(
+    r"^\s*(From|To|Cc|Bcc|Subject|Date|Sent|Reply-To|发件人|收件人|抄送|主题|主題|日期|时间|发送时间|傳送時間"
+    r"|寄件者|寄件人|收件者|副本|寄件日期)\s*[:：]",
+    re.IGNORECASE,
+)
+# 签名：RFC 3676 的 "-- " 分隔行（只在正文末尾才算，见 _is_signature_tail）与常见移动端签名
+_SIGNATURE_DELIMITER = re.compile(r"^--\s?$")
+_SIGNATURE_MAX_LINES = 8
+_SIGNATURE_PATTERNS = [
+    re.compile(r"^\s*(Sent from my|Sent from Mail for|Get Outlook for)\b", re.IGNORECASE),
+    re.compile(r"^\s*[发發]自我的"),
+]
+_QUOTED_LINE = re.compile(r"^\s*>")
+# 第二行才出现 "wrote:" 的 Gmail 折行回复头
+_WROTE_TAIL = re.compile(r"\bwrote:\s*$", re.IGNORECASE)
+_ON_HEAD = re.compile(r"^\s*On\b", re.IGNORECASE)
+
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+# 英文句末标点后需跟空白（避免切开 3.14 / URL），中文标点直接断句；单个换行也视为句界
+_SENTENCE_END = re.compile(r"[.!?;]+[\"')\]]*(?=\s)|[。！？；…]+[”’」』）)]*|\n")
+
+
+def _line_spans(text: str) -> List[Tuple[int, int]]:
+    spans = []
+    pos = 0
+    for line in text.splitlines(keepends=True):
+        spans.append((pos, pos + len(line.rstrip("\r\n"))))
+        pos += len(line)
+    return spans
+
+
+def _is_outlook_header(text: str, lines: List[Tuple[int, int]], i: int) -> bool:
+    if not _OUTLOOK_FROM.match(text[lines[i][0]:lines[i][1]]):
+        return False
+    return any(_OUTLOOK_SENT.match(text[s:e]) for s, e in lines[i + 1:i + 4])
+
+
+def _is_reply_header(text: str, lines: List[Tuple[int, int]], i: int) -> bool:
+    line = text[lines[i][0]:lines[i][1]]
+    if any(p.match(line) for p in _REPLY_HEADER_PATTERNS):
+        return True
+    if _is_outlook_header(text, lines, i):
+        return True
+    if _ON_HEAD.match(line) and i + 1 < len(lines) and _WROTE_TAIL.search(text[lines[i + 1][0]:lines[i + 1][1]]):
+        return True
+    return False
+
+
+def _is_signature_tail(text: str, lines: List[Tuple[int, int]], i: int) -> bool:
+    # "--" 之后到正文结束（或引用的历史邮件开始）不超过几行时才是签名；否则多半是 markdown / 命令行输出
+    count = 0
+    for j in range(i + 1, len(lines)):
+        line = text[lines[j][0]:lines[j][1]]
+        if _QUOTED_LINE.match(line) or _is_reply_header(text, lines, j):
+            break
+        if line.strip():
+            count += 1
+            if count > _SIGNATURE_MAX_LINES:
+                return False
+    return True
+
+
+def _is_cut_line(text: str, lines: List[Tuple[int, int]], i: int) -> bool:
+    line = text[lines[i][0]:lines[i][1]]
+    if any(p.match(line) for p in _SIGNATURE_PATTERNS):
+        return True
+    if _SIGNATURE_DELIMITER.match(line):
+        return _is_signature_tail(text, lines, i)
+    return _is_reply_header(text, lines, i)
+
+
+def _starts_forward(text: str, lines: List[Tuple[int, int]], i: int, forward_subject: bool) -> bool:
+    line = text[lines[i][0]:lines[i][1]]
+    if any(p.match(line) for p in _FORWARD_MARKERS):
+        return True
+    # 转发主题下的第一个 Outlook 头块 / Original Message 分隔行是被转发的邮件，不是回复历史
+    return forward_subject and (
+        any(p.match(line) for p in _FORWARD_SEPARATORS) or _is_outlook_header(text, lines, i)
+    )
+
+
+def content_segments(text: str, subject: Optional[str] = None) -> List[Tuple[int, int]]:
+    """
+    去掉引用的历史邮件和签名后剩下的正文区间（原文中的 [start, end) 偏移）。
+    "> " 引用行会把正文分成多段；全部被判为引用时退回整封正文。
+    转发标记之后的头块（From: / Date: / Subject: ...）连同被转发的正文一起保留；subject 用来识别 FW: 邮件。
+    """
+    lines = _line_spans(text)
+    segments: List[Tuple[int, int]] = []
+    seg_start: Optional[int] = None
+    seg_end = 0
+    forward_subject = bool(subject and _FORWARD_SUBJECT.match(subject))
+    # in_forward_header：处于转发头块中，头块以字段行之后的第一个空行结束
+    in_forward_header = False
+    header_seen = False
+    for i, (s, e) in enumerate(lines):
+        line = text[s:e]
+        if in_forward_header:
+            if not line.strip():
+                in_forward_header = not header_seen
+            elif _HEADER_FIELD.match(line) or any(p.match(line) for p in _FORWARD_SEPARATORS):
+                header_seen = True
+            elif header_seen:
+                # 头块后没有空行直接接正文
+                in_forward_header = False
+        elif _starts_forward(text, lines, i, forward_subject):
+            in_forward_header, header_seen = True, bool(_HEADER_FIELD.match(line))
+            # 只有第一个转发头块靠主题识别，再往下的 Original Message 仍是被转发邮件自己的回复历史
+            forward_subject = False
+        if not in_forward_header and _is_cut_line(text, lines, i):
+            break
+        if _QUOTED_LINE.match(line):
+            if seg_start is not None:
+                segments.append((seg_start, seg_end))
+                seg_start = None
+            continue
+        if text[s:e].strip():
+            if seg_start is None:
+                seg_start = s
+            seg_end = e
+    if seg_start is not None:
+        segments.append((seg_start, seg_end))
+    if not segments and text.strip():
+        return [_strip_span(text, 0, len(text))]
+    return segments
+
+
+def _strip_span(text: str, start: int, end: int) -> Tuple[int, int]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _split_spans(text: str, start: int, end: int, pattern: re.Pattern) -> List[Tuple[int, int]]:
+    spans = []
+    pos = start
+    for m in pattern.finditer(text, start, end):
+        spans.append(_strip_span(text, pos, m.end()))
+        pos = m.end()
+    spans.append(_strip_span(text, pos, end))
+    return [(s, e) for s, e in spans if e > s]
+
+
+# 太短的段落（"Thanks,"、"Hi Bob," 之类）不参与线程去重
+_MIN_FINGERPRINT_CHARS = 20
+_QUOTE_PREFIX = re.compile(r"^[ \t]*(>[ \t]?)+", re.MULTILINE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _fingerprint(paragraph: str) -> Optional[str]:
+    normalized = _WHITESPACE.sub(" ", to_simplified(paragraph)).strip().lower()
+    if len(normalized) < _MIN_FINGERPRINT_CHARS:
+        return None
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def thread_fingerprints(bodies: Iterable[str]) -> Set[str]:
+    """
+    同一线程中较早邮件的段落指纹（含它们自己引用的部分，去掉 "> " 前缀后按段落计算）。
+    传给 chunk_email_body(seen=...) 后，新邮件里重复出现的段落不再切分、embedding 和索引。
+    """
+    seen: Set[str] = set()
+    for body in bodies:
+        if not body:
+            continue
+        unquoted = _QUOTE_PREFIX.sub("", body)
+        for s, e in _split_spans(unquoted, 0, len(unquoted), _PARAGRAPH_BREAK):
+            fp = _fingerprint(unquoted[s:e])
+            if fp:
+                seen.add(fp)
+    return seen
+
+
+def _drop_seen(text: str, segments: List[Tuple[int, int]], seen: Set[str]) -> List[Tuple[int, int]]:
+    # 去掉已见过的段落；剩下连续的新段落重新组成区间，保证 chunk 不跨越被去掉的内容
+    novel: List[Tuple[int, int]] = []
+    for seg_start, seg_end in segments:
+        run: Optional[Tuple[int, int]] = None
+        for s, e in _split_spans(text, seg_start, seg_end, _PARAGRAPH_BREAK):
+            if _fingerprint(text[s:e]) in seen:
+                if run:
+                    novel.append(run)
+                run = None
+            else:
+                run = (run[0] if run else s, e)
+        if run:
+            novel.append(run)
+    return novel
+
+
+def _hard_split(text: str, start: int, end: int, max_tokens: int) -> List[Tuple[int, int]]:
+    # 超长的单句（无标点的长串、表格等）按 token 预算硬切
+    spans = []
+    pos = start
+    while pos < end:
+        size = end - pos
+        while size > 1 and count_tokens(text[pos:pos + size]) > max_tokens:
+            size = max(1, int(size * max_tokens / count_tokens(text[pos:pos + size]) * 0.9))
+        spans.append((pos, pos + size))
+        pos += size
+    return spans
+
+
+def _units(text: str, start: int, end: int, max_tokens: int) -> List[Tuple[int, int, int]]:
+    """
+    把一个正文区间拆成 (start, end, tokens) 单元：放得下的段落整体作为一个单元，否则拆成句子。
+    """
+    units = []
+    for ps, pe in _split_spans(text, start, end, _PARAGRAPH_BREAK):
+        tokens = count_tokens(text[ps:pe])
+        if tokens <= max_tokens:
+            units.append((ps, pe, tokens))
+            continue
+        for ss, se in _split_spans(text, ps, pe, _SENTENCE_END):
+            tokens = count_tokens(text[ss:se])
+            if tokens <= max_tokens:
+                units.append((ss, se, tokens))
+            else:
+                units.extend((hs, he, count_tokens(text[hs:he])) for hs, he in _hard_split(text, ss, se, max_tokens))
+    return units
+
+
+def chunk_email_body(
+        text: str,
+        max_tokens: Optional[int] = None,
+        overlap_tokens: Optional[int] = None,
+        strip_quoted: Optional[bool] = None,
+        seen: Optional[Set[str]] = None,
+        subject: Optional[str] = None,
+) -> List[Chunk]:
+    """
+    按 token 预算切分邮件正文，返回带原文偏移的 chunk 列表（正文为空或全部是重复内容时返回空列表）。
+    seen 为 thread_fingerprints() 的结果时，跳过线程里已出现过的段落；subject 用于识别转发邮件。
+    chunk 不跨越被去掉的引用块，因此 text[start:end] 就是 chunk 的完整内容。
+    """
+    max_tokens = max_tokens or settings.CHUNK_MAX_TOKENS
+    overlap_tokens = settings.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    strip_quoted = settings.CHUNK_STRIP_QUOTED if strip_quoted is None else strip_quoted
+    if not text or not text.strip():
+        return []
+
+    segments = content_segments(text, subject) if strip_quoted else [_strip_span(text, 0, len(text))]
+    if seen:
+        segments = _drop_seen(text, segments, seen)
+    chunks: List[Chunk] = []
+    for seg_start, seg_end in segments:
+        units = _units(text, seg_start, seg_end, max_tokens)
+        current: List[Tuple[int, int, int]] = []
+        current_tokens = 0
+        for unit in units:
+            if current and current_tokens + unit[2] > max_tokens:
+                chunks.append(_make_chunk(text, current, current_tokens))
+                # 重叠：把上一块末尾不超过 overlap_tokens 的句子带入下一块
+                carried: List[Tuple[int, int, int]] = []
+                carried_tokens = 0
+                for prev in reversed(current):
+                    if carried_tokens + prev[2] > overlap_tokens or carried_tokens + prev[2] + unit[2] > max_tokens:
+                        break
+                    carried.insert(0, prev)
+                    carried_tokens += prev[2]
+                current, current_tokens = carried, carried_tokens
+            current.append(unit)
+            current_tokens += unit[2]
+        if current:
+            chunks.append(_make_chunk(text, current, current_tokens))
+    return chunks
+
+
+def _make_chunk(text: str, units: List[Tuple[int, int, int]], tokens: int) -> Chunk:
+    start, end = units[0][0], units[-1][1]
+    return Chunk(text=text[start:end], start=start, end=end, tokens=tokens)
@@ -1,74 +1,155 @@
-from typing import List
+from datetime import datetime
+from typing import Dict, List, Set, Tuple
+
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
+from app.config import settings
 from app.schemas.email import EmailIngestItem
 from app.db import models
-from app.services.embeddings import embed_text
-from app.services.search_index_es import index_email_document
+from app.services.chunking import Chunk, chunk_email_body, thread_fingerprints
+from app.services.embeddings import embed_texts_batched
+from app.services.mailbox_version import bump_mailbox_version
+from app.services.search_backend import bulk_indexer
 from app.services.text_normalization import to_simplified
 
 
-def _chunk_text(text: str, max_chars: int = 5000) -> list[str]:
+# SQLite 单条语句默认最多 999 个绑定参数，IN 查询按此分块
+_IN_QUERY_CHUNK = 500
+
+
+def _existing_external_ids(db: Session, user_id: str, external_ids: List[str]) -> Set[str]:
+    """
+    一次（分块的）IN 查询找出该用户已存在的 external_id。
+    """
+    found: Set[str] = set()
+    for start in range(0, len(external_ids), _IN_QUERY_CHUNK):
+        part = external_ids[start:start + _IN_QUERY_CHUNK]
+        rows = (
+            db.query(models.Email.external_id)
+            .filter(models.Email.user_id == user_id, models.Email.external_id.in_(part))
+            .all()
+        )
+        found.update(r[0] for r in rows)
+    return found
+
+
+def _thread_seen_paragraphs(db: Session, user_id: str, records: List[models.Email]) -> Dict[int, Set[str]]:
     """
-    简单按字符切片，避免超出 embedding 上限。可根据需要改为按 token 切分。
+    每封新邮件所在线程中、时间更早的邮件（库里已有的 + 本批次的）的段落指纹，
+    用于只对新邮件里的新增内容做 embedding 和索引。
     """
-    if not text:
-        return [""]
-    chunks = []
-    start = 0
-    n = len(text)
-    while start < n:
-        end = min(start + max_chars, n)
-        chunks.append(text[start:end])
-        start = end
-    return chunks
+    thread_ids = sorted({rec.thread_id for rec in records if rec.thread_id})
+    if not thread_ids:
+        return {}
+    by_thread: Dict[str, List[Tuple[datetime, int, str]]] = {}
+    for start in range(0, len(thread_ids), _IN_QUERY_CHUNK):
+        part = thread_ids[start:start + _IN_QUERY_CHUNK]
+        rows = (
+            db.query(models.Email.thread_id, models.Email.ts, models.Email.id, models.Email.body_text)
+            .filter(models.Email.user_id == user_id, models.Email.thread_id.in_(part))
+            .all()
+        )
+        for thread_id, ts, email_id, body in rows:
+            by_thread.setdefault(thread_id, []).append((ts or datetime.min, email_id, body or ""))
+
+    new_ids = {rec.id for rec in records}
+    seen_by_email: Dict[int, Set[str]] = {}
+    for messages in by_thread.values():
+        messages.sort(key=lambda m: (m[0], m[1]))
+        seen: Set[str] = set()
+        for _, email_id, body in messages:
+            if email_id in new_ids:
+                seen_by_email[email_id] = set(seen)
+            seen |= thread_fingerprints([body])
+    return seen_by_email
+
+
+def _insert_ignore_duplicates(db: Session):
+    """
+    SQLite / PostgreSQL 使用 ON CONFLICT DO NOTHING，配合 (user_id, external_id) 唯一索引，
+    并发重试同一批邮件时冲突的行直接跳过，RETURNING 只返回真正插入的行。
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return insert(models.Email)
+    return dialect_insert(models.Email).on_conflict_do_nothing()
 
 
 def ingest_emails(db: Session, user_id: str, emails: List[EmailIngestItem]) -> int:
-    count = 0
+    """
+    写入 DB 并按 chunk 建立 ES 索引。
+    1) 一次 IN 查询完成整批去重，新邮件用一条批量 INSERT ... RETURNING 写入
+    2) 收集整批邮件的 chunk，通过 embed_texts_batched 批量计算向量
+    3) 通过检索后端的 bulk_indexer 批量写入（ES 走 _bulk）
+    """
+    # 多租户：idempotency 以 (user_id, external_id) 为键；同一批内重复的只保留第一封
+    unique_items: Dict[str, EmailIngestItem] = {}
     for item in emails:
-        # 多租户：idempotency 以 (user_id, external_id) 为键
-        existing = (
-            db.query(models.Email)
-            .filter(models.Email.user_id == user_id, models.Email.external_id == item.external_id)
-            .first()
-        )
-        if existing:
-            continue
-
-        rec = models.Email(
-            user_id=user_id,
-            external_id=item.external_id,
-            thread_id=item.thread_id,
-            subject=item.subject,
-            sender=item.sender,
-            recipients=",".join(item.recipients),
-            cc=",".join(item.cc) if item.cc else None,
-            bcc=",".join(item.bcc) if item.bcc else None,
-            body_text=item.body_text,
-            labels=",".join(item.labels) if item.labels else None,
-            ts=item.ts,
-            importance_score=item.importance_score,
-            is_promotion=1 if item.is_promotion else 0,
-        )
-        db.add(rec)
-        db.flush()  # 得到 rec.id
+        unique_items.setdefault(item.external_id, item)
+    if not unique_items:
+        return 0
 
-        # 计算 embedding & 按 chunk 写入 ES
+    existing_ids = _existing_external_ids(db, user_id, list(unique_items))
+    rows = [
+        {
+            "user_id": user_id,
+            "external_id": item.external_id,
+            "thread_id": item.thread_id,
+            "subject": item.subject,
+            "sender": item.sender,
+            "recipients": ",".join(item.recipients),
+            "cc": ",".join(item.cc) if item.cc else None,
+            "bcc": ",".join(item.bcc) if item.bcc else None,
+            "body_text": item.body_text,
+            "labels": ",".join(item.labels) if item.labels else None,
+            "ts": item.ts,
+            "importance_score": item.importance_score,
+            "is_promotion": 1 if item.is_promotion else 0,
+        }
+        for external_id, item in unique_items.items()
+        if external_id not in existing_ids
+    ]
+    if not rows:
+        return 0
+
+    new_records: List[models.Email] = list(
+        db.scalars(_insert_ignore_duplicates(db).returning(models.Email), rows).all()
+    )
+
+    # 收集整批邮件的 chunk：(rec, 简体 subject, chunk_id, chunk)
+    # 偏移基于原文 body_text，检索时据此取出命中的 chunk 作为 snippet
+    # 开启线程去重时，线程里更早邮件已有的段落（回复链里整段引用的历史）不再重复 embedding
+    pending: List[Tuple[models.Email, str, int, Chunk]] = []
+    seen_by_email = _thread_seen_paragraphs(db, user_id, new_records) if settings.CHUNK_THREAD_DEDUP else {}
+    for rec in new_records:
         subject_s = to_simplified(rec.subject or "")
-        body_text_s = to_simplified(rec.body_text or "")
-        text_for_embedding = f"{subject_s}\n\n{body_text_s}"
-        chunks = _chunk_text(text_for_embedding)
+        # 正文为空（或全是重复内容）的邮件仍按 subject 建一个 chunk
+        chunks = chunk_email_body(rec.body_text or "", seen=seen_by_email.get(rec.id), subject=rec.subject) or [
+            Chunk(text="", start=0, end=0, tokens=0)
+        ]
         for idx, chunk in enumerate(chunks):
-            vec = embed_text(chunk)
-            index_email_document(
+            pending.append((rec, subject_s, idx, chunk))
+
+    # 每个 chunk 的向量都带上 subject，后面的 chunk 也不丢主题上下文
+    vectors = embed_texts_batched(
+        [f"{subject_s}\n\n{to_simplified(chunk.text)}" for _, subject_s, _, chunk in pending]
+    )
+
+    with bulk_indexer() as indexer:
+        for (rec, subject_s, idx, chunk), vec in zip(pending, vectors):
+            indexer.add(
                 user_id=user_id,
                 email_id=rec.id,
                 external_id=rec.external_id,
                 thread_id=rec.thread_id,
                 chunk_id=idx,
                 subject=subject_s,
-                body_text=chunk,
+                body_text=to_simplified(chunk.text),
                 sender=rec.sender,
                 recipients=rec.recipients,
                 labels=rec.labels,
@@ -76,9 +157,11 @@ def ingest_emails(db: Session, user_id: str, emails: List[EmailIngestItem]) -> i
                 importance_score=rec.importance_score,
                 is_promotion=bool(rec.is_promotion),
                 embedding=vec,
+                chunk_start=chunk.start,
+                chunk_end=chunk.end,
             )
 
-        count += 1
-
+    # 邮箱内容变化，/ai/ask 的答案缓存随之失效
+    bump_mailbox_version(db, user_id)
     db.commit()
-    return count
+    return len(new_records)
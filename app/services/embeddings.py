@@ -1,54 +1,208 @@
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import os
+import re
 
-import httpx
 import numpy as np
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from app.config import settings
+from app.services.embedding_cache import get_embedding_cache
+from app.services.http_clients import get_async_http_client, get_http_client, get_loop_bound
 
 
-_http_client = httpx.Client(
-    timeout=30.0,
-    verify=False,
-)
-
 _client = OpenAI(
     api_key=settings.OPENAI_API_KEY,
     base_url=settings.OPENAI_BASE_URL,
-    # http_client=_http_client,
+    http_client=get_http_client("openai"),
 )
 
-# ⚠️ 非常重要：这里的维度要和你选的 embedding 模型一致
-# text-embedding-3-large = 3072 维；如果你换成 text-embedding-3-small（1536 维），一定要改这里和 ES mapping。
-EMBED_DIM = 3072
+# 按事件循环创建（底层 httpx.AsyncClient 绑定循环）；赋值后（测试 / 压测替身）所有循环共用它
+_async_client: Optional[AsyncOpenAI] = None
+
+
+def _get_async_client() -> AsyncOpenAI:
+    return _async_client or get_loop_bound(
+        "openai.embeddings",
+        lambda: AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            http_client=get_async_http_client("openai"),
+        ),
+    )
+
+# ⚠️ 非常重要：这里的维度要和 ES mapping 一致（两边都取 settings.EMBED_DIM）
+# text-embedding-3-large 原生 3072 维、text-embedding-3-small 原生 1536 维；
+# EMBED_DIM 小于原生维度时由 API 的 dimensions 参数做 Matryoshka 截断。
+EMBED_DIM = settings.EMBED_DIM
+
+# 已知支持 dimensions 参数（Matryoshka）的模型及其原生维度
+_MATRYOSHKA_NATIVE_DIMS = {
+    "text-embedding-3-large": 3072,
+    "text-embedding-3-small": 1536,
+}
+
+
+def _embedding_params() -> dict:
+    params = {"model": settings.OPENAI_MODEL_EMBEDDING, "encoding_format": "float"}
+    native = _MATRYOSHKA_NATIVE_DIMS.get(settings.OPENAI_MODEL_EMBEDDING)
+    # 只对已知模型、且 EMBED_DIM 小于原生维度时传 dimensions：不认识该参数的 provider 会整批报错，
+    # 回退成全零向量写进索引。其它模型需要显式打开 EMBED_SEND_DIMENSIONS
+    if (native is not None and EMBED_DIM < native) or settings.EMBED_SEND_DIMENSIONS:
+        params["dimensions"] = EMBED_DIM
+    return params
+
+
+def _cache_model_key() -> str:
+    # 不同维度的向量不能互相命中；原生维度沿用原来的 key，已有缓存继续有效
+    if "dimensions" in _embedding_params():
+        return f"{settings.OPENAI_MODEL_EMBEDDING}@{EMBED_DIM}"
+    return settings.OPENAI_MODEL_EMBEDDING
+
+
+def supports_truncation() -> bool:
+    """
+    当前 embedding 模型的向量能否本地截断：只有 Matryoshka 训练的模型（或显式开了 EMBED_SEND_DIMENSIONS）
+    的前缀才是有效的低维向量，其它模型截断后只能重新计算。
+    """
+    return settings.OPENAI_MODEL_EMBEDDING in _MATRYOSHKA_NATIVE_DIMS or settings.EMBED_SEND_DIMENSIONS
+
+
+def truncate_embedding(vector: List[float], dims: int) -> List[float]:
+    """
+    Matryoshka 截断：取前 dims 维再做 L2 归一化，与 API 的 dimensions 参数结果一致。
+    供 reindex 在不重新调用 API 的情况下缩减已有向量。
+    """
+    head = np.asarray(vector[:dims], dtype=np.float32)
+    norm = float(np.linalg.norm(head))
+    if norm == 0.0:
+        return head.tolist()
+    return (head / norm).tolist()
+
+
+def _request_embeddings(texts: List[str]) -> List[List[float]]:
+    resp = _client.embeddings.create(input=texts, **_embedding_params())
+    return [d.embedding for d in resp.data]
+
+
+async def _request_embeddings_async(texts: List[str]) -> List[List[float]]:
+    resp = await _get_async_client().embeddings.create(input=texts, **_embedding_params())
+    return [d.embedding for d in resp.data]
+
+
+def _lookup_cached(texts: List[str]) -> Tuple[List[Optional[List[float]]], List[str]]:
+    # 返回 (缓存结果, 去重后的未命中文本)
+    cache = get_embedding_cache()
+    model = _cache_model_key()
+    results: List[Optional[List[float]]] = cache.get_many(model, texts) if cache else [None] * len(texts)
+    missing = list(dict.fromkeys(t for t, v in zip(texts, results) if v is None))
+    return results, missing
+
+
+def _store_fetched(missing: List[str], vectors: List[List[float]]) -> Dict[str, List[float]]:
+    fetched = dict(zip(missing, vectors))
+    cache = get_embedding_cache()
+    if cache:
+        cache.put_many(_cache_model_key(), missing, [fetched[t] for t in missing])
+    return fetched
+
+
+def _fallback_vectors(missing: List[str], e: Exception) -> Dict[str, List[float]]:
+    print("⚠️ OpenAI embeddings error:", repr(e))
+    print("base-url:", settings.OPENAI_BASE_URL)
+    print("Model:", settings.OPENAI_MODEL_EMBEDDING)
+    # 兜底：返回全 0 向量避免调用方挂掉
+    return {t: [0.0] * EMBED_DIM for t in missing}
 
 
 def embed_texts(texts: List[str]) -> List[List[float]]:
     """
     批量计算 embedding。
+    - 先查本地 embedding 缓存，只对未命中的（去重后的）文本请求 API
     - 正常情况下返回真实 embedding
-    - 网络 / OpenAI 挂掉时，返回全 0 占位向量，避免整个服务 500
+    - 网络 / OpenAI 挂掉时，返回全 0 占位向量，避免整个服务 500（占位向量不写入缓存）
     """
+    results, missing = _lookup_cached(texts)
+    if not missing:
+        return results
+
     try:
-        resp = _client.embeddings.create(
-            model=settings.OPENAI_MODEL_EMBEDDING,
-            input=texts,
-            encoding_format="float"
-        )
-        return [d.embedding for d in resp.data]
+        vectors = _request_embeddings(missing)
     except Exception as e:
-        print("⚠️ OpenAI embeddings error:", repr(e))
-        print("base-url:", settings.OPENAI_BASE_URL)
-        print("Model:", settings.OPENAI_MODEL_EMBEDDING)
-        # 兜底：返回全 0 向量避免调用方挂掉
-        return [[0.0] * EMBED_DIM for _ in texts]
+        fetched = _fallback_vectors(missing, e)
+    else:
+        fetched = _store_fetched(missing, vectors)
+
+    return [v if v is not None else fetched[t] for t, v in zip(texts, results)]
+
+
+async def embed_texts_async(texts: List[str]) -> List[List[float]]:
+    """
+    embed_texts 的 async 版本（AsyncOpenAI），缓存与兜底行为相同。
+    """
+    results, missing = _lookup_cached(texts)
+    if not missing:
+        return results
+
+    try:
+        vectors = await _request_embeddings_async(missing)
+    except Exception as e:
+        fetched = _fallback_vectors(missing, e)
+    else:
+        fetched = _store_fetched(missing, vectors)
+
+    return [v if v is not None else fetched[t] for t, v in zip(texts, results)]
 
 
 def embed_text(text: str) -> List[float]:
     return embed_texts([text])[0]
 
 
+async def embed_text_async(text: str) -> List[float]:
+    return (await embed_texts_async([text]))[0]
+
+
+_CJK_RE = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算 token 数：CJK 字符按 1 token/字，其余按 4 字符/token。
+    只用于批量请求的预算控制，不需要精确。
+    """
+    if not text:
+        return 1
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def embed_texts_batched(
+    texts: List[str],
+    *,
+    max_batch_size: Optional[int] = None,
+    max_batch_tokens: Optional[int] = None,
+) -> List[List[float]]:
+    """
+    把任意数量的文本按条数 / token 预算打包成若干次 embed_texts 请求，
+    返回的向量与输入顺序一一对应。
+    """
+    max_batch_size = max_batch_size or settings.EMBED_BATCH_SIZE
+    max_batch_tokens = max_batch_tokens or settings.EMBED_BATCH_MAX_TOKENS
+
+    vectors: List[List[float]] = []
+    batch: List[str] = []
+    batch_tokens = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if batch and (len(batch) >= max_batch_size or batch_tokens + tokens > max_batch_tokens):
+            vectors.extend(embed_texts(batch))
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        vectors.extend(embed_texts(batch))
+    return vectors
+
+
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     """
     余弦相似度计算，用于旧版纯 DB 向量搜索（如果你仍在使用）。
@@ -32,25 +32,33 @@ def start_full_ingestion(db: Session, payload: FullIngestionStartRequest, user_i
     return session
 
 
-def ingest_full_batch(db: Session, payload: FullIngestionBatchRequest, user_id: Optional[str] = None) -> models.IngestionSession:
+def get_active_session(db: Session, session_id: int, user_id: Optional[str] = None) -> models.IngestionSession:
     """
-    将一批邮件写入 DB + ES，并更新对应 IngestionSession 的进度和 checkpoint。
-    由于 ingest_emails 本身对 (user_id, external_id) 是幂等的，
-    所以即便客户端重复发送某批数据，也不会造成数据重复，天然支持“重试/断点续传”。
+    取出一个可以继续写入批次的会话；不存在、不属于该用户或不在进行中时抛 ValueError。
     """
     session = (
         db.query(models.IngestionSession)
-        .filter(models.IngestionSession.id == payload.session_id)
+        .filter(models.IngestionSession.id == session_id)
         .first()
     )
     if not session:
-        raise ValueError(f"IngestionSession {payload.session_id} not found")
+        raise ValueError(f"IngestionSession {session_id} not found")
     if user_id and session.user_id != user_id:
-        raise ValueError(f"IngestionSession {payload.session_id} does not belong to user {user_id}")
+        raise ValueError(f"IngestionSession {session_id} does not belong to user {user_id}")
 
     if session.status not in ("in_progress",):
         # 你也可以选择允许对 completed 做补充，这里简单直接拒绝
-        raise ValueError(f"IngestionSession {payload.session_id} is not in progress (status={session.status})")
+        raise ValueError(f"IngestionSession {session_id} is not in progress (status={session.status})")
+    return session
+
+
+def ingest_full_batch(db: Session, payload: FullIngestionBatchRequest, user_id: Optional[str] = None) -> models.IngestionSession:
+    """
+    将一批邮件写入 DB + ES，并更新对应 IngestionSession 的进度和 checkpoint。
+    由于 ingest_emails 本身对 (user_id, external_id) 是幂等的，
+    所以即便客户端重复发送某批数据，也不会造成数据重复，天然支持“重试/断点续传”。
+    """
+    session = get_active_session(db, payload.session_id, user_id=user_id)
 
     try:
         # 1) 先导入本批次邮件
@@ -83,3 +91,66 @@ def ingest_full_batch(db: Session, payload: FullIngestionBatchRequest, user_id:
         db.commit()
         db.refresh(session)
         raise
+
+
+def resume_or_start_provider_session(
+    db: Session, user_id: str, provider: str, status: str = "in_progress"
+) -> models.IngestionSession:
+    """
+    邮箱首次导入（Gmail / Outlook）使用的会话：
+    如果同一 user + provider 有未完成（queued / in_progress / failed）的会话，则复用它，调用方从 checkpoint_token 续传；
+    否则新建一个会话。入队时传 status="queued"，worker 开始执行时再置为 in_progress。
+    """
+    session = (
+        db.query(models.IngestionSession)
+        .filter(
+            models.IngestionSession.user_id == user_id,
+            models.IngestionSession.provider == provider,
+            models.IngestionSession.status.in_(("queued", "in_progress", "failed")),
+        )
+        .order_by(models.IngestionSession.id.desc())
+        .first()
+    )
+    if not session:
+        session = models.IngestionSession(
+            user_id=user_id,
+            provider=provider,
+            processed_count=0,
+            created_at=datetime.utcnow(),
+        )
+    session.status = status
+    session.last_error = None
+    session.updated_at = datetime.utcnow()
+    db.add(session)
+    db.commit()
+    db.refresh(session)
+    return session
+
+
+def record_page_progress(
+    db: Session,
+    session: models.IngestionSession,
+    ingested_count: int,
+    checkpoint_token: Optional[str],
+) -> None:
+    """
+    每处理完一页就推进 checkpoint 并提交，崩溃后可从最后完成的一页继续。
+    """
+    session.processed_count += ingested_count
+    session.checkpoint_token = checkpoint_token
+    session.updated_at = datetime.utcnow()
+    db.add(session)
+    db.commit()
+
+
+def finish_provider_session(db: Session, session: models.IngestionSession, error: Optional[Exception] = None) -> None:
+    if error is not None:
+        db.rollback()
+        session.status = "failed"
+        session.last_error = str(error)
+    else:
+        session.status = "completed"
+        session.last_error = None
+    session.updated_at = datetime.utcnow()
+    db.add(session)
+    db.commit()
@@ -1,7 +1,13 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional, Tuple
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+import asyncio
+import json
+import random
+import uuid
 
 import httpx
 from dateutil.parser import parse as parse_dt
@@ -10,6 +16,7 @@ from html import unescape
 
 from app.config import settings
 from app.schemas.email import EmailIngestItem
+from app.services.http_clients import get_async_http_client, run_in_background_loop
 
 
 def _auth_headers(access_token: str) -> dict:
@@ -144,7 +151,37 @@ def _message_to_email_item(msg: dict) -> EmailIngestItem:
     )
 
 
-def _list_message_ids(client: httpx.Client, access_token: str, since: Optional[datetime], page_token: Optional[str]) -> dict:
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def _backoff_delay(attempt: int, resp: Optional[httpx.Response] = None) -> float:
+    retry_after = resp.headers.get("Retry-After") if resp is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return min(2 ** attempt, 32) + random.uniform(0, 1)
+
+
+async def _request_with_backoff(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    发送请求；遇到 429 / 5xx 或网络错误时按指数退避（优先 Retry-After）重试。
+    """
+    for attempt in range(settings.GMAIL_MAX_RETRIES + 1):
+        try:
+            resp = await client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            if attempt >= settings.GMAIL_MAX_RETRIES:
+                raise
+            await asyncio.sleep(_backoff_delay(attempt))
+            continue
+        if resp.status_code in _RETRY_STATUS and attempt < settings.GMAIL_MAX_RETRIES:
+            await asyncio.sleep(_backoff_delay(attempt, resp))
+            continue
+        resp.raise_for_status()
+        return resp
+    raise RuntimeError("unreachable")
+
+
+async def _list_message_ids(client: httpx.AsyncClient, access_token: str, since: Optional[datetime], page_token: Optional[str]) -> dict:
     base_url = settings.GMAIL_API_BASE_URL.rstrip("/")
     url = f"{base_url}/users/me/messages"
     params = {
@@ -157,86 +194,262 @@ def _list_message_ids(client: httpx.Client, access_token: str, since: Optional[d
         after_ts = int(since.timestamp())
         params["q"] = f"after:{after_ts}"
     headers = _auth_headers(access_token)
-    resp = client.get(url, headers=headers, params=params)
-    resp.raise_for_status()
+    resp = await _request_with_backoff(client, "GET", url, headers=headers, params=params)
     return resp.json()
 
 
-def _get_message(client: httpx.Client, access_token: str, message_id: str) -> dict:
+async def _get_message(client: httpx.AsyncClient, sem: asyncio.Semaphore, access_token: str, message_id: str) -> dict:
     base_url = settings.GMAIL_API_BASE_URL.rstrip("/")
     url = f"{base_url}/users/me/messages/{message_id}"
     params = {"format": "full"}
     headers = _auth_headers(access_token)
-    resp = client.get(url, headers=headers, params=params)
-    resp.raise_for_status()
+    async with sem:
+        resp = await _request_with_backoff(client, "GET", url, headers=headers, params=params)
     return resp.json()
 
 
-def fetch_gmail_messages(
+def _parse_batch_response(resp: httpx.Response) -> Dict[str, Tuple[int, Optional[dict]]]:
+    """
+    解析 multipart/mixed 的 batch 响应，返回 {content_id: (status, json_body)}。
+    """
+    content_type = resp.headers.get("Content-Type", "")
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not match:
+        return {}
+    boundary = match.group(1)
+    results: Dict[str, Tuple[int, Optional[dict]]] = {}
+    for part in resp.text.split(f"--{boundary}"):
+        part = part.strip()
+        if not part or part == "--":
+            continue
+        cid_match = re.search(r"(?im)^Content-ID:\s*<?(?:response-)?([^>\s]+)>?", part)
+        status_match = re.search(r"(?m)^HTTP/[\d.]+\s+(\d{3})", part)
+        if not cid_match or not status_match:
+            continue
+        # HTTP 状态行之后第一个空行后是子响应 body
+        body_part = part[status_match.end():]
+        body_split = re.split(r"\r?\n\r?\n", body_part, maxsplit=1)
+        body = None
+        if len(body_split) == 2 and body_split[1].strip():
+            try:
+                body = json.loads(body_split[1].strip())
+            except json.JSONDecodeError:
+                body = None
+        results[cid_match.group(1)] = (int(status_match.group(1)), body)
+    return results
+
+
+async def _batch_get_messages(
+    client: httpx.AsyncClient, sem: asyncio.Semaphore, access_token: str, message_ids: List[str]
+) -> List[dict]:
+    """
+    通过 Gmail batch 端点一次请求拉取多封邮件详情；失败的子请求退回单条拉取（带退避）。
+    """
+    api_path = urlparse(settings.GMAIL_API_BASE_URL).path.rstrip("/")
+    boundary = f"batch_{uuid.uuid4().hex}"
+    lines = []
+    for idx, mid in enumerate(message_ids):
+        lines.extend([
+            f"--{boundary}",
+            "Content-Type: application/http",
+            f"Content-ID: <item{idx}>",
+            "",
+            f"GET {api_path}/users/me/messages/{mid}?format=full",
+            "",
+        ])
+    lines.append(f"--{boundary}--")
+    headers = _auth_headers(access_token)
+    headers["Content-Type"] = f"multipart/mixed; boundary={boundary}"
+
+    async with sem:
+        resp = await _request_with_backoff(
+            client, "POST", settings.GMAIL_BATCH_URL, headers=headers, content="\r\n".join(lines)
+        )
+    parsed = _parse_batch_response(resp)
+
+    messages: List[Optional[dict]] = []
+    retry_idx: List[int] = []
+    for idx in range(len(message_ids)):
+        status, body = parsed.get(f"item{idx}", (0, None))
+        if status == 200 and body:
+            messages.append(body)
+        else:
+            messages.append(None)
+            retry_idx.append(idx)
+    if retry_idx:
+        retried = await asyncio.gather(
+            *(_get_message(client, sem, access_token, message_ids[i]) for i in retry_idx)
+        )
+        for i, msg in zip(retry_idx, retried):
+            messages[i] = msg
+    return messages
+
+
+async def _get_messages(client: httpx.AsyncClient, sem: asyncio.Semaphore, access_token: str, message_ids: List[str]) -> List[dict]:
+    """
+    并发拉取一组 message 详情，结果顺序与 message_ids 一致。
+    """
+    if not message_ids:
+        return []
+    if settings.GMAIL_USE_BATCH_API:
+        size = max(1, settings.GMAIL_BATCH_SIZE)
+        groups = [message_ids[i:i + size] for i in range(0, len(message_ids), size)]
+        batches = await asyncio.gather(*(_batch_get_messages(client, sem, access_token, g) for g in groups))
+        return [msg for batch in batches for msg in batch]
+    return list(await asyncio.gather(*(_get_message(client, sem, access_token, mid) for mid in message_ids)))
+
+
+@dataclass
+class GmailPage:
+    items: List[EmailIngestItem]
+    # 处理完本页后可安全用于续传的 historyId（history 模式下为本页 history 记录的最大 id，最后一页为响应里的最新 historyId）
+    history_id: Optional[str]
+    latest_ts: Optional[datetime]
+    # 全量模式下一页的 pageToken；为 None 表示已是最后一页
+    next_page_token: Optional[str]
+
+
+def _max_history_id(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    if not a or not b:
+        return a or b
+    return a if int(a) >= int(b) else b
+
+
+async def aiter_gmail_message_pages(
     access_token: str,
     *,
     since: Optional[datetime] = None,
     history_id: Optional[str] = None,
-) -> Tuple[List[EmailIngestItem], Optional[str], Optional[datetime]]:
+    page_token: Optional[str] = None,
+) -> AsyncIterator[GmailPage]:
     """
-    - 初次/补偿同步：使用 since 过滤（默认 90 天）
-    - 增量：使用 history_id（Gmail history API），返回最新 historyId
-    返回 (emails, new_history_id, latest_ts)
+    逐页产出 Gmail 邮件，内存占用只与单页大小有关。
+    - 全量（history_id 为空）：按 since 列 message ids，可用 page_token 从中断处续传
+    - 增量：history API，从 history_id 开始
+    每页的 message 详情在 GMAIL_FETCH_CONCURRENCY 并发上限内并行拉取，可选走 batch 端点；
+    429 / 5xx 自动退避重试。
     """
     headers = _auth_headers(access_token)
     base_url = settings.GMAIL_API_BASE_URL.rstrip("/")
-    all_items: List[EmailIngestItem] = []
-    latest_ts: Optional[datetime] = None
-    new_history_id: Optional[str] = None
-
-    with httpx.Client(timeout=30.0) as client:
+    sem = asyncio.Semaphore(max(1, settings.GMAIL_FETCH_CONCURRENCY))
+    max_history_id: Optional[str] = None
+    # history 模式的续传点只能按 history 记录 id 推进：message 的 historyId 可能领先于尚未处理的记录
+    checkpoint: Optional[str] = history_id
+
+    # 共享连接池：同一事件循环上的多次同步复用 keep-alive 连接
+    client = get_async_http_client("gmail")
+    next_page: Optional[str] = page_token
+    while True:
         if history_id:
             # 增量：用 history API
-            next_page: Optional[str] = None
-            while True:
-                url = f"{base_url}/users/me/history"
-                params = {
-                    "startHistoryId": history_id,
-                    "historyTypes": "messageAdded",
-                    "maxResults": settings.GMAIL_PAGE_SIZE,
-                }
-                if next_page:
-                    params["pageToken"] = next_page
-                resp = client.get(url, headers=headers, params=params)
-                resp.raise_for_status()
-                data = resp.json()
-                new_history_id = data.get("historyId", new_history_id)
-                for h in data.get("history", []):
-                    for m in h.get("messagesAdded", []):
-                        mid = (m.get("message") or {}).get("id")
-                        if not mid:
-                            continue
-                        msg = _get_message(client, access_token, mid)
-                        item = _message_to_email_item(msg)
-                        all_items.append(item)
-                        latest_ts = max(latest_ts, item.ts) if latest_ts else item.ts
-                        new_history_id = msg.get("historyId", new_history_id)
-                next_page = data.get("nextPageToken")
-                if not next_page:
-                    break
+            url = f"{base_url}/users/me/history"
+            params = {
+                "startHistoryId": history_id,
+                "historyTypes": "messageAdded",
+                "maxResults": settings.GMAIL_PAGE_SIZE,
+            }
+            if next_page:
+                params["pageToken"] = next_page
+            resp = await _request_with_backoff(client, "GET", url, headers=headers, params=params)
+            data = resp.json()
+            records = data.get("history", [])
+            mids = [
+                (m.get("message") or {}).get("id")
+                for h in records
+                for m in h.get("messagesAdded", [])
+            ]
+            mids = [mid for mid in mids if mid]
+            if records:
+                checkpoint = _max_history_id(checkpoint, str(max(int(h["id"]) for h in records)))
         else:
             # 全量/首次：列 message ids + 拉详情
-            next_page: Optional[str] = None
-            while True:
-                data = _list_message_ids(client, access_token, since, next_page)
-                mids = [m["id"] for m in data.get("messages", [])]
-                next_page = data.get("nextPageToken")
-                for mid in mids:
-                    msg = _get_message(client, access_token, mid)
-                    item = _message_to_email_item(msg)
-                    all_items.append(item)
-                    latest_ts = max(latest_ts, item.ts) if latest_ts else item.ts
-                    new_history_id = msg.get("historyId", new_history_id)
-                if not next_page:
-                    break
+            data = await _list_message_ids(client, access_token, since, next_page)
+            mids = [m["id"] for m in data.get("messages", [])]
+
+        items: List[EmailIngestItem] = []
+        latest_ts: Optional[datetime] = None
+        for msg in await _get_messages(client, sem, access_token, mids):
+            item = _message_to_email_item(msg)
+            items.append(item)
+            latest_ts = max(latest_ts, item.ts) if latest_ts else item.ts
+            max_history_id = _max_history_id(max_history_id, msg.get("historyId"))
+
+        next_page = data.get("nextPageToken")
+        page_history_id = max_history_id
+        if history_id:
+            page_history_id = checkpoint if next_page else (data.get("historyId") or checkpoint)
+        yield GmailPage(
+            items=items,
+            history_id=page_history_id,
+            latest_ts=latest_ts,
+            next_page_token=next_page,
+        )
+        if not next_page:
+            break
+
+
+def iter_gmail_message_pages(
+    access_token: str,
+    *,
+    since: Optional[datetime] = None,
+    history_id: Optional[str] = None,
+    page_token: Optional[str] = None,
+) -> Iterator[GmailPage]:
+    """
+    aiter_gmail_message_pages 的同步生成器版本，供同步的导入流程逐页消费。
+    """
+    # 在共享的后台事件循环上驱动，Gmail 的 AsyncClient 连接池跨任务 / 跨用户复用
+    pages = aiter_gmail_message_pages(access_token, since=since, history_id=history_id, page_token=page_token)
+    try:
+        while True:
+            try:
+                page = run_in_background_loop(pages.__anext__())
+            except StopAsyncIteration:
+                break
+            yield page
+    finally:
+        run_in_background_loop(pages.aclose())
 
+
+def _merge_pages(pages: Iterable[GmailPage]) -> Tuple[List[EmailIngestItem], Optional[str], Optional[datetime]]:
+    all_items: List[EmailIngestItem] = []
+    latest_ts: Optional[datetime] = None
+    new_history_id: Optional[str] = None
+    for page in pages:
+        all_items.extend(page.items)
+        if page.latest_ts:
+            latest_ts = max(latest_ts, page.latest_ts) if latest_ts else page.latest_ts
+        new_history_id = page.history_id or new_history_id
     return all_items, new_history_id, latest_ts
 
 
+async def fetch_gmail_messages_async(
+    access_token: str,
+    *,
+    since: Optional[datetime] = None,
+    history_id: Optional[str] = None,
+) -> Tuple[List[EmailIngestItem], Optional[str], Optional[datetime]]:
+    """
+    一次性拉取全部邮件的异步版本。大邮箱请优先使用 aiter_gmail_message_pages 逐页处理。
+    返回 (emails, new_history_id, latest_ts)
+    """
+    pages = [page async for page in aiter_gmail_message_pages(access_token, since=since, history_id=history_id)]
+    return _merge_pages(pages)
+
+
+def fetch_gmail_messages(
+    access_token: str,
+    *,
+    since: Optional[datetime] = None,
+    history_id: Optional[str] = None,
+) -> Tuple[List[EmailIngestItem], Optional[str], Optional[datetime]]:
+    """
+    - 初次/补偿同步：使用 since 过滤（默认 90 天）
+    - 增量：使用 history_id（Gmail history API），返回最新 historyId
+    返回 (emails, new_history_id, latest_ts)
+    """
+    return _merge_pages(iter_gmail_message_pages(access_token, since=since, history_id=history_id))
+
+
 def default_since_days(days: int = 90) -> datetime:
     return datetime.now(timezone.utc) - timedelta(days=days)
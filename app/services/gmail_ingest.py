@@ -1,13 +1,18 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from typing import Optional, Tuple
 
 from sqlalchemy.orm import Session
 
 from app.db import models
 from app.services.email_ingest import ingest_emails
-from app.services.gmail_client import fetch_gmail_messages, default_since_days
+from app.services.full_ingestion import (
+    finish_provider_session,
+    record_page_progress,
+    resume_or_start_provider_session,
+)
+from app.services.gmail_client import iter_gmail_message_pages, default_since_days
 
 
 def _get_or_create_state(db: Session, user_id: str, email: str, legacy_provider: str = "gmail") -> models.MailboxSyncState:
@@ -51,19 +56,39 @@ def initial_gmail_import(
     refresh_token: Optional[str] = None,
     days_back: int = 90,
 ) -> Tuple[int, Optional[str], Optional[datetime]]:
+    """
+    首次接入 Gmail：逐页拉取最近 N 天邮件并逐页入库。
+    进度记录在 IngestionSession（provider = "gmail:<邮箱>"），checkpoint_token 为下一页 pageToken，
+    中断后再次调用会从最后完成的一页继续。
+    返回 (ingested_count, history_id, latest_ts)
+    """
     state = _get_or_create_state(db, user_id=user_id, email=email, legacy_provider="gmail")
     state.access_token = access_token
     state.refresh_token = refresh_token
     db.add(state)
     db.commit()
 
-    emails, history_id, latest_ts = fetch_gmail_messages(
-        access_token,
-        since=default_since_days(days_back),
-        history_id=None,
-    )
-    ingested = ingest_emails(db, user_id, emails) if emails else 0
-
+    session = resume_or_start_provider_session(db, user_id, f"gmail:{email.lower()}")
+    # 续传时沿用会话创建时刻计算 since，保证 pageToken 对应的查询条件不变
+    since = session.created_at.replace(tzinfo=timezone.utc) - timedelta(days=days_back)
+
+    ingested = 0
+    history_id: Optional[str] = None
+    latest_ts: Optional[datetime] = None
+    try:
+        for page in iter_gmail_message_pages(access_token, since=since, page_token=session.checkpoint_token):
+            count = ingest_emails(db, user_id, page.items) if page.items else 0
+            ingested += count
+            history_id = page.history_id or history_id
+            if page.latest_ts:
+                latest_ts = max(latest_ts, page.latest_ts) if latest_ts else page.latest_ts
+            record_page_progress(db, session, count, page.next_page_token)
+    except Exception as e:
+        finish_provider_session(db, session, error=e)
+        raise
+    finish_provider_session(db, session)
+
+    # 续传时 history_id 只覆盖本次处理的页，可能偏旧；增量同步会多拉一些，但入库是幂等的
     state.delta_link = history_id or state.delta_link  # 复用 delta_link 字段存 historyId
     state.last_synced_at = latest_ts or state.last_synced_at
     state.updated_at = datetime.utcnow()
@@ -81,6 +106,10 @@ def sync_gmail_incremental(
     refresh_token: Optional[str] = None,
     fallback_days_back: int = 7,
 ) -> Tuple[int, Optional[str], Optional[datetime]]:
+    """
+    增量同步：有 historyId 时走 history API，并按页推进 historyId（崩溃后从最后完成的一页继续）；
+    否则回退到最近 fallback_days_back 天，结束后再记录 historyId。
+    """
     state = _get_or_create_state(db, user_id=user_id, email=email, legacy_provider="gmail")
     token_to_use = access_token or state.access_token
     if not token_to_use:
@@ -93,15 +122,29 @@ def sync_gmail_incremental(
     db.add(state)
     db.commit()
 
-    emails, history_id, latest_ts = fetch_gmail_messages(
+    use_history = bool(state.delta_link)
+    pages = iter_gmail_message_pages(
         token_to_use,
-        since=default_since_days(fallback_days_back) if not state.delta_link else None,
+        since=default_since_days(fallback_days_back) if not use_history else None,
         history_id=state.delta_link,
     )
-    ingested = ingest_emails(db, user_id, emails) if emails else 0
+    ingested = 0
+    history_id: Optional[str] = None
+    latest_ts: Optional[datetime] = None
+    for page in pages:
+        ingested += ingest_emails(db, user_id, page.items) if page.items else 0
+        history_id = page.history_id or history_id
+        if page.latest_ts:
+            latest_ts = max(latest_ts, page.latest_ts) if latest_ts else page.latest_ts
+        state.last_synced_at = latest_ts or state.last_synced_at
+        # 列表模式按时间倒序返回，只有全部完成后 historyId 才安全；history 模式可以逐页推进
+        if use_history:
+            state.delta_link = history_id or state.delta_link
+        state.updated_at = datetime.utcnow()
+        db.add(state)
+        db.commit()
 
     state.delta_link = history_id or state.delta_link
-    state.last_synced_at = latest_ts or state.last_synced_at
     state.updated_at = datetime.utcnow()
     db.add(state)
     db.commit()
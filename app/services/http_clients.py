@@ -0,0 +1,240 @@
+"""
+Shared HTTP clients for upstream APIs (openai / gmail / outlook).
+- One pooled client per upstream, reused across requests, sync jobs and tenants, so keep-alive
+  connections (and their TLS sessions) survive between mailbox syncs.
+- Per-upstream pool limits; HTTP/2 with HTTP2_ENABLED=true and the optional `h2` package
+  (pip install "httpx[http2]"), otherwise HTTP/1.1.
+- httpx.AsyncClient connections are bound to an event loop, so async clients are kept per loop
+  (get_loop_bound() does the same for objects wrapping them, e.g. AsyncOpenAI);
+  sync code that drives async fetchers uses run_in_background_loop() to stay on one shared loop.
+- close_http_clients() closes the sync clients; the async shutdown hook awaits aclose_http_clients().
+- pool_stats() reports requests, new TCP connections and TLS handshakes per upstream
+  (collected through the httpcore `trace` extension) plus current pool occupancy.
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import threading
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import httpx
+
+from app.config import settings
+
+T = TypeVar("T")
+
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+if settings.HTTP2_ENABLED and not _HTTP2_AVAILABLE:
+    print("⚠️ HTTP2_ENABLED=true but the h2 package is not installed; using HTTP/1.1 (pip install \"httpx[http2]\")")
+
+
+def _upstream_options(upstream: str) -> Dict[str, Any]:
+    max_connections = {
+        "openai": settings.OPENAI_HTTP_MAX_CONNECTIONS,
+        "gmail": settings.GMAIL_HTTP_MAX_CONNECTIONS,
+        "outlook": settings.OUTLOOK_HTTP_MAX_CONNECTIONS,
+    }.get(upstream, settings.HTTP_MAX_CONNECTIONS)
+    options: Dict[str, Any] = {
+        "timeout": httpx.Timeout(settings.HTTP_TIMEOUT_SECONDS, connect=10.0),
+        "limits": httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "http2": settings.HTTP2_ENABLED and _HTTP2_AVAILABLE,
+    }
+    if upstream == "openai":
+        if settings.OPENAI_PROXY:
+            options["proxy"] = settings.OPENAI_PROXY
+        options["verify"] = settings.OPENAI_VERIFY_SSL
+    return options
+
+
+class _Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"requests": 0, "connections_opened": 0, "tls_handshakes": 0}
+        )
+
+    def incr(self, upstream: str, key: str) -> None:
+        with self._lock:
+            self.values[upstream][key] += 1
+
+    def snapshot(self, upstream: str) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.values[upstream])
+
+
+_counters = _Counters()
+
+
+def _trace_event(upstream: str, event: str) -> None:
+    # 事件名形如 "connection.connect_tcp.complete"；走代理时前缀为 "proxy."
+    if event.endswith("connect_tcp.complete"):
+        _counters.incr(upstream, "connections_opened")
+    elif event.endswith("start_tls.complete"):
+        _counters.incr(upstream, "tls_handshakes")
+
+
+def _sync_hooks(upstream: str) -> Dict[str, list]:
+    def trace(event: str, info: dict) -> None:
+        _trace_event(upstream, event)
+
+    def on_request(request: httpx.Request) -> None:
+        _counters.incr(upstream, "requests")
+        request.extensions.setdefault("trace", trace)
+
+    return {"request": [on_request]}
+
+
+def _async_hooks(upstream: str) -> Dict[str, list]:
+    async def trace(event: str, info: dict) -> None:
+        _trace_event(upstream, event)
+
+    async def on_request(request: httpx.Request) -> None:
+        _counters.incr(upstream, "requests")
+        request.extensions.setdefault("trace", trace)
+
+    return {"request": [on_request]}
+
+
+_lock = threading.Lock()
+_sync_clients: Dict[str, httpx.Client] = {}
+# (upstream, loop) -> AsyncClient；loop 为 None 表示在事件循环外创建
+_async_clients: Dict[Tuple[str, Optional[asyncio.AbstractEventLoop]], httpx.AsyncClient] = {}
+# (name, loop) -> 包着 AsyncClient 的对象（AsyncOpenAI 等），生命周期跟随对应的事件循环
+_loop_bound: Dict[Tuple[str, Optional[asyncio.AbstractEventLoop]], Any] = {}
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _drop_closed_loops() -> None:
+    # 调用方持有 _lock；顺手清理已关闭事件循环上的客户端
+    for cache in (_async_clients, _loop_bound):
+        for key in [k for k in cache if k[1] is not None and k[1].is_closed()]:
+            del cache[key]
+
+
+def get_http_client(upstream: str) -> httpx.Client:
+    """
+    返回该上游共享的同步 httpx.Client（线程安全，不要在调用方 close）。
+    """
+    with _lock:
+        client = _sync_clients.get(upstream)
+        if client is None:
+            client = httpx.Client(event_hooks=_sync_hooks(upstream), **_upstream_options(upstream))
+            _sync_clients[upstream] = client
+        return client
+
+
+def get_async_http_client(upstream: str) -> httpx.AsyncClient:
+    """
+    返回该上游在当前事件循环上共享的 httpx.AsyncClient（不要在调用方 close）。
+    """
+    loop = _running_loop()
+    with _lock:
+        _drop_closed_loops()
+        client = _async_clients.get((upstream, loop))
+        if client is None:
+            client = httpx.AsyncClient(event_hooks=_async_hooks(upstream), **_upstream_options(upstream))
+            _async_clients[(upstream, loop)] = client
+        return client
+
+
+def get_loop_bound(name: str, factory: Callable[[], T]) -> T:
+    """
+    按当前事件循环缓存 factory() 的结果，用于包着 get_async_http_client() 的客户端（例如 AsyncOpenAI）。
+    """
+    loop = _running_loop()
+    with _lock:
+        _drop_closed_loops()
+        obj = _loop_bound.get((name, loop))
+    if obj is None:
+        # factory 内部会再取 _lock，不能在锁内调用；同一事件循环上不会并发创建
+        obj = factory()
+        with _lock:
+            obj = _loop_bound.setdefault((name, loop), obj)
+    return obj
+
+
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    global _background_loop
+    with _lock:
+        if _background_loop is None:
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_background_loop.run_forever, name="http-clients-loop", daemon=True
+            ).start()
+        return _background_loop
+
+
+def run_in_background_loop(coro: Awaitable[T]) -> T:
+    """
+    在共享的后台事件循环上执行协程并等待结果。
+    同步代码驱动 async 拉取逻辑时用它代替 new_event_loop()，这样 AsyncClient 的连接池可以跨调用复用。
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_background_loop()).result()
+
+
+def _pool_occupancy(client: Any) -> Dict[str, int]:
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    idle = sum(1 for c in connections if c.is_idle())
+    return {"open_connections": len(connections), "idle_connections": idle}
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    with _lock:
+        clients = [(upstream, c) for upstream, c in _sync_clients.items()]
+        clients += [(upstream, c) for (upstream, _), c in _async_clients.items()]
+    stats: Dict[str, Dict[str, Any]] = {}
+    for upstream, client in clients:
+        entry = stats.setdefault(
+            upstream,
+            {**_counters.snapshot(upstream), "clients": 0, "open_connections": 0, "idle_connections": 0},
+        )
+        entry["clients"] += 1
+        for key, value in _pool_occupancy(client).items():
+            entry[key] += value
+    for entry in stats.values():
+        entry["http2"] = settings.HTTP2_ENABLED and _HTTP2_AVAILABLE
+    return stats
+
+
+def close_http_clients() -> None:
+    with _lock:
+        sync_clients = list(_sync_clients.values())
+        _sync_clients.clear()
+    for client in sync_clients:
+        client.close()
+
+
+async def aclose_http_clients() -> None:
+    """
+    关闭所有 AsyncClient：当前循环（或循环外创建）的直接 await，其它仍在运行的循环（如后台循环）
+    把 aclose 投递过去执行；已停止的循环上的连接无法再关闭，直接丢弃。
+    """
+    current = asyncio.get_running_loop()
+    with _lock:
+        async_clients = list(_async_clients.items())
+        _async_clients.clear()
+        _loop_bound.clear()
+    for (upstream, loop), client in async_clients:
+        try:
+            if loop is None or loop is current:
+                await client.aclose()
+            elif loop.is_running():
+                await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(client.aclose(), loop))
+        except Exception as e:
+            print(f"⚠️ failed to close {upstream} http client: {type(e).__name__}: {e}")
@@ -0,0 +1,102 @@
+"""
+Tenant-aware routing policy for the Elasticsearch emails index.
+- Shared index (ELASTICSEARCH_INDEX_EMAILS): documents are written and searched with _routing=user_id,
+  so a tenant's chunks live on one shard and a search (BM25 + kNN) only visits that shard's HNSW graph
+  instead of every shard. Spread tenants with ES_INDEX_SHARDS on new indices.
+- Large tenants can be moved to a dedicated index with scripts/move_tenant_index.py. Such a tenant is
+  detected by the alias "<ELASTICSEARCH_INDEX_EMAILS>-tenant-<slug>"; lookups are cached for
+  ES_TENANT_ALIAS_CACHE_SECONDS, so all processes pick up a move without a restart.
+- index_email_document, EmailBulkIndexer and search_email_documents(_async) all go through target().
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from app.config import settings
+
+
+@dataclass(frozen=True)
+class IndexTarget:
+    index: str
+    routing: Optional[str]
+    dedicated: bool = False
+
+
+def tenant_index_name(user_id: str) -> str:
+    """
+    独立租户索引的别名。ES 索引名只能是小写且不能含部分符号，附带 hash 避免不同 user_id 清洗后撞名。
+    """
+    slug = re.sub(r"[^a-z0-9_-]+", "-", user_id.lower()).strip("-_")[:40] or "user"
+    digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:8]
+    return f"{settings.ELASTICSEARCH_INDEX_EMAILS}-tenant-{slug}-{digest}"
+
+
+def shared_routing(user_id: str) -> Optional[str]:
+    return user_id if settings.ES_ROUTING_ENABLED else None
+
+
+class IndexRouter:
+    def __init__(self, cache_seconds: float):
+        self.cache_seconds = cache_seconds
+        self._lock = threading.Lock()
+        # user_id -> (过期时间, 是否有独立索引)
+        self._dedicated: Dict[str, Tuple[float, bool]] = {}
+
+    def _cached(self, user_id: str) -> Optional[bool]:
+        with self._lock:
+            item = self._dedicated.get(user_id)
+        if item is None or item[0] < time.monotonic():
+            return None
+        return item[1]
+
+    def _remember(self, user_id: str, dedicated: bool) -> bool:
+        with self._lock:
+            self._dedicated[user_id] = (time.monotonic() + self.cache_seconds, dedicated)
+        return dedicated
+
+    def _target(self, user_id: str, dedicated: bool) -> IndexTarget:
+        if dedicated:
+            return IndexTarget(index=tenant_index_name(user_id), routing=None, dedicated=True)
+        return IndexTarget(index=settings.ELASTICSEARCH_INDEX_EMAILS, routing=shared_routing(user_id))
+
+    def target(self, user_id: str) -> IndexTarget:
+        dedicated = self._cached(user_id)
+        if dedicated is None:
+            from app.services.search_index_es import es
+
+            try:
+                dedicated = bool(es.indices.exists_alias(name=tenant_index_name(user_id)))
+            except Exception as e:
+                # ES 不可用时按共享索引处理，后续请求会自己报错；不缓存这次结果
+                print(f"⚠️ tenant index lookup failed for {user_id}: {e!r}")
+                return self._target(user_id, False)
+            self._remember(user_id, dedicated)
+        return self._target(user_id, dedicated)
+
+    async def target_async(self, user_id: str) -> IndexTarget:
+        dedicated = self._cached(user_id)
+        if dedicated is None:
+            from app.services.search_index_es import get_async_es
+
+            try:
+                dedicated = bool(await get_async_es().indices.exists_alias(name=tenant_index_name(user_id)))
+            except Exception as e:
+                print(f"⚠️ tenant index lookup failed for {user_id}: {e!r}")
+                return self._target(user_id, False)
+            self._remember(user_id, dedicated)
+        return self._target(user_id, dedicated)
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        with self._lock:
+            if user_id is None:
+                self._dedicated.clear()
+            else:
+                self._dedicated.pop(user_id, None)
+
+
+index_router = IndexRouter(cache_seconds=settings.ES_TENANT_ALIAS_CACHE_SECONDS)
@@ -0,0 +1,367 @@
+"""
+SQLite-backed background ingestion queue.
+- Endpoints enqueue an IngestionJob and return immediately; a pool of worker threads runs the
+  fetch / embed / index work outside the request handlers.
+- Scheduling is round-robin per user_id, and each user has at most one running job at a time,
+  so one huge mailbox cannot starve the others (and batches of one session stay in order).
+  Claiming is a single conditional UPDATE, so several worker processes can share the queue.
+- Running jobs hold a lease (worker_id + heartbeat_at); only jobs whose lease expired are requeued.
+- Progress is surfaced through the IngestionSession linked to each job.
+"""
+from __future__ import annotations
+
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import exists, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+
+from app.config import settings
+from app.db import models
+from app.db.session import SessionLocal
+from app.schemas.ingestion import FullIngestionBatchRequest
+from app.services.full_ingestion import (
+    finish_provider_session,
+    ingest_full_batch,
+    record_page_progress,
+    resume_or_start_provider_session,
+)
+from app.services.gmail_ingest import initial_gmail_import, sync_gmail_incremental
+from app.services.outlook_ingest import initial_outlook_import, sync_outlook_incremental
+
+
+def _sync_result(ingested: int, cursor: Optional[str], last_synced_at: Optional[datetime], cursor_key: str) -> Dict[str, Any]:
+    return {
+        "ingested": ingested,
+        cursor_key: cursor,
+        "last_synced_at": last_synced_at.isoformat() if last_synced_at else None,
+    }
+
+
+def _run_gmail_import(db: Session, job: models.IngestionJob) -> Dict[str, Any]:
+    p = job.payload or {}
+    ingested, history_id, last_synced_at = initial_gmail_import(
+        db,
+        user_id=job.user_id,
+        email=p["email"],
+        access_token=p["access_token"],
+        refresh_token=p.get("refresh_token"),
+        days_back=p.get("days_back", 90),
+    )
+    return _sync_result(ingested, history_id, last_synced_at, "history_id")
+
+
+def _run_outlook_import(db: Session, job: models.IngestionJob) -> Dict[str, Any]:
+    p = job.payload or {}
+    ingested, delta_link, last_synced_at = initial_outlook_import(
+        db,
+        user_id=job.user_id,
+        email=p["email"],
+        access_token=p["access_token"],
+        refresh_token=p.get("refresh_token"),
+        days_back=p.get("days_back", 90),
+    )
+    return _sync_result(ingested, delta_link, last_synced_at, "delta_link")
+
+
+def _run_incremental(
+    sync_func: Callable[..., Any], cursor_key: str
+) -> Callable[[Session, models.IngestionJob], Dict[str, Any]]:
+    def run(db: Session, job: models.IngestionJob) -> Dict[str, Any]:
+        p = job.payload or {}
+        session = db.get(models.IngestionSession, job.session_id) if job.session_id else None
+        try:
+            ingested, cursor, last_synced_at = sync_func(
+                db,
+                user_id=job.user_id,
+                email=p["email"],
+                access_token=p.get("access_token"),
+                refresh_token=p.get("refresh_token"),
+                fallback_days_back=p.get("fallback_days_back", 7),
+            )
+        except Exception as e:
+            if session:
+                finish_provider_session(db, session, error=e)
+            raise
+        if session:
+            record_page_progress(db, session, ingested, cursor)
+            finish_provider_session(db, session)
+        return _sync_result(ingested, cursor, last_synced_at, cursor_key)
+
+    return run
+
+
+def _run_full_batch(db: Session, job: models.IngestionJob) -> Dict[str, Any]:
+    payload = FullIngestionBatchRequest(**(job.payload or {}))
+    session = db.get(models.IngestionSession, payload.session_id)
+    processed_before = session.processed_count if session else 0
+    session = ingest_full_batch(db, payload, user_id=job.user_id)
+    return {
+        "ingested": session.processed_count - processed_before,
+        "checkpoint_token": session.checkpoint_token,
+    }
+
+
+_HANDLERS: Dict[str, Callable[[Session, models.IngestionJob], Dict[str, Any]]] = {
+    "gmail_import": _run_gmail_import,
+    "gmail_sync": _run_incremental(sync_gmail_incremental, "history_id"),
+    "outlook_import": _run_outlook_import,
+    "outlook_sync": _run_incremental(sync_outlook_incremental, "delta_link"),
+    "full_batch": _run_full_batch,
+}
+
+
+def enqueue_job(
+    db: Session,
+    *,
+    user_id: str,
+    kind: str,
+    payload: Dict[str, Any],
+    session_id: Optional[int] = None,
+) -> models.IngestionJob:
+    """
+    写入一个 queued 任务并唤醒 worker。
+    """
+    if kind not in _HANDLERS:
+        raise ValueError(f"Unknown ingestion job kind: {kind}")
+    job = models.IngestionJob(
+        user_id=user_id,
+        kind=kind,
+        payload=payload,
+        status="queued",
+        session_id=session_id,
+        attempts=0,
+        created_at=datetime.utcnow(),
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    worker_pool.notify()
+    return job
+
+
+def enqueue_mailbox_job(
+    db: Session,
+    *,
+    user_id: str,
+    provider: str,
+    initial: bool,
+    payload: Dict[str, Any],
+) -> models.IngestionJob:
+    """
+    Gmail / Outlook 导入与增量同步入队。
+    - 首次导入复用（或新建）"<provider>:<邮箱>" 的可续传会话
+    - 增量同步每次新建一个 "<provider>-sync:<邮箱>" 会话记录本次进度
+    """
+    email_key = payload["email"].lower()
+    if initial:
+        session = resume_or_start_provider_session(db, user_id, f"{provider}:{email_key}", status="queued")
+    else:
+        session = models.IngestionSession(
+            user_id=user_id,
+            provider=f"{provider}-sync:{email_key}",
+            status="queued",
+            processed_count=0,
+            created_at=datetime.utcnow(),
+            updated_at=datetime.utcnow(),
+        )
+        db.add(session)
+        db.commit()
+        db.refresh(session)
+    kind = f"{provider}_{'import' if initial else 'sync'}"
+    return enqueue_job(db, user_id=user_id, kind=kind, payload=payload, session_id=session.id)
+
+
+def get_job(db: Session, job_id: int, user_id: str) -> Optional[models.IngestionJob]:
+    return (
+        db.query(models.IngestionJob)
+        .filter(models.IngestionJob.id == job_id, models.IngestionJob.user_id == user_id)
+        .first()
+    )
+
+
+class IngestionWorkerPool:
+    def __init__(self, poll_interval: float = 1.0):
+        self.poll_interval = poll_interval
+        # 租约归属：同一进程的 worker 线程共用一个 id，由心跳线程统一续约
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Condition()
+
+    def start(self, num_workers: Optional[int] = None) -> None:
+        num_workers = settings.INGESTION_WORKERS if num_workers is None else num_workers
+        if self._threads or num_workers <= 0:
+            return
+        self._stop.clear()
+        self._heartbeat()
+        for i in range(num_workers):
+            t = threading.Thread(target=self._worker_loop, name=f"ingestion-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._heartbeat_loop, name="ingestion-heartbeat", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self.notify(all_workers=True)
+        for t in self._threads:
+            t.join(timeout=timeout)
+        self._threads = []
+
+    def notify(self, all_workers: bool = False) -> None:
+        with self._wakeup:
+            if all_workers:
+                self._wakeup.notify_all()
+            else:
+                self._wakeup.notify()
+
+    def _heartbeat_loop(self) -> None:
+        interval = max(settings.INGESTION_LEASE_SECONDS / 3, 1.0)
+        while not self._stop.wait(interval):
+            try:
+                self._heartbeat()
+            except Exception as e:
+                print(f"⚠️ ingestion heartbeat error: {type(e).__name__}: {e}")
+
+    def _heartbeat(self) -> None:
+        # 续约本进程持有的 running 任务，再把租约已过期的任务（worker 崩溃 / 失联）重新排队；
+        # 导入类任务会从会话 checkpoint 续传
+        now = datetime.utcnow()
+        expired_before = now - timedelta(seconds=settings.INGESTION_LEASE_SECONDS)
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(models.IngestionJob)
+                .where(models.IngestionJob.status == "running", models.IngestionJob.worker_id == self.worker_id)
+                .values(heartbeat_at=now)
+            )
+            requeued = db.execute(
+                update(models.IngestionJob)
+                .where(
+                    models.IngestionJob.status == "running",
+                    or_(models.IngestionJob.heartbeat_at.is_(None), models.IngestionJob.heartbeat_at < expired_before),
+                )
+                .values(status="queued", worker_id=None, heartbeat_at=None)
+            ).rowcount
+            db.commit()
+        finally:
+            db.close()
+        if requeued:
+            self.notify(all_workers=True)
+
+    def _claim_next_job(self, db: Session) -> Optional[models.IngestionJob]:
+        job_table = models.IngestionJob
+        running_users = select(job_table.user_id).where(job_table.status == "running")
+        queued_users = select(job_table.user_id).where(job_table.status == "queued")
+        # 轮询：最久未被调度（最近一次 started_at 最早）的用户优先；调度记录在库里，多进程共享
+        last_started = (
+            db.query(job_table.user_id, func.max(job_table.started_at))
+            .filter(job_table.user_id.in_(queued_users), job_table.user_id.not_in(running_users))
+            .group_by(job_table.user_id)
+            .all()
+        )
+        for user_id, _ in sorted(last_started, key=lambda row: row[1] or datetime.min):
+            job_id = db.execute(
+                select(func.min(job_table.id)).where(job_table.user_id == user_id, job_table.status == "queued")
+            ).scalar()
+            if job_id is None:
+                continue
+            # 单条条件 UPDATE 完成领取：任务仍在排队且该用户没有 running 任务；
+            # sqlite 的写锁让谓词与写入原子，postgres 上并发领取由部分唯一索引兜底
+            running = aliased(models.IngestionJob)
+            now = datetime.utcnow()
+            try:
+                claimed = db.execute(
+                    update(job_table)
+                    .where(
+                        job_table.id == job_id,
+                        job_table.status == "queued",
+                        ~exists().where(running.user_id == user_id, running.status == "running"),
+                    )
+                    .values(
+                        status="running",
+                        worker_id=self.worker_id,
+                        heartbeat_at=now,
+                        started_at=now,
+                        attempts=job_table.attempts + 1,
+                    )
+                ).rowcount
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                continue
+            if claimed:
+                return db.get(job_table, job_id)
+        return None
+
+    def _worker_loop(self) -> None:
+        while not self._stop.is_set():
+            db = SessionLocal()
+            try:
+                job = self._claim_next_job(db)
+                if job is not None:
+                    self._run_job(db, job)
+                    continue
+            except Exception as e:
+                print(f"⚠️ ingestion worker error: {type(e).__name__}: {e}")
+            finally:
+                db.close()
+            with self._wakeup:
+                self._wakeup.wait(timeout=self.poll_interval)
+
+    def _run_job(self, db: Session, job: models.IngestionJob) -> None:
+        if job.session_id:
+            session = db.get(models.IngestionSession, job.session_id)
+            if session and session.status == "queued":
+                session.status = "in_progress"
+                session.updated_at = datetime.utcnow()
+                db.add(session)
+                db.commit()
+        values: Dict[str, Any]
+        try:
+            result = _HANDLERS[job.kind](db, job)
+        except Exception as e:
+            db.rollback()
+            values = {"status": "failed", "last_error": f"{type(e).__name__}: {e}"}
+            print(f"⚠️ ingestion job {job.id} ({job.kind}) failed: {values['last_error']}")
+        else:
+            values = {"status": "completed", "result": result, "last_error": None}
+        # 只有仍持有租约时才写结果；租约过期后任务已被重新排队，交给新的持有者
+        finished = db.execute(
+            update(models.IngestionJob)
+            .where(
+                models.IngestionJob.id == job.id,
+                models.IngestionJob.status == "running",
+                models.IngestionJob.worker_id == self.worker_id,
+            )
+            .values(finished_at=datetime.utcnow(), **values)
+        ).rowcount
+        db.commit()
+        if not finished:
+            print(f"⚠️ ingestion job {job.id} ({job.kind}) lost its lease; result discarded")
+
+
+worker_pool = IngestionWorkerPool()
+
+
+if __name__ == "__main__":
+    # 独立运行 worker 进程：python -m app.services.job_queue
+    from app.db.base import Base
+    from app.db.session import engine, ensure_ingestion_job_lease
+
+    Base.metadata.create_all(bind=engine)
+    ensure_ingestion_job_lease()
+    worker_pool.start(max(settings.INGESTION_WORKERS, 1))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        worker_pool.stop()
@@ -0,0 +1,160 @@
+"""
+Response cache for llm_provider.chat_completion.
+- Key: sha256 of the full request params (model, messages, tools, tool_choice, response_format, ...),
+  so only byte-identical prompts are replayed.
+- Backends: "memory" (in-process LRU) and "sqlite" (on-disk, shared across runs of the scripts);
+  "none" disables the cache. Entries older than LLM_CACHE_TTL_SECONDS are ignored.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.config import settings
+
+
+def llm_cache_key(params: Dict[str, Any]) -> str:
+    raw = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _StatsMixin:
+    hits: int
+    misses: int
+
+    def _stats(self, entries: int) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+class MemoryLLMCache(_StatsMixin):
+    backend = "memory"
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or time.time() - item[0] > self.ttl_seconds:
+                if item is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            # 存的是 JSON 字符串，每次返回新对象，调用方修改不会污染缓存
+            return json.loads(item[1])
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), json.dumps(value, ensure_ascii=False))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return self._stats(len(self._entries))
+
+
+class SqliteLLMCache(_StatsMixin):
+    backend = "sqlite"
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_completions_created_at ON completions (created_at)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM completions WHERE key = ? AND created_at >= ?",
+                (key, time.time() - self.ttl_seconds),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, response, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now),
+            )
+            self._size += self._conn.total_changes - before
+            if self._size > self.max_entries:
+                # 先清过期的，再按写入时间淘汰最旧的，一次降到容量的 90%
+                self._conn.execute("DELETE FROM completions WHERE created_at < ?", (now - self.ttl_seconds,))
+                self._size = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+                overflow = self._size - int(self.max_entries * 0.9)
+                if overflow > 0:
+                    self._conn.execute(
+                        "DELETE FROM completions WHERE key IN ("
+                        " SELECT key FROM completions ORDER BY created_at ASC LIMIT ?)",
+                        (overflow,),
+                    )
+                    self._size -= overflow
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return self._stats(self._size)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """
+    按 LLM_CACHE_BACKEND 返回进程内共享的缓存实例；"none" 时返回 None。
+    """
+    global _cache
+    backend = settings.LLM_CACHE_BACKEND
+    if backend not in ("memory", "sqlite"):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if backend == "sqlite":
+                    _cache = SqliteLLMCache(
+                        settings.LLM_CACHE_PATH, settings.LLM_CACHE_MAX_ENTRIES, settings.LLM_CACHE_TTL_SECONDS
+                    )
+                else:
+                    _cache = MemoryLLMCache(settings.LLM_CACHE_MAX_ENTRIES, settings.LLM_CACHE_TTL_SECONDS)
+    return _cache
@@ -1,46 +1,40 @@
-from typing import List, Dict, Any, Optional
+from typing import AsyncIterator, List, Dict, Any, Optional
 import os
 
-import httpx
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from app.config import settings
+from app.services.http_clients import get_async_http_client, get_http_client, get_loop_bound
+from app.services.llm_cache import get_llm_cache, llm_cache_key
 
 
-# 创建 httpx 客户端
-client_kwargs = {
-    "timeout": 30.0,
-    "verify": False,
-    "proxy": "http://127.0.0.1:7890",
-}
-if settings.OPENAI_PROXY:
-    client_kwargs["proxy"] = settings.OPENAI_PROXY
-
-_http_client = httpx.Client(**client_kwargs)
-
+# 共享连接池的 httpx 客户端（代理 / 证书校验见 OPENAI_PROXY、OPENAI_VERIFY_SSL）
 openai_kwargs = {
     "api_key": settings.OPENAI_API_KEY,
-    "http_client": _http_client,
 }
 
 if settings.OPENAI_BASE_URL:
     openai_kwargs["base_url"] = settings.OPENAI_BASE_URL
 
-_client = OpenAI(**openai_kwargs)
+_client = OpenAI(**openai_kwargs, http_client=get_http_client("openai"))
 
+# 异步客户端：供 async 请求路径（/ai/ask）使用，等待上游时不占用线程。
+# 底层 httpx.AsyncClient 绑定事件循环，所以按循环各建一个；这里赋值后（测试 / 压测替身）所有循环共用它
+_async_client: Optional[AsyncOpenAI] = None
 
-def chat_completion(
+
+def _get_async_client() -> AsyncOpenAI:
+    return _async_client or get_loop_bound(
+        "openai.chat", lambda: AsyncOpenAI(**openai_kwargs, http_client=get_async_http_client("openai"))
+    )
+
+
+def _build_chat_params(
         system_prompt: str,
         user_prompt: str,
-        tools: Optional[List[Dict[str, Any]]] = None,
-        **kwargs,
+        tools: Optional[List[Dict[str, Any]]],
+        kwargs: Dict[str, Any],
 ) -> Dict[str, Any]:
-    """
-    封装一次 Chat Completion 调用。
-    - 使用 settings.OPENAI_MODEL_GPT
-    - 支持 optional tools（用于 tool selection）
-    - 发生异常时抛出，让上层自己决定怎么兜底
-    """
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_prompt},
@@ -54,18 +48,122 @@ def chat_completion(
     if tools:
         params["tools"] = tools
         params["tool_choice"] = "auto"
-    
+
     # Allow overriding/adding params (e.g. response_format)
     params.update(kwargs)
+    return params
+
+
+def _log_chat_error(e: Exception) -> None:
+    # 这里可以按需打印日志 / 上报监控
+    print(f"⚠️ OpenAI chat_completion error: {type(e).__name__}: {e}")
+    if hasattr(e, '__cause__') and e.__cause__:
+        print(f"   Caused by: {type(e.__cause__).__name__}: {e.__cause__}")
+
+
+def chat_completion(
+        system_prompt: str,
+        user_prompt: str,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        cache: bool = True,
+        **kwargs,
+) -> Dict[str, Any]:
+    """
+    封装一次 Chat Completion 调用。
+    - 使用 settings.OPENAI_MODEL_GPT
+    - 支持 optional tools（用于 tool selection）
+    - 相同请求参数命中 LLM_CACHE_BACKEND 配置的响应缓存；cache=False 可单次跳过
+    - 发生异常时抛出，让上层自己决定怎么兜底
+    """
+    params = _build_chat_params(system_prompt, user_prompt, tools, kwargs)
+
+    llm_cache = get_llm_cache() if cache else None
+    key = llm_cache_key(params) if llm_cache else None
+    if llm_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
 
     try:
         resp = _client.chat.completions.create(**params)
     except Exception as e:
-        # 这里可以按需打印日志 / 上报监控
-        print(f"⚠️ OpenAI chat_completion error: {type(e).__name__}: {e}")
-        if hasattr(e, '__cause__') and e.__cause__:
-            print(f"   Caused by: {type(e.__cause__).__name__}: {e.__cause__}")
+        _log_chat_error(e)
         raise
 
     # 返回统一结构：message dict
-    return resp.choices[0].message.model_dump()
+    message = resp.choices[0].message.model_dump()
+    if llm_cache:
+        llm_cache.set(key, message)
+    return message
+
+
+async def chat_completion_async(
+        system_prompt: str,
+        user_prompt: str,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        cache: bool = True,
+        **kwargs,
+) -> Dict[str, Any]:
+    """
+    chat_completion 的 async 版本（AsyncOpenAI），参数、缓存与返回结构相同。
+    """
+    params = _build_chat_params(system_prompt, user_prompt, tools, kwargs)
+
+    llm_cache = get_llm_cache() if cache else None
+    key = llm_cache_key(params) if llm_cache else None
+    if llm_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
+
+    try:
+        resp = await _get_async_client().chat.completions.create(**params)
+    except Exception as e:
+        _log_chat_error(e)
+        raise
+
+    message = resp.choices[0].message.model_dump()
+    if llm_cache:
+        llm_cache.set(key, message)
+    return message
+
+
+async def chat_completion_stream_async(
+        system_prompt: str,
+        user_prompt: str,
+        cache: bool = True,
+        **kwargs,
+) -> AsyncIterator[str]:
+    """
+    流式 Chat Completion：逐段 yield 回答文本。
+    - 与 chat_completion 共用缓存键（不含 stream 参数）；命中时一次性 yield 整个回答
+    - 完整流结束后把拼好的回答写入缓存
+    """
+    params = _build_chat_params(system_prompt, user_prompt, None, kwargs)
+
+    llm_cache = get_llm_cache() if cache else None
+    key = llm_cache_key(params) if llm_cache else None
+    if llm_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            if cached.get("content"):
+                yield cached["content"]
+            return
+
+    try:
+        stream = await _get_async_client().chat.completions.create(**params, stream=True)
+    except Exception as e:
+        _log_chat_error(e)
+        raise
+
+    parts: List[str] = []
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            yield delta
+
+    if llm_cache:
+        llm_cache.set(key, {"role": "assistant", "content": "".join(parts)})
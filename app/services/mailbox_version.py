@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.db import models
+
+
+def get_mailbox_version(db: Session, user_id: str) -> int:
+    row = db.get(models.MailboxVersion, user_id)
+    return row.version if row else 0
+
+
+def bump_mailbox_version(db: Session, user_id: str) -> None:
+    """
+    邮箱内容发生变化时递增版本号（不 commit，随调用方的事务一起提交）。
+    sqlite / postgres 用一条 INSERT ... ON CONFLICT DO UPDATE，并发导入同一用户时不会因首行竞争而失败。
+    """
+    now = datetime.utcnow()
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        db.execute(
+            dialect_insert(models.MailboxVersion)
+            .values(user_id=user_id, version=1, updated_at=now)
+            .on_conflict_do_update(
+                index_elements=[models.MailboxVersion.user_id],
+                set_={"version": models.MailboxVersion.version + 1, "updated_at": now},
+            )
+        )
+        return
+
+    updated = db.execute(
+        update(models.MailboxVersion)
+        .where(models.MailboxVersion.user_id == user_id)
+        .values(version=models.MailboxVersion.version + 1, updated_at=now)
+    ).rowcount
+    if not updated:
+        db.add(models.MailboxVersion(user_id=user_id, version=1, updated_at=now))
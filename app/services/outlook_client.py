@@ -1,13 +1,14 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional, Tuple
+from typing import Iterator, List, Optional, Tuple
 
-import httpx
 from dateutil.parser import parse as parse_dt
 
 from app.config import settings
 from app.schemas.email import EmailIngestItem
+from app.services.http_clients import get_http_client
 
 
 def _auth_headers(access_token: str) -> dict:
@@ -49,6 +50,76 @@ def _message_to_email_item(msg: dict) -> EmailIngestItem:
     )
 
 
+@dataclass
+class OutlookPage:
+    items: List[EmailIngestItem]
+    # 下一页的 nextLink（可直接用于断点续传）；为 None 表示本轮已结束
+    next_link: Optional[str]
+    # 本轮结束时返回的 deltaLink，仅最后一页有值
+    delta_link: Optional[str]
+    latest_ts: Optional[datetime]
+
+
+def iter_outlook_message_pages(
+    access_token: str,
+    *,
+    since: Optional[datetime] = None,
+    delta_link: Optional[str] = None,
+    page_size: int = 50,
+    next_link: Optional[str] = None,
+) -> Iterator[OutlookPage]:
+    """
+    逐页产出 Outlook 邮件，内存占用只与单页大小有关。
+    - next_link：从上次中断的 nextLink 继续（优先级最高）
+    - delta_link：增量同步；也可能是增量同步中断时保存的 nextLink
+    - 否则按 since 过滤做首次同步
+    nextLink / deltaLink 已经带上了原查询的全部参数，只有新开一轮 delta 查询时才附加 $top / $select 等参数。
+    """
+    base_url = settings.OUTLOOK_GRAPH_BASE_URL.rstrip("/")
+    url = next_link or delta_link or f"{base_url}/me/messages/delta"
+    params = None
+    if not next_link and not delta_link:
+        params = {
+            "$top": page_size,
+            "$select": (
+                "id,subject,from,toRecipients,ccRecipients,bccRecipients,"
+                "bodyPreview,body,receivedDateTime,sentDateTime,internetMessageId,"
+                "conversationId,conversationIndex,categories,importance"
+            ),
+            "$orderby": "receivedDateTime desc",
+        }
+        if since:
+            # Delta 支持 filter，便于限制初次同步范围
+            params["$filter"] = f"receivedDateTime ge {since.isoformat()}"
+
+    headers = _auth_headers(access_token)
+
+    # 共享连接池：跨任务 / 跨用户复用 keep-alive 连接
+    client = get_http_client("outlook")
+    next_url: Optional[str] = url
+    next_params = params
+    while next_url:
+        resp = client.get(next_url, headers=headers, params=next_params)
+        resp.raise_for_status()
+        data = resp.json()
+        items: List[EmailIngestItem] = []
+        latest_ts: Optional[datetime] = None
+        for msg in data.get("value", []):
+            item = _message_to_email_item(msg)
+            items.append(item)
+            latest_ts = max(latest_ts, item.ts) if latest_ts else item.ts
+
+        # delta API 可能返回 nextLink 或 deltaLink
+        next_url = data.get("@odata.nextLink")
+        next_params = None  # nextLink 已经包含查询参数
+        yield OutlookPage(
+            items=items,
+            next_link=next_url,
+            delta_link=data.get("@odata.deltaLink"),
+            latest_ts=latest_ts,
+        )
+
+
 def fetch_outlook_messages(
     access_token: str,
     *,
@@ -61,45 +132,18 @@ def fetch_outlook_messages(
     - 首次同步：使用 since（例如 90 天前）过滤并返回最新 delta_link
     - 增量同步：传入 delta_link 继续增量
     返回 (emails, new_delta_link, latest_message_ts)
+    大邮箱请优先使用 iter_outlook_message_pages 逐页处理。
     """
-    base_url = settings.OUTLOOK_GRAPH_BASE_URL.rstrip("/")
-    url = delta_link or f"{base_url}/me/messages/delta"
-    params = {
-        "$top": page_size,
-        "$select": (
-            "id,subject,from,toRecipients,ccRecipients,bccRecipients,"
-            "bodyPreview,body,receivedDateTime,sentDateTime,internetMessageId,"
-            "conversationId,conversationIndex,categories,importance"
-        ),
-        "$orderby": "receivedDateTime desc",
-    }
-    if since and not delta_link:
-        # Delta 支持 filter，便于限制初次同步范围
-        params["$filter"] = f"receivedDateTime ge {since.isoformat()}"
-
-    headers = _auth_headers(access_token)
     all_items: List[EmailIngestItem] = []
     latest_ts: Optional[datetime] = None
     new_delta_link: Optional[str] = None
 
-    with httpx.Client(timeout=30.0) as client:
-        next_url: Optional[str] = url
-        next_params = params
-        while next_url:
-            resp = client.get(next_url, headers=headers, params=next_params)
-            resp.raise_for_status()
-            data = resp.json()
-            for msg in data.get("value", []):
-                item = _message_to_email_item(msg)
-                all_items.append(item)
-                latest_ts = max(latest_ts, item.ts) if latest_ts else item.ts
-
-            # delta API 可能返回 nextLink 或 deltaLink
-            next_url = data.get("@odata.nextLink")
-            next_params = None  # nextLink 已经包含查询参数
-            delta_candidate = data.get("@odata.deltaLink")
-            if delta_candidate:
-                new_delta_link = delta_candidate
+    for page in iter_outlook_message_pages(access_token, since=since, delta_link=delta_link, page_size=page_size):
+        all_items.extend(page.items)
+        if page.latest_ts:
+            latest_ts = max(latest_ts, page.latest_ts) if latest_ts else page.latest_ts
+        if page.delta_link:
+            new_delta_link = page.delta_link
 
     return all_items, new_delta_link, latest_ts
 
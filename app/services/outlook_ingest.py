@@ -7,7 +7,12 @@ from sqlalchemy.orm import Session
 
 from app.db import models
 from app.services.email_ingest import ingest_emails
-from app.services.outlook_client import fetch_outlook_messages, default_since_days
+from app.services.full_ingestion import (
+    finish_provider_session,
+    record_page_progress,
+    resume_or_start_provider_session,
+)
+from app.services.outlook_client import iter_outlook_message_pages, default_since_days
 
 
 def _get_or_create_state(db: Session, user_id: str, email: str, legacy_provider: str = "outlook") -> models.MailboxSyncState:
@@ -55,7 +60,9 @@ def initial_outlook_import(
     days_back: int = 90,
 ) -> Tuple[int, Optional[str], Optional[datetime]]:
     """
-    首次接入 Outlook 时，自动拉取最近 N 天邮件并更新 delta link。
+    首次接入 Outlook 时，逐页拉取最近 N 天邮件并逐页入库，最后更新 delta link。
+    进度记录在 IngestionSession（provider = "outlook:<邮箱>"），checkpoint_token 为下一页 nextLink，
+    中断后再次调用会从最后完成的一页继续。
     返回 (ingested_count, delta_link, latest_ts)
     """
     state = _get_or_create_state(db, user_id=user_id, email=email, legacy_provider="outlook")
@@ -64,14 +71,28 @@ def initial_outlook_import(
     db.add(state)
     db.commit()
 
-    emails, delta_link, latest_ts = fetch_outlook_messages(
-        access_token,
-        since=default_since_days(days_back),
-        delta_link=None,
-        page_size=50,
-    )
-
-    ingested_count = ingest_emails(db, user_id, emails) if emails else 0
+    session = resume_or_start_provider_session(db, user_id, f"outlook:{email.lower()}")
+
+    ingested_count = 0
+    delta_link: Optional[str] = None
+    latest_ts: Optional[datetime] = None
+    try:
+        for page in iter_outlook_message_pages(
+            access_token,
+            since=default_since_days(days_back),
+            page_size=50,
+            next_link=session.checkpoint_token,
+        ):
+            count = ingest_emails(db, user_id, page.items) if page.items else 0
+            ingested_count += count
+            delta_link = page.delta_link or delta_link
+            if page.latest_ts:
+                latest_ts = max(latest_ts, page.latest_ts) if latest_ts else page.latest_ts
+            record_page_progress(db, session, count, page.next_link)
+    except Exception as e:
+        finish_provider_session(db, session, error=e)
+        raise
+    finish_provider_session(db, session)
 
     state.delta_link = delta_link or state.delta_link
     state.last_synced_at = latest_ts or state.last_synced_at
@@ -93,6 +114,7 @@ def sync_outlook_incremental(
     """
     登录时增量同步未同步的邮件。
     优先使用存储的 delta_link；若不存在则回退到最近 fallback_days_back 天。
+    每页处理完后把 nextLink（本轮结束时为 deltaLink）写回 delta_link，崩溃后从最后完成的一页继续。
     """
     state = _get_or_create_state(db, user_id=user_id, email=email, legacy_provider="outlook")
     token_to_use = access_token or state.access_token
@@ -106,17 +128,22 @@ def sync_outlook_incremental(
     db.add(state)
     db.commit()
 
-    emails, delta_link, latest_ts = fetch_outlook_messages(
+    pages = iter_outlook_message_pages(
         token_to_use,
         since=default_since_days(fallback_days_back) if not state.delta_link else None,
         delta_link=state.delta_link,
         page_size=50,
     )
-    ingested_count = ingest_emails(db, user_id, emails) if emails else 0
+    ingested_count = 0
+    latest_ts: Optional[datetime] = None
+    for page in pages:
+        ingested_count += ingest_emails(db, user_id, page.items) if page.items else 0
+        if page.latest_ts:
+            latest_ts = max(latest_ts, page.latest_ts) if latest_ts else page.latest_ts
+        state.delta_link = page.delta_link or page.next_link or state.delta_link
+        state.last_synced_at = latest_ts or state.last_synced_at
+        state.updated_at = datetime.utcnow()
+        db.add(state)
+        db.commit()
 
-    state.delta_link = delta_link or state.delta_link
-    state.last_synced_at = latest_ts or state.last_synced_at
-    state.updated_at = datetime.utcnow()
-    db.add(state)
-    db.commit()
     return ingested_count, state.delta_link, state.last_synced_at
@@ -0,0 +1,84 @@
+"""
+Cheap local checks that decide whether a search query needs the LLM rewrite step.
+- The rewrite only resolves pronouns / relative references against the chat history or the
+  current thread; with no context, or with nothing to resolve, it returns the query unchanged.
+- Detection is a word-boundary regex for English and a substring scan for Chinese
+  (after to_simplified, so traditional input is covered too).
+"""
+from __future__ import annotations
+
+import re
+import threading
+from typing import Dict, Optional
+
+from app.services.text_normalization import to_simplified
+
+_EN_PRONOUNS = [
+    "he", "him", "his", "she", "her", "hers", "it", "its", "they", "them", "their", "theirs",
+    "this", "that", "these", "those", "there", "former", "latter", "above", "aforementioned",
+    "same", "one", "ones",
+]
+_EN_RELATIVE_TIME = [
+    "yesterday", "today", "tonight", "tomorrow", "ago", "recently", "earlier", "later",
+    "previous", "previously", "last", "next", "before", "after", "then",
+]
+_EN_PATTERN = re.compile(r"\b(" + "|".join(_EN_PRONOUNS + _EN_RELATIVE_TIME) + r")\b", re.IGNORECASE)
+
+_ZH_REFERENCES = [
+    # 代词 / 指代
+    "他", "她", "它", "这", "那", "此", "该", "其", "上述", "前者", "后者", "对方", "同一",
+    # 相对时间
+    "昨天", "今天", "明天", "前天", "后天", "上周", "下周", "本周", "上个", "下个", "本月",
+    "去年", "今年", "明年", "最近", "刚才", "刚刚", "之前", "之后", "以前", "上次", "下次",
+]
+
+
+def has_unresolved_reference(question: str) -> bool:
+    """
+    问题里是否包含需要结合上下文才能确定的代词或相对时间。
+    """
+    if not question:
+        return False
+    if _EN_PATTERN.search(question):
+        return True
+    simplified = to_simplified(question)
+    return any(term in simplified for term in _ZH_REFERENCES)
+
+
+def needs_query_rewrite(
+        question: str,
+        chat_history: Optional[str] = None,
+        current_thread: Optional[str] = None,
+) -> bool:
+    """
+    没有对话上下文时无从解析指代，直接跳过；有上下文但问题本身没有指代/相对时间时也跳过。
+    """
+    if not (chat_history or current_thread):
+        return False
+    return has_unresolved_reference(question)
+
+
+class RewriteCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.skipped = 0
+        self.executed = 0
+
+    def record(self, executed: bool) -> None:
+        with self._lock:
+            if executed:
+                self.executed += 1
+            else:
+                self.skipped += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.skipped + self.executed
+            return {
+                "skipped": self.skipped,
+                "executed": self.executed,
+                "skip_rate": (self.skipped / total) if total else 0.0,
+            }
+
+
+rewrite_counter = RewriteCounter()
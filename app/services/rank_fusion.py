@@ -0,0 +1,130 @@
+"""
+Reciprocal Rank Fusion for hybrid (BM25 + kNN) retrieval, selected with SEARCH_FUSION:
+- "linear" (default): one ES query, bool query * 0.65 + knn * 0.35. The two score scales differ, so
+  ai_search filters on a raw score cutoff (SEARCH_MIN_SCORE, or LOCAL_SEARCH_MIN_SCORE for the local backend).
+- "rrf": ES `rrf` retriever over a standard (BM25) and a knn retriever; fusion happens inside ES.
+- "client_rrf": the lexical and the kNN leg are sent concurrently and fused here, which also gives
+  per-leg latency and each hit's rank in every leg (hit["_fusion"]).
+RRF score = sum over legs of 1 / (SEARCH_RRF_RANK_CONSTANT + rank). Only ranks matter, so each leg's
+depth (SEARCH_LEXICAL_DEPTH / SEARCH_KNN_DEPTH / SEARCH_KNN_NUM_CANDIDATES) can be tuned independently.
+fusion_stats aggregates per-leg latency and where the returned hits came from (exposed on /metrics).
+"""
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.config import settings
+
+FUSION_MODES = ("linear", "rrf", "client_rrf")
+
+
+def fusion_mode() -> str:
+    mode = settings.SEARCH_FUSION
+    if mode not in FUSION_MODES:
+        raise ValueError(f"Unknown SEARCH_FUSION: {mode} (expected one of {', '.join(FUSION_MODES)})")
+    return mode
+
+
+def rrf_scores(
+        legs: Dict[str, List[Hashable]],
+        rank_constant: Optional[int] = None,
+) -> Dict[Hashable, Tuple[float, Dict[str, int]]]:
+    """
+    legs: 每一路按相关度排好序的 key 列表。返回 key -> (RRF 分数, {leg: 1-based 名次})。
+    """
+    k = rank_constant or settings.SEARCH_RRF_RANK_CONSTANT
+    fused: Dict[Hashable, Tuple[float, Dict[str, int]]] = {}
+    for leg, keys in legs.items():
+        for rank, key in enumerate(keys, start=1):
+            score, ranks = fused.get(key, (0.0, {}))
+            if leg in ranks:
+                continue
+            ranks[leg] = rank
+            fused[key] = (score + 1.0 / (k + rank), ranks)
+    return fused
+
+
+def normalized_rrf_score(score: float, rank_constant: Optional[int] = None) -> float:
+    """
+    把 RRF 分数换算到「某一路第 1 名 = 1.0」的尺度（两路都第 1 名为 2.0），便于与 rerank 的加权项相加。
+    """
+    return score * ((rank_constant or settings.SEARCH_RRF_RANK_CONSTANT) + 1)
+
+
+def fuse_hits(
+        legs: Dict[str, List[Dict[str, Any]]],
+        size: int,
+        key: Callable[[Dict[str, Any]], Hashable] = lambda hit: hit["_id"],
+) -> List[Dict[str, Any]]:
+    """
+    对 ES 形状的多路命中做 RRF，返回前 size 条。同一 key 在多路出现时保留最先出现的那一路的 hit
+    （legs 的顺序即优先级，词法在前可以带上 highlight），原始分数与名次记录在 hit["_fusion"]。
+    """
+    first: Dict[Hashable, Dict[str, Any]] = {}
+    leg_scores: Dict[Hashable, Dict[str, float]] = {}
+    ranked: Dict[str, List[Hashable]] = {}
+    for leg, hits in legs.items():
+        ranked[leg] = []
+        for hit in hits:
+            hit_key = key(hit)
+            first.setdefault(hit_key, hit)
+            leg_scores.setdefault(hit_key, {}).setdefault(leg, float(hit.get("_score") or 0.0))
+            ranked[leg].append(hit_key)
+
+    fused = rrf_scores(ranked)
+    order = sorted(fused, key=lambda hit_key: fused[hit_key][0], reverse=True)[:size]
+    results = []
+    for hit_key in order:
+        score, ranks = fused[hit_key]
+        hit = dict(first[hit_key])
+        hit["_score"] = score
+        hit["_fusion"] = {
+            leg: {"rank": rank, "score": leg_scores[hit_key][leg]} for leg, rank in ranks.items()
+        }
+        results.append(hit)
+    return results
+
+
+class FusionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._searches: Dict[str, int] = {}
+        # (mode, leg) -> [次数, 总耗时 ms, 最大耗时 ms, 命中数]
+        self._legs: Dict[Tuple[str, str], List[float]] = {}
+        # mode -> {"lexical": n, "knn": n, "both": n}：返回结果由哪一路贡献
+        self._sources: Dict[str, Dict[str, int]] = {}
+
+    def record(self, mode: str, timings_ms: Dict[str, float], leg_hits: Dict[str, int],
+               fused: Optional[List[Dict[str, Any]]] = None) -> None:
+        with self._lock:
+            self._searches[mode] = self._searches.get(mode, 0) + 1
+            for leg, ms in timings_ms.items():
+                entry = self._legs.setdefault((mode, leg), [0, 0.0, 0.0, 0])
+                entry[0] += 1
+                entry[1] += ms
+                entry[2] = max(entry[2], ms)
+                entry[3] += leg_hits.get(leg, 0)
+            if fused:
+                sources = self._sources.setdefault(mode, {})
+                for hit in fused:
+                    legs = hit.get("_fusion") or {}
+                    name = "both" if len(legs) > 1 else next(iter(legs), "unknown")
+                    sources[name] = sources.get(name, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {}
+            for mode, searches in self._searches.items():
+                out[mode] = {"searches": searches, "legs": {}, "result_sources": dict(self._sources.get(mode, {}))}
+            for (mode, leg), (count, total, peak, hits) in self._legs.items():
+                out[mode]["legs"][leg] = {
+                    "count": int(count),
+                    "avg_ms": round(total / count, 2) if count else 0.0,
+                    "max_ms": round(peak, 2),
+                    "avg_hits": round(hits / count, 2) if count else 0.0,
+                }
+            return out
+
+
+fusion_stats = FusionStats()
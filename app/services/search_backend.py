@@ -0,0 +1,171 @@
+"""
+Pluggable search backend behind ensure_email_index / index_email_document / search_email_documents.
+- SEARCH_BACKEND=elasticsearch (default): search_index_es.ElasticsearchBackend.
+- SEARCH_BACKEND=local: search_index_local.LocalSearchBackend, in-process SQLite FTS5 (BM25) plus a
+  memory-mapped NumPy vector file per tenant. No network; meant for local runs, tests and small tenants.
+- Both return ES-shaped hits ({"_id", "_score", "_source"}) with the same filter semantics
+  (user_id, ts range, at least one keyword hit when keywords are given), so callers don't care which one runs.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+
+
+def build_email_document(
+        user_id: str,
+        email_id: int,
+        external_id: str,
+        thread_id: str,
+        chunk_id: int,
+        subject: str,
+        body_text: str,
+        sender: str,
+        recipients: str,
+        ts: datetime,
+        importance_score: float,
+        is_promotion: bool,
+        embedding: List[float],
+        labels: Optional[str] = None,
+        chunk_start: Optional[int] = None,
+        chunk_end: Optional[int] = None,
+) -> Dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "email_id": email_id,
+        "external_id": external_id,
+        "thread_id": thread_id,
+        "chunk_id": chunk_id,
+        "chunk_start": chunk_start,
+        "chunk_end": chunk_end,
+        "subject": subject,
+        "body_text": body_text,
+        "sender": sender,
+        "recipients": recipients,
+        "labels": (labels or "").split(",") if labels else [],
+        "ts": ts,
+        "is_promotion": bool(is_promotion),
+        "embedding": embedding,
+    }
+
+
+def document_id(user_id: str, email_id: int, chunk_id: int) -> str:
+    return f"{user_id}:{email_id}:{chunk_id}"
+
+
+def collapse_hits(hits: List[Dict[str, Any]], size: int, inner_size: int) -> List[Dict[str, Any]]:
+    """
+    在应用内按 email_id 折叠，结构与 ES collapse + inner_hits 相同（本地后端、ES rrf retriever 模式使用）。
+    """
+    # hits 已按分数排好序：每个 email_id 的第一条为最佳 chunk，前 inner_size 条放进 inner_hits
+    groups: Dict[int, List[Dict[str, Any]]] = {}
+    for hit in hits:
+        groups.setdefault(hit["_source"]["email_id"], []).append(hit)
+    collapsed = []
+    for chunks in list(groups.values())[:size]:
+        best = dict(chunks[0])
+        if inner_size > 1:
+            best["inner_hits"] = {"chunks": {"hits": {"hits": chunks[:inner_size]}}}
+        collapsed.append(best)
+    return collapsed
+
+
+class SearchBackend:
+    name: str
+
+    def ensure_index(self) -> None:
+        raise NotImplementedError
+
+    def bulk_indexer(self):
+        """
+        返回带 add(**fields) / flush() / close() 的批量写入器，可作为 context manager 使用。
+        """
+        raise NotImplementedError
+
+    def index_document(self, **fields: Any) -> None:
+        with self.bulk_indexer() as indexer:
+            indexer.add(**fields)
+
+    def search(
+            self,
+            user_id: str,
+            query_text: str,
+            query_embedding: List[float],
+            *,
+            date_start: Optional[datetime] = None,
+            date_end: Optional[datetime] = None,
+            keywords: Optional[List[str]] = None,
+            size: int = 50,
+            collapse: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        collapse=True 时每封邮件只返回一条最佳 chunk（共 size 封），同邮件的其它命中 chunk 放在
+        hit["inner_hits"]["chunks"]["hits"]["hits"]，与 ES collapse + inner_hits 的结构一致。
+        """
+        raise NotImplementedError
+
+    def min_score(self) -> float:
+        """
+        linear 融合下 ai_search 丢弃低相关命中的分数阈值；各后端的分数量级不同，由后端自己给出。
+        """
+        return settings.SEARCH_MIN_SCORE
+
+    async def search_async(self, user_id: str, query_text: str, query_embedding: List[float], **kwargs: Any) -> List[Dict[str, Any]]:
+        # 默认在线程里跑同步实现；有 async 客户端的后端可以覆盖
+        return await asyncio.to_thread(self.search, user_id, query_text, query_embedding, **kwargs)
+
+
+_backend: Optional[SearchBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend() -> SearchBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                kind = settings.SEARCH_BACKEND
+                if kind == "local":
+                    from app.services.search_index_local import LocalSearchBackend
+
+                    _backend = LocalSearchBackend(settings.LOCAL_INDEX_PATH)
+                elif kind == "elasticsearch":
+                    from app.services.search_index_es import ElasticsearchBackend
+
+                    _backend = ElasticsearchBackend()
+                else:
+                    raise ValueError(f"Unknown SEARCH_BACKEND: {kind} (expected elasticsearch | local)")
+    return _backend
+
+
+def linear_min_score() -> float:
+    return get_search_backend().min_score()
+
+
+def ensure_email_index() -> None:
+    get_search_backend().ensure_index()
+
+
+def index_email_document(**fields: Any) -> None:
+    """
+    写入一封邮件的一个 chunk，参数见 search_index_es.index_email_document。
+    """
+    get_search_backend().index_document(**fields)
+
+
+def bulk_indexer():
+    return get_search_backend().bulk_indexer()
+
+
+def search_email_documents(user_id: str, query_text: str, query_embedding: List[float], **kwargs: Any) -> List[Dict[str, Any]]:
+    return get_search_backend().search(user_id, query_text, query_embedding, **kwargs)
+
+
+async def search_email_documents_async(
+        user_id: str, query_text: str, query_embedding: List[float], **kwargs: Any
+) -> List[Dict[str, Any]]:
+    return await get_search_backend().search_async(user_id, query_text, query_embedding, **kwargs)
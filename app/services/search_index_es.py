@@ -1,35 +1,89 @@
 from __future__ import annotations
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import asyncio
+import json
+import time
 
-from elasticsearch import Elasticsearch
-from elasticsearch.exceptions import NotFoundError
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+from elasticsearch.exceptions import NotFoundError, TransportError
+from elasticsearch.helpers import streaming_bulk
 
 from app.config import settings
+from app.services import stage_timing
+from app.services.index_routing import IndexTarget, index_router
+from app.services.rank_fusion import fuse_hits, fusion_mode, fusion_stats
+from app.services.search_backend import SearchBackend, build_email_document, collapse_hits, document_id
 from app.services.text_normalization import to_simplified
 
 es = Elasticsearch(settings.ELASTICSEARCH_URL)
 
+_async_es: Optional[AsyncElasticsearch] = None
 
-def ensure_email_index():
+
+def get_async_es() -> AsyncElasticsearch:
     """
-    创建/更新 emails 索引，包含 dense_vector 和一些结构化字段。
+    async 请求路径使用的 ES 客户端；首次使用时在当前事件循环里创建。
+    走 httpx 传输（httpx 已是依赖，不需要额外安装 aiohttp）。
     """
-    index_name = settings.ELASTICSEARCH_INDEX_EMAILS
+    global _async_es
+    if _async_es is None:
+        _async_es = AsyncElasticsearch(settings.ELASTICSEARCH_URL, node_class="httpxasync")
+    return _async_es
 
-    # 简化：如果不存在就创建，存在则不动 mapping
-    if es.indices.exists(index=index_name):
-        return
 
-    body = {
+VECTOR_PROFILES = ("hnsw", "int8_hnsw", "int4_hnsw", "bbq_hnsw")
+
+
+def embedding_field_mapping(dims: Optional[int] = None, profile: Optional[str] = None) -> Dict[str, Any]:
+    """
+    embedding 字段的 mapping：dims 默认 settings.EMBED_DIM，profile 默认 settings.ES_VECTOR_PROFILE。
+    float32 每维 4 字节；int8_hnsw 约 1/4，int4_hnsw 约 1/8，bbq_hnsw 约 1/32（HNSW 图本身的开销另计）。
+    """
+    dims = dims or settings.EMBED_DIM
+    profile = (profile or settings.ES_VECTOR_PROFILE).lower()
+    if profile not in VECTOR_PROFILES:
+        raise ValueError(f"Unknown ES_VECTOR_PROFILE: {profile} (expected one of {', '.join(VECTOR_PROFILES)})")
+    if profile == "bbq_hnsw" and dims < 64:
+        raise ValueError("bbq_hnsw requires at least 64 dims")
+    if profile == "int4_hnsw" and dims % 2:
+        raise ValueError("int4_hnsw requires an even number of dims")
+    return {
+        "type": "dense_vector",
+        "dims": dims,
+        "index": True,
+        "similarity": "cosine",
+        "index_options": {"type": profile},
+    }
+
+
+def email_index_body(
+        dims: Optional[int] = None,
+        profile: Optional[str] = None,
+        shards: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    emails 索引的 settings + mappings；shards 默认 ES_INDEX_SHARDS（独立租户索引用 1）。
+    """
+    mappings: Dict[str, Any] = {}
+    if settings.ES_SOURCE_EXCLUDE_EMBEDDING:
+        # 向量只存在 HNSW / doc values 里，_source 不再保存整段向量；迁移脚本会按文本重新计算（多数命中 embedding 缓存）
+        mappings["_source"] = {"excludes": ["embedding"]}
+    return {
+        "settings": {"index": {"number_of_shards": shards or settings.ES_INDEX_SHARDS}},
         "mappings": {
+            **mappings,
             "properties": {
                 "user_id": {"type": "keyword"},
                 "email_id": {"type": "integer"},
                 "external_id": {"type": "keyword"},
                 "thread_id": {"type": "keyword"},
                 "chunk_id": {"type": "integer"},
+                # chunk 在原文 body_text 中的 [start, end) 偏移，只用于取 snippet
+                "chunk_start": {"type": "integer", "index": False},
+                "chunk_end": {"type": "integer", "index": False},
                 "subject": {"type": "text"},
                 "body_text": {"type": "text"},
                 "sender": {"type": "keyword"},
@@ -39,16 +93,72 @@ def ensure_email_index():
                 "importance_score": {"type": "float"},
                 "is_promotion": {"type": "boolean"},
                 # 向量字段
-                "embedding": {
-                    "type": "dense_vector",
-                    "dims": 3072,  # 对应 text-embedding-3-large 维度（如有变化需调整）
-                    "index": True,
-                    "similarity": "cosine",
-                },
+                "embedding": embedding_field_mapping(dims, profile),
             }
         },
     }
-    es.indices.create(index=index_name, body=body)
+
+
+def indexed_embedding_dims(index_name: Optional[str] = None) -> Optional[int]:
+    """
+    已有索引（或别名指向的索引）里 embedding 字段的维度；索引不存在时返回 None。
+    """
+    index_name = index_name or settings.ELASTICSEARCH_INDEX_EMAILS
+    try:
+        resp = es.indices.get_mapping(index=index_name)
+    except NotFoundError:
+        return None
+    for mapping in resp.body.values():
+        embedding = mapping.get("mappings", {}).get("properties", {}).get("embedding") or {}
+        if "dims" in embedding:
+            return int(embedding["dims"])
+    return None
+
+
+def restore_embeddings(docs: List[Dict[str, Any]], dims: Optional[int] = None) -> int:
+    """
+    迁移脚本拷贝文档前调用：把 embedding 就地转换为 dims 维。
+    维度更高的向量仅在 Matryoshka 模型（或 EMBED_SEND_DIMENSIONS）下本地截断；
+    其它模型的高维向量、_source 里没有向量（ES_SOURCE_EXCLUDE_EMBEDDING）、全 0 或维度不足的，
+    按索引时相同的 "subject\n\nbody_text" 文本重新计算。返回重新计算的条数。
+    """
+    from app.services.embeddings import embed_texts_batched, supports_truncation, truncate_embedding
+
+    dims = dims or settings.EMBED_DIM
+    can_truncate = supports_truncation()
+    to_embed = []
+    for doc in docs:
+        vec = doc.get("embedding") or []
+        if len(vec) == dims and any(vec):
+            continue
+        if len(vec) > dims and any(vec) and can_truncate:
+            doc["embedding"] = truncate_embedding(vec, dims)
+        else:
+            to_embed.append(doc)
+    if to_embed:
+        texts = [f"{d.get('subject') or ''}\n\n{d.get('body_text') or ''}" for d in to_embed]
+        for doc, vec in zip(to_embed, embed_texts_batched(texts)):
+            doc["embedding"] = vec
+    return len(to_embed)
+
+
+def ensure_email_index():
+    """
+    创建/更新 emails 索引，包含 dense_vector 和一些结构化字段。
+    """
+    index_name = settings.ELASTICSEARCH_INDEX_EMAILS
+
+    # 简化：如果不存在就创建，存在则不动 mapping（维度不一致时提示迁移）
+    if es.indices.exists(index=index_name):
+        dims = indexed_embedding_dims(index_name)
+        if dims is not None and dims != settings.EMBED_DIM:
+            print(
+                f"⚠️ ES index {index_name} has {dims}-dim embeddings but EMBED_DIM={settings.EMBED_DIM}; "
+                "run scripts/reindex_vectors.py to migrate"
+            )
+        return
+
+    es.indices.create(index=index_name, body=email_index_body())
 
 
 def index_email_document(
@@ -66,46 +176,168 @@ def index_email_document(
         is_promotion: bool,
         embedding: List[float],
         labels: Optional[str] = None,
+        chunk_start: Optional[int] = None,
+        chunk_end: Optional[int] = None,
 ) -> None:
     """
     将一封邮件的一个 chunk 写入 ES 索引。
     """
-    doc = {
-        "user_id": user_id,
-        "email_id": email_id,
-        "external_id": external_id,
-        "thread_id": thread_id,
-        "chunk_id": chunk_id,
-        "subject": subject,
-        "body_text": body_text,
-        "sender": sender,
-        "recipients": recipients,
-        "labels": (labels or "").split(",") if labels else [],
-        "ts": ts,
-        "is_promotion": bool(is_promotion),
-        "embedding": embedding,
-    }
-    index_name = settings.ELASTICSEARCH_INDEX_EMAILS
-    es.index(index=index_name, id=f"{user_id}:{email_id}:{chunk_id}", document=doc)
+    doc = build_email_document(
+        user_id=user_id,
+        email_id=email_id,
+        external_id=external_id,
+        thread_id=thread_id,
+        chunk_id=chunk_id,
+        subject=subject,
+        body_text=body_text,
+        sender=sender,
+        recipients=recipients,
+        ts=ts,
+        importance_score=importance_score,
+        is_promotion=is_promotion,
+        embedding=embedding,
+        labels=labels,
+        chunk_start=chunk_start,
+        chunk_end=chunk_end,
+    )
+    target = index_router.target(user_id)
+    es.index(index=target.index, id=document_id(user_id, email_id, chunk_id), document=doc, routing=target.routing)
 
 
-def search_email_documents(
-        user_id: str,
-        query_text: str,
-        query_embedding: List[float],
-        *,
-        date_start: Optional[datetime] = None,
-        date_end: Optional[datetime] = None,
-        keywords: Optional[List[str]] = None,
-        size: int = 50,
-) -> List[Dict[str, Any]]:
+class EmailBulkIndexer:
+    """
+    通过 _bulk API 批量写入 chunk 文档，替代逐条 es.index。
+    - 缓冲区达到 chunk_size 条或 max_bytes 字节时自动 flush
+    - 429 / 5xx 的失败条目由 streaming_bulk 按指数退避重试；整批请求的传输异常也会重试
+    - refresh 策略按批次生效（默认不 refresh），不会每条文档强制刷新
+    - 每条文档按 index_routing 写入共享索引（带 routing）或租户独立索引
 
-    index_name = settings.ELASTICSEARCH_INDEX_EMAILS
+    用法：
+        with EmailBulkIndexer() as indexer:
+            indexer.add(user_id=..., email_id=..., ...)
+    """
 
-    # Normalize to simplified Chinese so match queries ignore traditional/simplified differences.
-    query_text_s = to_simplified(query_text)
-    keywords_s = [to_simplified(k) for k in keywords] if keywords else []
+    RETRY_ON_STATUS = (429, 502, 503, 504)
+
+    def __init__(
+            self,
+            *,
+            chunk_size: Optional[int] = None,
+            max_bytes: Optional[int] = None,
+            max_retries: Optional[int] = None,
+            refresh: Optional[str] = None,
+    ):
+        self.chunk_size = chunk_size or settings.ES_BULK_CHUNK_SIZE
+        self.max_bytes = max_bytes or settings.ES_BULK_MAX_BYTES
+        self.max_retries = settings.ES_BULK_MAX_RETRIES if max_retries is None else max_retries
+        self.refresh = (refresh or settings.ES_BULK_REFRESH).lower()
+        self._actions: List[Dict[str, Any]] = []
+        self._pending_bytes = 0
+        self.indexed = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def __enter__(self) -> "EmailBulkIndexer":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        # 出现异常时也尽量把已缓冲的文档写出去，DB 侧是否提交由调用方决定
+        self.close()
+
+    def add(self, **fields: Any) -> None:
+        """
+        参数与 index_email_document 相同。
+        """
+        doc = build_email_document(**fields)
+        target = index_router.target(fields["user_id"])
+        action = {
+            "_op_type": "index",
+            "_index": target.index,
+            "_id": document_id(fields["user_id"], fields["email_id"], fields["chunk_id"]),
+            "_source": doc,
+        }
+        if target.routing:
+            action["routing"] = target.routing
+        self._actions.append(action)
+        self._pending_bytes += len(json.dumps(doc, default=str))
+        if len(self._actions) >= self.chunk_size or self._pending_bytes >= self.max_bytes:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._actions:
+            return
+        actions, self._actions, self._pending_bytes = self._actions, [], 0
+
+        refresh_param = self.refresh if self.refresh in ("true", "wait_for") else None
+        bulk_kwargs: Dict[str, Any] = {"refresh": refresh_param} if refresh_param else {}
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                failed = []
+                for ok, item in streaming_bulk(
+                        es,
+                        actions,
+                        chunk_size=self.chunk_size,
+                        max_chunk_bytes=self.max_bytes,
+                        raise_on_error=False,
+                        max_retries=self.max_retries,
+                        initial_backoff=1,
+                        retry_on_status=self.RETRY_ON_STATUS,
+                        yield_ok=False,
+                        **bulk_kwargs,
+                ):
+                    if not ok:
+                        failed.append(item)
+                break
+            except TransportError as e:
+                if attempt >= self.max_retries:
+                    raise
+                print(f"⚠️ ES bulk request error (attempt {attempt + 1}): {e!r}")
+                time.sleep(min(2 ** attempt, 30))
+
+        self.indexed += len(actions) - len(failed)
+        if failed:
+            print(f"⚠️ ES bulk indexing failed for {len(failed)} documents")
+            self.errors.extend(failed)
+
+    def close(self) -> None:
+        self.flush()
+
+
+# 检索只取调用方需要的字段：snippet 由 highlight 给出（或按 chunk 偏移从 DB 正文截取），不回传 embedding / 全文
+_HIT_SOURCE_FIELDS = ["email_id", "chunk_id", "chunk_start", "chunk_end"]
+_SEARCH_FILTER_PATH = ",".join(
+    [
+        "hits.hits._id",
+        "hits.hits._score",
+        "hits.hits._source",
+        "hits.hits.highlight",
+        "hits.hits.inner_hits.*.hits.hits._score",
+        "hits.hits.inner_hits.*.hits.hits._source",
+        "hits.hits.inner_hits.*.hits.hits.highlight",
+    ]
+)
+
+
+def _highlight(query: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    # 不加标签，fragment 就是 body_text 的原样子串，便于映射回 DB 里的原文
+    highlight: Dict[str, Any] = {
+        "pre_tags": [""],
+        "post_tags": [""],
+        "fields": {
+            "body_text": {
+                "type": "unified",
+                "fragment_size": settings.SEARCH_SNIPPET_CHARS,
+                "number_of_fragments": 1,
+            }
+        },
+    }
+    if query is not None:
+        # kNN / retriever 请求没有可供高亮的词法查询，显式指定
+        highlight["highlight_query"] = query
+    return highlight
 
+
+def _filters(user_id: str, date_start: Optional[datetime], date_end: Optional[datetime]) -> List[Dict[str, Any]]:
     filters: List[Dict[str, Any]] = [
         {"term": {"user_id": user_id}},
     ]
@@ -113,6 +345,13 @@ def search_email_documents(
         filters.append({"range": {"ts": {"gte": date_start.isoformat()}}})
     if date_end:
         filters.append({"range": {"ts": {"lte": date_end.isoformat()}}})
+    return filters
+
+
+def _lexical_query(query_text: str, keywords: Optional[List[str]], filters: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Normalize to simplified Chinese so match queries ignore traditional/simplified differences.
+    query_text_s = to_simplified(query_text)
+    keywords_s = [to_simplified(k) for k in keywords] if keywords else []
 
     # Lexical: require main query; optionally require at least one keyword hit to avoid off-topic matches.
     main_match = {
@@ -137,6 +376,50 @@ def search_email_documents(
             }
         )
 
+    return {
+        "bool": {
+            "filter": filters,
+            "must": [main_match],
+            "should": keyword_should,
+            # 如提供关键词，则至少命中一个，减少跑题结果。
+            "minimum_should_match": 1 if keyword_should else 0,
+        }
+    }
+
+
+def _collapse(collapse: bool) -> Optional[Dict[str, Any]]:
+    if not collapse:
+        return None
+    # 每封邮件只返回得分最高的 chunk；inner_hits 带回同一封邮件里其余命中的 chunk 作为备选 snippet
+    body: Dict[str, Any] = {"field": "email_id"}
+    if settings.SEARCH_ALTERNATIVE_SNIPPETS > 0:
+        body["inner_hits"] = {
+            "name": "chunks",
+            "size": settings.SEARCH_ALTERNATIVE_SNIPPETS + 1,
+            "sort": [{"_score": {"order": "desc"}}],
+            "_source": _HIT_SOURCE_FIELDS,
+        }
+        if settings.SEARCH_HIGHLIGHT:
+            body["inner_hits"]["highlight"] = _highlight()
+    return body
+
+
+def _build_search_body(
+        user_id: str,
+        query_text: str,
+        query_embedding: List[float],
+        *,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        keywords: Optional[List[str]] = None,
+        size: int = 50,
+        collapse: bool = False,
+) -> Dict[str, Any]:
+    """
+    SEARCH_FUSION=linear：一次查询里 BM25 与 kNN 按固定权重相加。
+    """
+    filters = _filters(user_id, date_start, date_end)
+
     lexical_boost = 0.65   # BM25 权重
     vector_boost = 0.35    # 向量权重
 
@@ -148,15 +431,7 @@ def search_email_documents(
         ],
         "query": {
             "function_score": {
-                "query": {
-                    "bool": {
-                        "filter": filters,
-                        "must": [main_match],
-                        "should": keyword_should,
-                        # 如提供关键词，则至少命中一个，减少跑题结果。
-                        "minimum_should_match": 1 if keyword_should else 0,
-                    }
-                },
+                "query": _lexical_query(query_text, keywords, filters),
                 "score_mode": "multiply",
                 "boost_mode": "multiply",
                 "boost": lexical_boost,
@@ -165,17 +440,271 @@ def search_email_documents(
         "knn": {
             "field": "embedding",
             "query_vector": query_embedding,
-            "k": size,
+            # 折叠时 k 按 chunk 计，多取一些才能凑够 size 封不同的邮件
+            "k": size * 3 if collapse else size,
             # 加大候选集合，避免向量召回过窄。
             "num_candidates": max(size * 5, 200),
             "filter": filters,
             "boost": vector_boost,        # 向量检索部分的权重
         },
     }
+    body["_source"] = _HIT_SOURCE_FIELDS
+    if settings.SEARCH_HIGHLIGHT:
+        body["highlight"] = _highlight()
+    if collapse:
+        body["collapse"] = _collapse(collapse)
+    return body
+
+
+def _knn_section(query_embedding: List[float], filters: List[Dict[str, Any]], k: int) -> Dict[str, Any]:
+    return {
+        "field": "embedding",
+        "query_vector": query_embedding,
+        "k": k,
+        "num_candidates": max(settings.SEARCH_KNN_NUM_CANDIDATES, k),
+        "filter": filters,
+    }
+
+
+def _build_rrf_body(
+        user_id: str,
+        query_text: str,
+        query_embedding: List[float],
+        *,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        keywords: Optional[List[str]] = None,
+        size: int = 50,
+        collapse: bool = False,
+) -> Dict[str, Any]:
+    """
+    SEARCH_FUSION=rrf：ES rrf retriever 融合 standard（BM25）与 knn 两路。
+    折叠时按 chunk 多取一些，由 collapse_hits 在应用内折叠。
+    """
+    filters = _filters(user_id, date_start, date_end)
+    lexical = _lexical_query(query_text, keywords, filters)
+    hits = size * 3 if collapse else size
+    body: Dict[str, Any] = {
+        "size": hits,
+        "retriever": {
+            "rrf": {
+                "retrievers": [
+                    {"standard": {"query": lexical}},
+                    {"knn": _knn_section(query_embedding, filters, max(settings.SEARCH_KNN_DEPTH, hits))},
+                ],
+                "rank_window_size": max(settings.SEARCH_LEXICAL_DEPTH, settings.SEARCH_KNN_DEPTH, hits),
+                "rank_constant": settings.SEARCH_RRF_RANK_CONSTANT,
+            }
+        },
+        "_source": _HIT_SOURCE_FIELDS,
+    }
+    if settings.SEARCH_HIGHLIGHT:
+        body["highlight"] = _highlight(lexical)
+    return body
+
+
+def _build_leg_bodies(
+        user_id: str,
+        query_text: str,
+        query_embedding: List[float],
+        *,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        keywords: Optional[List[str]] = None,
+        size: int = 50,
+        collapse: bool = False,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    SEARCH_FUSION=client_rrf：词法与 kNN 各一个请求，折叠时两路各自按 email_id 折叠。
+    dict 的顺序即 fuse_hits 的优先级：词法命中带 highlight，优先保留。
+    """
+    filters = _filters(user_id, date_start, date_end)
+    lexical = _lexical_query(query_text, keywords, filters)
+    lexical_depth = max(settings.SEARCH_LEXICAL_DEPTH, size)
+    knn_depth = max(settings.SEARCH_KNN_DEPTH, size)
+    legs: Dict[str, Dict[str, Any]] = {
+        "lexical": {
+            "size": lexical_depth,
+            "sort": [{"_score": {"order": "desc"}}, {"ts": {"order": "desc"}}],
+            "query": lexical,
+            "_source": _HIT_SOURCE_FIELDS,
+        },
+        "knn": {
+            "size": knn_depth,
+            "knn": _knn_section(query_embedding, filters, knn_depth * 3 if collapse else knn_depth),
+            "_source": _HIT_SOURCE_FIELDS,
+        },
+    }
+    if settings.SEARCH_HIGHLIGHT:
+        legs["lexical"]["highlight"] = _highlight()
+        legs["knn"]["highlight"] = _highlight(lexical)
+    if collapse:
+        for body in legs.values():
+            body["collapse"] = _collapse(collapse)
+    return legs
+
+
+def _search_plan(user_id: str, query_text: str, query_embedding: List[float], **kwargs: Any) -> Tuple[str, Dict[str, Dict[str, Any]]]:
+    """
+    返回 (融合模式, {leg 名: 请求体})；linear / rrf 只有一个请求。
+    """
+    mode = fusion_mode()
+    if mode == "client_rrf":
+        return mode, _build_leg_bodies(user_id, query_text, query_embedding, **kwargs)
+    if mode == "rrf":
+        return mode, {"rrf": _build_rrf_body(user_id, query_text, query_embedding, **kwargs)}
+    return mode, {"hybrid": _build_search_body(user_id, query_text, query_embedding, **kwargs)}
+
+
+def _fuse(
+        mode: str,
+        responses: Dict[str, Dict[str, Any]],
+        timings_ms: Dict[str, float],
+        size: int,
+        collapse: bool,
+) -> List[Dict[str, Any]]:
+    legs = {leg: resp.get("hits", {}).get("hits", []) for leg, resp in responses.items()}
+    if stage_timing.active():
+        for leg, ms in timings_ms.items():
+            stage_timing.record(f"search.{leg}", ms)
+        stage_timing.record_value("search_payload_bytes", sum(_payload_bytes(resp) for resp in responses.values()))
+    if mode == "client_rrf":
+        key = (lambda hit: hit["_source"]["email_id"]) if collapse else (lambda hit: hit["_id"])
+        hits = fuse_hits(legs, size, key=key)
+    else:
+        hits = next(iter(legs.values()), [])
+        if mode == "rrf" and collapse:
+            hits = collapse_hits(hits, size, settings.SEARCH_ALTERNATIVE_SNIPPETS + 1)
+    fusion_stats.record(mode, timings_ms, {leg: len(leg_hits) for leg, leg_hits in legs.items()}, hits)
+    return hits
+
+
+def _payload_bytes(resp: Any) -> int:
+    # 优先用响应头里的实际大小（压缩时为压缩后大小），没有时按序列化后的 JSON 估算
+    meta = getattr(resp, "meta", None)
+    length = meta.headers.get("content-length") if meta is not None else None
+    if length:
+        return int(length)
+    return len(json.dumps(getattr(resp, "body", resp), default=str))
+
+
+# client_rrf 的同步路径在线程里并发发出各路请求
+_leg_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="es-search-leg")
+
+
+def _timed_search(target: IndexTarget, body: Dict[str, Any]) -> Tuple[Dict[str, Any], float]:
+    start = time.perf_counter()
+    resp = es.search(index=target.index, body=body, routing=target.routing, filter_path=_SEARCH_FILTER_PATH)
+    return resp, (time.perf_counter() - start) * 1000.0
+
+
+async def _timed_search_async(target: IndexTarget, body: Dict[str, Any]) -> Tuple[Dict[str, Any], float]:
+    start = time.perf_counter()
+    resp = await get_async_es().search(
+        index=target.index, body=body, routing=target.routing, filter_path=_SEARCH_FILTER_PATH
+    )
+    return resp, (time.perf_counter() - start) * 1000.0
+
+
+def search_email_documents(
+        user_id: str,
+        query_text: str,
+        query_embedding: List[float],
+        *,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        keywords: Optional[List[str]] = None,
+        size: int = 50,
+        collapse: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    collapse=True 时按 email_id 折叠，返回 size 封不同的邮件（每封一条最佳 chunk，inner_hits 为同邮件的其它 chunk）。
+    融合方式见 SEARCH_FUSION / app/services/rank_fusion.py。
+    """
+    mode, bodies = _search_plan(
+        user_id,
+        query_text,
+        query_embedding,
+        date_start=date_start,
+        date_end=date_end,
+        keywords=keywords,
+        size=size,
+        collapse=collapse,
+    )
+    try:
+        target = index_router.target(user_id)
+        if len(bodies) == 1:
+            results = {leg: _timed_search(target, body) for leg, body in bodies.items()}
+        else:
+            futures = {leg: _leg_executor.submit(_timed_search, target, body) for leg, body in bodies.items()}
+            results = {leg: future.result() for leg, future in futures.items()}
+    except NotFoundError:
+        return []
 
+    return _fuse(
+        mode,
+        {leg: resp for leg, (resp, _) in results.items()},
+        {leg: ms for leg, (_, ms) in results.items()},
+        size,
+        collapse,
+    )
+
+
+async def search_email_documents_async(
+        user_id: str,
+        query_text: str,
+        query_embedding: List[float],
+        *,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        keywords: Optional[List[str]] = None,
+        size: int = 50,
+        collapse: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    collapse=True 时按 email_id 折叠，返回 size 封不同的邮件（每封一条最佳 chunk，inner_hits 为同邮件的其它 chunk）。
+    融合方式见 SEARCH_FUSION / app/services/rank_fusion.py。
+    """
+    mode, bodies = _search_plan(
+        user_id,
+        query_text,
+        query_embedding,
+        date_start=date_start,
+        date_end=date_end,
+        keywords=keywords,
+        size=size,
+        collapse=collapse,
+    )
     try:
-        resp = es.search(index=index_name, body=body)
+        target = await index_router.target_async(user_id)
+        legs = list(bodies)
+        results = dict(zip(legs, await asyncio.gather(*(_timed_search_async(target, bodies[leg]) for leg in legs))))
     except NotFoundError:
         return []
 
-    return resp.get("hits", {}).get("hits", [])
+    return _fuse(
+        mode,
+        {leg: resp for leg, (resp, _) in results.items()},
+        {leg: ms for leg, (_, ms) in results.items()},
+        size,
+        collapse,
+    )
+
+
+class ElasticsearchBackend(SearchBackend):
+    name = "elasticsearch"
+
+    def ensure_index(self) -> None:
+        ensure_email_index()
+
+    def bulk_indexer(self) -> EmailBulkIndexer:
+        return EmailBulkIndexer()
+
+    def index_document(self, **fields: Any) -> None:
+        index_email_document(**fields)
+
+    def search(self, user_id: str, query_text: str, query_embedding: List[float], **kwargs: Any) -> List[Dict[str, Any]]:
+        return search_email_documents(user_id, query_text, query_embedding, **kwargs)
+
+    async def search_async(self, user_id: str, query_text: str, query_embedding: List[float], **kwargs: Any) -> List[Dict[str, Any]]:
+        return await search_email_documents_async(user_id, query_text, query_embedding, **kwargs)
@@ -0,0 +1,356 @@
+"""
+In-process search backend (SEARCH_BACKEND=local), no Elasticsearch needed.
+- Lexical: SQLite FTS5 with bm25(subject=5, body_text=2). CJK characters are indexed as single-character
+  tokens, like the ES standard analyzer, and text is to_simplified-normalized on both sides.
+- Vectors: one float32 file per tenant (and per dimension) under LOCAL_INDEX_PATH/vectors, L2-normalized
+  and read through np.memmap, so cosine similarity is one matrix-vector product over the tenant's rows.
+- Hits mirror the ES hybrid query: 0.65 * BM25 + 0.35 * (1 + cosine) / 2, lexical matches must hit the
+  query (and at least one keyword when given), the top-`size` vector matches only need the user / ts filters.
+  With SEARCH_FUSION=rrf / client_rrf the two legs are fused by rank instead (app/services/rank_fusion.py).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.services import stage_timing
+from app.services.rank_fusion import fusion_mode, fusion_stats, rrf_scores
+from app.services.search_backend import SearchBackend, build_email_document, collapse_hits, document_id
+from app.services.text_normalization import to_simplified
+
+# 与 search_index_es._build_search_body 的权重一致
+_LEXICAL_BOOST = 0.65
+_VECTOR_BOOST = 0.35
+# FTS5 查询最多取这么多个不同的词，避免超长问题拖慢 MATCH
+_MAX_QUERY_TERMS = 64
+
+_CJK_CHAR = re.compile(r"([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff])")
+_TERM = re.compile(r"\w+")
+
+
+def _fts_text(text: str) -> str:
+    # CJK 逐字切开（与 ES standard analyzer 一致），其余交给 FTS5 的 unicode61 分词
+    return _CJK_CHAR.sub(r" \1 ", to_simplified(text or ""))
+
+
+def _match_expression(text: str) -> Optional[str]:
+    terms = list(dict.fromkeys(t.lower() for t in _TERM.findall(_fts_text(text))))[:_MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    # 每个词加引号，避免 AND / OR / NEAR 等被当成 FTS5 语法
+    return " OR ".join('"' + t.replace('"', '""') + '"' for t in terms)
+
+
+def _ts_value(ts: Any) -> Optional[str]:
+    if ts is None:
+        return None
+    return ts.isoformat() if isinstance(ts, datetime) else str(ts)
+
+
+class _TenantVectors:
+    """
+    单个租户的向量文件：按行追加 float32，读时用 memmap 映射成 (rows, dim) 矩阵。
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self._matrix: Optional[np.memmap] = None
+
+    @property
+    def rows(self) -> int:
+        try:
+            return os.path.getsize(self.path) // (self.dim * 4)
+        except FileNotFoundError:
+            return 0
+
+    def append(self, vectors: np.ndarray) -> int:
+        start = self.rows
+        with open(self.path, "ab") as f:
+            f.write(vectors.astype(np.float32).tobytes())
+        self._matrix = None
+        return start
+
+    def overwrite(self, row: int, vector: np.ndarray) -> None:
+        with open(self.path, "r+b") as f:
+            f.seek(row * self.dim * 4)
+            f.write(vector.astype(np.float32).tobytes())
+        self._matrix = None
+
+    def matrix(self) -> Optional[np.memmap]:
+        if self._matrix is None:
+            rows = self.rows
+            if rows == 0:
+                return None
+            self._matrix = np.memmap(self.path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._matrix
+
+
+def _normalize_rows(vectors: List[List[float]], dim: int) -> np.ndarray:
+    matrix = np.zeros((len(vectors), dim), dtype=np.float32)
+    for i, vec in enumerate(vectors):
+        if vec is not None and len(vec) == dim:
+            matrix[i] = vec
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    # 兜底的全 0 向量保持为 0，相似度恒为 0
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+class LocalSearchBackend(SearchBackend):
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = root
+        self.dim = settings.EMBED_DIM
+        os.makedirs(os.path.join(root, "vectors"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._tenants: Dict[Tuple[str, int], _TenantVectors] = {}
+        self.ensure_index()
+
+    def min_score(self) -> float:
+        return settings.LOCAL_SEARCH_MIN_SCORE
+
+    def ensure_index(self) -> None:
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " id INTEGER PRIMARY KEY,"
+                " doc_id TEXT NOT NULL UNIQUE,"
+                " user_id TEXT NOT NULL,"
+                " ts TEXT,"
+                " vec_dim INTEGER,"
+                " vec_row INTEGER,"
+                " source TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_chunks_user_ts ON chunks (user_id, ts)")
+            try:
+                self._conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(subject, body_text)"
+                )
+            except sqlite3.OperationalError as e:
+                raise RuntimeError(f"SEARCH_BACKEND=local needs SQLite built with FTS5: {e}") from e
+            self._conn.commit()
+
+    def _vectors(self, user_id: str) -> _TenantVectors:
+        key = (user_id, self.dim)
+        tenant = self._tenants.get(key)
+        if tenant is None:
+            name = hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:20]
+            tenant = _TenantVectors(os.path.join(self.root, "vectors", f"{name}.{self.dim}.f32"), self.dim)
+            self._tenants[key] = tenant
+        return tenant
+
+    def bulk_indexer(self) -> "LocalBulkIndexer":
+        return LocalBulkIndexer(self)
+
+    def write_documents(self, docs: List[Dict[str, Any]]) -> int:
+        """
+        写入一批 build_email_document() 生成的文档；同一 doc_id 再次写入时覆盖。
+        """
+        by_user: Dict[str, List[Dict[str, Any]]] = {}
+        for doc in docs:
+            by_user.setdefault(doc["user_id"], []).append(doc)
+
+        with self._lock:
+            for user_id, user_docs in by_user.items():
+                tenant = self._vectors(user_id)
+                vectors = _normalize_rows([d.get("embedding") for d in user_docs], self.dim)
+                ids = [document_id(user_id, d["email_id"], d["chunk_id"]) for d in user_docs]
+                existing = dict(
+                    self._conn.execute(
+                        f"SELECT doc_id, vec_row FROM chunks WHERE vec_dim = ? AND doc_id IN ({','.join('?' * len(ids))})",
+                        [self.dim, *ids],
+                    ).fetchall()
+                )
+                new_positions = [i for i, doc_id in enumerate(ids) if doc_id not in existing]
+                next_row = tenant.append(vectors[new_positions]) if new_positions else tenant.rows
+                rows: Dict[str, int] = {}
+                for i in new_positions:
+                    rows[ids[i]] = next_row
+                    next_row += 1
+                for i, doc_id in enumerate(ids):
+                    if doc_id in existing:
+                        tenant.overwrite(existing[doc_id], vectors[i])
+                        rows[doc_id] = existing[doc_id]
+
+                for doc_id, doc in zip(ids, user_docs):
+                    source = {k: v for k, v in doc.items() if k != "embedding"}
+                    source["ts"] = _ts_value(doc.get("ts"))
+                    old = self._conn.execute("SELECT id FROM chunks WHERE doc_id = ?", (doc_id,)).fetchone()
+                    if old:
+                        self._conn.execute("DELETE FROM chunks_fts WHERE rowid = ?", (old[0],))
+                        self._conn.execute("DELETE FROM chunks WHERE id = ?", (old[0],))
+                    cur = self._conn.execute(
+                        "INSERT INTO chunks (doc_id, user_id, ts, vec_dim, vec_row, source) VALUES (?, ?, ?, ?, ?, ?)",
+                        (doc_id, user_id, source["ts"], self.dim, rows[doc_id], json.dumps(source, ensure_ascii=False)),
+                    )
+                    self._conn.execute(
+                        "INSERT INTO chunks_fts (rowid, subject, body_text) VALUES (?, ?, ?)",
+                        (cur.lastrowid, _fts_text(doc.get("subject")), _fts_text(doc.get("body_text"))),
+                    )
+            self._conn.commit()
+        return len(docs)
+
+    def _filter_sql(self, user_id: str, date_start: Optional[datetime], date_end: Optional[datetime]) -> Tuple[str, list]:
+        clauses, params = ["c.user_id = ?"], [user_id]
+        if date_start:
+            clauses.append("c.ts >= ?")
+            params.append(date_start.isoformat())
+        if date_end:
+            clauses.append("c.ts <= ?")
+            params.append(date_end.isoformat())
+        return " AND ".join(clauses), params
+
+    def _lexical(self, expression: str, where: str, params: list, limit: int) -> Dict[int, float]:
+        # FTS5 的 bm25() 越小越相关，取负数得到与 Lucene BM25 同方向、同量级的分数
+        rows = self._conn.execute(
+            "SELECT c.id, -bm25(chunks_fts, 5.0, 2.0) FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid"
+            f" WHERE chunks_fts MATCH ? AND {where} ORDER BY bm25(chunks_fts, 5.0, 2.0) LIMIT ?",
+            [expression, *params, limit],
+        ).fetchall()
+        return {row_id: float(score) for row_id, score in rows}
+
+    def _vector(self, user_id: str, query_embedding: List[float], where: str, params: list, k: int) -> Dict[int, float]:
+        tenant = self._vectors(user_id)
+        matrix = tenant.matrix()
+        if matrix is None or len(query_embedding) != self.dim:
+            return {}
+        rows = self._conn.execute(
+            f"SELECT c.id, c.vec_row FROM chunks c WHERE {where} AND c.vec_dim = ?", [*params, self.dim]
+        ).fetchall()
+        rows = [(row_id, vec_row) for row_id, vec_row in rows if vec_row < matrix.shape[0]]
+        if not rows:
+            return {}
+        query = _normalize_rows([query_embedding], self.dim)[0]
+        sims = matrix[np.fromiter((r for _, r in rows), dtype=np.int64, count=len(rows))] @ query
+        top = np.argsort(-sims)[:k]
+        return {rows[i][0]: (1.0 + float(sims[i])) / 2.0 for i in top}
+
+    def search(
+            self,
+            user_id: str,
+            query_text: str,
+            query_embedding: List[float],
+            *,
+            date_start: Optional[datetime] = None,
+            date_end: Optional[datetime] = None,
+            keywords: Optional[List[str]] = None,
+            size: int = 50,
+            collapse: bool = False,
+    ) -> List[Dict[str, Any]]:
+        where, params = self._filter_sql(user_id, date_start, date_end)
+        mode = fusion_mode()
+        rrf = mode != "linear"
+        if rrf:
+            lexical_limit = max(settings.SEARCH_LEXICAL_DEPTH, size)
+            vector_k = max(settings.SEARCH_KNN_DEPTH, size)
+        else:
+            # 词法候选取多一些，再与关键词 / 向量结果合并
+            lexical_limit = max(size * 5, 200)
+            vector_k = size
+        # 与 ES 一致：折叠时向量部分按 chunk 多取一些
+        if collapse:
+            vector_k *= 3
+        timings: Dict[str, float] = {}
+        with self._lock:
+            lexical: Dict[int, float] = {}
+            expression = _match_expression(query_text)
+            if expression:
+                keyword_expression = _match_expression(" ".join(keywords or []))
+                if keyword_expression:
+                    # 与 ES 的 minimum_should_match=1 一致：给了关键词就至少命中一个，关键词的 BM25 一并计分
+                    expression = f"({expression}) AND ({keyword_expression})"
+                start = time.perf_counter()
+                lexical = self._lexical(expression, where, params, lexical_limit)
+                timings["lexical"] = (time.perf_counter() - start) * 1000.0
+            start = time.perf_counter()
+            vector = self._vector(user_id, query_embedding, where, params, vector_k)
+            timings["knn"] = (time.perf_counter() - start) * 1000.0
+
+            scores: Dict[int, float] = {}
+            ranks: Dict[int, Dict[str, int]] = {}
+            if rrf:
+                # 两个 dict 都按相关度插入，顺序即名次
+                for row_id, (score, leg_ranks) in rrf_scores({"lexical": list(lexical), "knn": list(vector)}).items():
+                    scores[row_id] = score
+                    ranks[row_id] = leg_ranks
+            else:
+                for row_id, score in lexical.items():
+                    scores[row_id] = _LEXICAL_BOOST * score
+                for row_id, score in vector.items():
+                    scores[row_id] = scores.get(row_id, 0.0) + _VECTOR_BOOST * score
+            if not scores:
+                fusion_stats.record(mode, timings, {"lexical": 0, "knn": 0})
+                return []
+            ids = list(scores)
+            rows = self._conn.execute(
+                f"SELECT id, doc_id, ts, source FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+
+        # 与 ES 的排序一致：分数降序，同分按时间降序
+        rows.sort(key=lambda r: r[2] or "", reverse=True)
+        rows.sort(key=lambda r: scores[r[0]], reverse=True)
+        hits = []
+        for row_id, doc_id, _, source in rows:
+            hit = {"_id": doc_id, "_score": scores[row_id], "_source": json.loads(source)}
+            if rrf:
+                leg_scores = {"lexical": lexical.get(row_id), "knn": vector.get(row_id)}
+                hit["_fusion"] = {leg: {"rank": rank, "score": leg_scores[leg]} for leg, rank in ranks[row_id].items()}
+            hits.append(hit)
+        if collapse:
+            hits = collapse_hits(hits, size, settings.SEARCH_ALTERNATIVE_SNIPPETS + 1)
+        else:
+            hits = hits[:size]
+        fusion_stats.record(mode, timings, {"lexical": len(lexical), "knn": len(vector)}, hits if rrf else None)
+        if stage_timing.active():
+            for leg, ms in timings.items():
+                stage_timing.record(f"search.{leg}", ms)
+            # 没有网络传输，按返回给调用方的 JSON 大小计，便于与 ES 对比
+            stage_timing.record_value("search_payload_bytes", len(json.dumps(hits, default=str)))
+        return hits
+
+
+class LocalBulkIndexer:
+    """
+    与 EmailBulkIndexer 相同的用法（add / flush / close，可作 context manager）。
+    """
+
+    def __init__(self, backend: LocalSearchBackend, chunk_size: Optional[int] = None):
+        self.backend = backend
+        self.chunk_size = chunk_size or settings.ES_BULK_CHUNK_SIZE
+        self._docs: List[Dict[str, Any]] = []
+        self.indexed = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def __enter__(self) -> "LocalBulkIndexer":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def add(self, **fields: Any) -> None:
+        self._docs.append(build_email_document(**fields))
+        if len(self._docs) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._docs:
+            return
+        docs, self._docs = self._docs, []
+        self.indexed += self.backend.write_documents(docs)
+
+    def close(self) -> None:
+        self.flush()
@@ -0,0 +1,108 @@
+"""
+Per-request stage timings (pick_tools / ai_search / answer_completion, query_understand / search / rerank ...).
+- `with stage("name"):` adds the block's wall time to the collector active in the current context.
+  The collector lives in a ContextVar, so it follows asyncio tasks and asyncio.to_thread; code running
+  in plain executor threads reports through record() from the calling thread instead.
+- Without an active collector a stage costs one ContextVar lookup.
+- collect_stages() opens a collector; used by scripts/benchmark_retrieval.py.
+- ServerTimingMiddleware (SERVER_TIMING_ENABLED) opens one per HTTP request and reports the stages finished
+  before the response starts in a Server-Timing header (scripts/load_test.py reads it).
+"""
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+
+class StageTimings:
+    def __init__(self):
+        # 同步工具在各自线程里（copy_context）向同一个对象写入
+        self._lock = threading.Lock()
+        # 阶段名 -> 累计耗时（毫秒）；同一阶段多次进入时累加
+        self.ms: Dict[str, float] = {}
+        # 非耗时的度量，例如检索响应字节数
+        self.values: Dict[str, float] = {}
+
+    def add(self, name: str, ms: float) -> None:
+        with self._lock:
+            self.ms[name] = self.ms.get(name, 0.0) + ms
+
+    def add_value(self, name: str, value: float) -> None:
+        with self._lock:
+            self.values[name] = self.values.get(name, 0.0) + value
+
+    def server_timing(self) -> str:
+        with self._lock:
+            items = list(self.ms.items())
+        return ", ".join(f"{name};dur={ms:.1f}" for name, ms in items)
+
+
+_current: ContextVar[Optional[StageTimings]] = ContextVar("stage_timings", default=None)
+
+
+def active() -> bool:
+    return _current.get() is not None
+
+
+@contextmanager
+def collect_stages() -> Iterator[StageTimings]:
+    timings = StageTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, (time.perf_counter() - start) * 1000.0)
+
+
+def record(name: str, ms: float) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, ms)
+
+
+def record_value(name: str, value: float) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.add_value(name, value)
+
+
+class ServerTimingMiddleware:
+    """
+    纯 ASGI 中间件：在 http.response.start 时把已完成阶段的耗时与 total 写进 Server-Timing 响应头。
+    流式响应在生成回答之前就发出响应头，只包含检索阶段。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        with collect_stages() as timings:
+            async def send_with_timing(message):
+                if message["type"] == "http.response.start":
+                    total = f"total;dur={(time.perf_counter() - start) * 1000.0:.1f}"
+                    value = ", ".join(filter(None, [timings.server_timing(), total]))
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", value.encode("latin-1"))]}
+                await send(message)
+
+            await self.app(scope, receive, send_with_timing)
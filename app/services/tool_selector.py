@@ -1,5 +1,5 @@
-from typing import List, Dict, Any
-from app.services.llm_provider import chat_completion
+from typing import List, Dict, Any, Tuple
+from app.services.llm_provider import chat_completion, chat_completion_async
 from app.tools.base import ToolContext
 from app.tools import CurrentThreadTool, EmailHistoryTool, CalendarTool, ComposeTool
 from sqlalchemy.orm import Session
@@ -30,7 +30,7 @@ TOOLS_DEF = [
 ]
 
 
-def pick_tools(ctx: ToolContext) -> List[str]:
+def _pick_tools_prompts(ctx: ToolContext) -> Tuple[str, str]:
     system_prompt = (
         "You are a tool selector for an email AI assistant. "
         "Given the user's question and context, choose which tools are needed. "
@@ -43,8 +43,10 @@ def pick_tools(ctx: ToolContext) -> List[str]:
         f"Question: {ctx.question}\n"
         f"Current thread id: {ctx.current_thread_id}{history_block}"
     )
+    return system_prompt, user_prompt
+
 
-    msg = chat_completion(system_prompt, user_prompt, tools=TOOLS_DEF)
+def _selected_tools_from_message(ctx: ToolContext, msg: Dict[str, Any]) -> List[str]:
     tool_calls = msg.get("tool_calls")
 
     def needs_current_thread(question: str) -> bool:
@@ -78,6 +80,29 @@ def pick_tools(ctx: ToolContext) -> List[str]:
     return ensure_current_thread(["EmailHistory"])
 
 
+def pick_tools(ctx: ToolContext) -> List[str]:
+    msg = chat_completion(*_pick_tools_prompts(ctx), tools=TOOLS_DEF)
+    return _selected_tools_from_message(ctx, msg)
+
+
+async def pick_tools_async(ctx: ToolContext) -> List[str]:
+    msg = await chat_completion_async(*_pick_tools_prompts(ctx), tools=TOOLS_DEF)
+    return _selected_tools_from_message(ctx, msg)
+
+
+TOOL_CLASSES = {
+    "CurrentThread": CurrentThreadTool,
+    "EmailHistory": EmailHistoryTool,
+    "Calendar": CalendarTool,
+    "Compose": ComposeTool,
+}
+
+
+def tool_timeout(name: str, default: float) -> float:
+    tool_cls = TOOL_CLASSES.get(name)
+    return (tool_cls.timeout if tool_cls else None) or default
+
+
 def instantiate_tools(db: Session, tool_names: List[str]):
     mapping = {
         "CurrentThread": lambda: CurrentThreadTool(db),
@@ -1,4 +1,5 @@
 from __future__ import annotations
+import asyncio
 from dataclasses import dataclass
 from typing import Any, Dict, List, Optional
 
@@ -21,6 +22,12 @@ class ToolResult:
 
 class BaseTool:
     name: str
+    # 单个工具的超时（秒）；None 时使用 settings.TOOL_TIMEOUT_SECONDS
+    timeout: Optional[float] = None
 
     def run(self, ctx: ToolContext) -> ToolResult:
         raise NotImplementedError
+
+    async def arun(self, ctx: ToolContext) -> ToolResult:
+        # 默认在线程里跑同步实现；有 async I/O 的工具可以覆盖
+        return await asyncio.to_thread(self.run, ctx)
@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
 from app.tools.base import BaseTool, ToolContext, ToolResult
-from app.services.ai_search import ai_search
+from app.services.ai_search import ai_search, ai_search_async
+from app.services.stage_timing import stage
 
 
 class EmailHistoryTool(BaseTool):
@@ -10,13 +11,28 @@ class EmailHistoryTool(BaseTool):
         self.db = db
 
     def run(self, ctx: ToolContext) -> ToolResult:
-        fragments = ai_search(
-            self.db,
-            ctx.user_id,
-            ctx.question,
-            current_thread_text=None,
-            chat_history=ctx.chat_history,
-        )
+        with stage("ai_search"):
+            fragments = ai_search(
+                self.db,
+                ctx.user_id,
+                ctx.question,
+                current_thread_text=None,
+                chat_history=ctx.chat_history,
+            )
+        return self._result_from_fragments(fragments)
+
+    async def arun(self, ctx: ToolContext) -> ToolResult:
+        with stage("ai_search"):
+            fragments = await ai_search_async(
+                self.db,
+                ctx.user_id,
+                ctx.question,
+                current_thread_text=None,
+                chat_history=ctx.chat_history,
+            )
+        return self._result_from_fragments(fragments)
+
+    def _result_from_fragments(self, fragments) -> ToolResult:
         if not fragments:
             return ToolResult(name=self.name, content="", metadata={"matches": []})
 
@@ -26,6 +42,8 @@ class EmailHistoryTool(BaseTool):
             header = f"From: {f.email.sender} | Subject: {f.email.subject} | Date: {f.email.ts.isoformat()}"
             content_parts.append(header)
             content_parts.append(f"Snippet: {f.snippet}")
+            for alt in f.alternative_snippets:
+                content_parts.append(f"Also: {alt}")
             content_parts.append("-" * 40)
             meta_matches.append(
                 {
@@ -0,0 +1,329 @@
+"""
+Offline retrieval benchmark over mock_email.json, optionally scaled up with synthetic emails.
+
+    SEARCH_BACKEND=local EMBED_DIM=256 python scripts/benchmark_retrieval.py --scale 10000 --output runs/local_10k.json
+    SEARCH_BACKEND=local EMBED_DIM=256 SEARCH_FUSION=client_rrf python scripts/benchmark_retrieval.py --skip-ingest --baseline runs/local_10k.json
+
+- LLM and embedding calls go to deterministic in-process stand-ins (scripts/fake_upstreams.py), so runs are
+  repeatable and measure our own code plus the search backend. Lower EMBED_DIM for large --scale runs.
+- The corpus is loaded into a separate database / index: DATABASE_URL and LOCAL_INDEX_PATH default to --workdir,
+  ELASTICSEARCH_INDEX_EMAILS to "emails_ai_benchmark". --skip-ingest reuses a previous load.
+- Replays the labeled queries (--queries: user_id, question, relevant external_ids) through ai_search
+  (--target ai_search) or straight through search_email_documents (--target search).
+- Reports p50/p95/p99 per stage (app/services/stage_timing.py), recall@k, MRR and search payload bytes, and
+  writes them with the effective search settings to a JSON file; --baseline prints the deltas to an earlier run.
+- The ai_search relevance cutoff follows the backend (SEARCH_MIN_SCORE for Elasticsearch, LOCAL_SEARCH_MIN_SCORE
+  for the local backend), so ai_search results are comparable across backends without extra settings.
+"""
+import sys
+import os
+import json
+import logging
+import argparse
+import itertools
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+# Add the project root to sys.path to allow importing app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+# 桩上游的每个请求都会被 httpx 记一条 INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+# 对比两次运行时关注的设置
+_SETTINGS_KEYS = [
+    "SEARCH_BACKEND",
+    "SEARCH_FUSION",
+    "SEARCH_COLLAPSE",
+    "SEARCH_HIGHLIGHT",
+    "SEARCH_LEXICAL_DEPTH",
+    "SEARCH_KNN_DEPTH",
+    "SEARCH_KNN_NUM_CANDIDATES",
+    "SEARCH_RRF_RANK_CONSTANT",
+    "SEARCH_MIN_SCORE",
+    "LOCAL_SEARCH_MIN_SCORE",
+    "SEARCH_RRF_MIN_SCORE",
+    "EMBED_DIM",
+    "ES_VECTOR_PROFILE",
+    "ES_ROUTING_ENABLED",
+    "CHUNK_MAX_TOKENS",
+    "CHUNK_OVERLAP_TOKENS",
+]
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark retrieval latency and quality with stubbed LLM / embeddings.")
+    parser.add_argument("--corpus", default=os.path.join(PROJECT_ROOT, "mock_email.json"), help="Mock email JSON file")
+    parser.add_argument("--queries", default=os.path.join(SCRIPT_DIR, "benchmark_queries.json"), help="Labeled query set")
+    parser.add_argument("--scale", type=int, default=0, help="Synthetic emails added on top of the corpus (e.g. 10000-1000000)")
+    parser.add_argument("--tenants", type=int, default=1, help="Spread synthetic emails over this many tenants (the first is the corpus user)")
+    parser.add_argument("--seed", type=int, default=13, help="Seed for the synthetic corpus")
+    parser.add_argument("--ingest-batch", type=int, default=500, help="Emails per ingest_emails call")
+    parser.add_argument("--skip-ingest", action="store_true", help="Reuse the database / index loaded by a previous run")
+    parser.add_argument("--workdir", default=os.path.join(PROJECT_ROOT, "benchmark_data"), help="Database, local index and results")
+    parser.add_argument("--target", choices=["ai_search", "search"], default="ai_search", help="Entry point to replay queries through")
+    parser.add_argument("--max-results", type=int, default=20, help="Results per query")
+    parser.add_argument("--k", default="1,5,10,20", help="Comma-separated cutoffs for recall@k")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes over the query set")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed passes before measuring")
+    parser.add_argument("--output", help="Result JSON path (default: <workdir>/results/<backend>_<fusion>_<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier result JSON to compare against")
+    return parser.parse_args()
+
+
+def _configure_env(args: argparse.Namespace) -> None:
+    # 必须在导入 app 之前设置：settings 在导入时读取环境变量
+    os.makedirs(args.workdir, exist_ok=True)
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(os.path.abspath(args.workdir), 'benchmark.db')}")
+    os.environ.setdefault("LOCAL_INDEX_PATH", os.path.join(args.workdir, "local_index"))
+    os.environ.setdefault("ELASTICSEARCH_INDEX_EMAILS", "emails_ai_benchmark")
+    # 缓存会让重复查询只测到缓存命中；需要时可显式打开
+    os.environ.setdefault("EMBED_CACHE_ENABLED", "false")
+    os.environ.setdefault("LLM_CACHE_BACKEND", "none")
+    os.environ.setdefault("INGESTION_WORKERS", "0")
+
+
+def _synthetic_emails(corpus: List[dict], count: int, tenants: int, seed: int) -> Iterator[dict]:
+    """
+    用语料里的主题与段落随机拼出干扰邮件：词汇与真实邮件重叠，但不会与任何标注结果完全相同。
+    """
+    rng = random.Random(seed)
+    subjects = [raw.get("subject") or "" for raw in corpus]
+    paragraphs = [p.strip() for raw in corpus for p in (raw.get("body_text") or "").split("\n\n") if p.strip()]
+    users = [corpus[0]["user_id"]] + [f"bench_tenant_{i:03d}" for i in range(1, max(tenants, 1))]
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        body = "\n\n".join(rng.sample(paragraphs, k=min(len(paragraphs), rng.randint(2, 5))))
+        yield {
+            "user_id": users[i % len(users)],
+            "external_id": f"syn_{i:07d}",
+            "thread_id": f"syn_thread_{i // 3:07d}",
+            "subject": f"{rng.choice(subjects)} ({i})",
+            "sender": f"sender{rng.randint(1, 500)}@example.com",
+            "recipients": "bob@example.com",
+            "body_text": body,
+            "labels": "INBOX",
+            "ts": (start + timedelta(minutes=7 * i)).isoformat(),
+            "importance_score": round(rng.random(), 2),
+            "is_promotion": int(rng.random() < 0.2),
+        }
+
+
+def _ingest(corpus: List[dict], args: argparse.Namespace) -> Dict[str, Any]:
+    from app.db.models import Base
+    from app.db.session import SessionLocal, engine
+    from app.services.email_ingest import ingest_emails
+    from ingest_mock_emails import _to_ingest_item
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    start = time.perf_counter()
+    ingested = 0
+    pending: Dict[str, list] = defaultdict(list)
+
+    def flush(user_id: str) -> None:
+        nonlocal ingested
+        ingested += ingest_emails(db, user_id, pending.pop(user_id))
+
+    try:
+        for raw in itertools.chain(corpus, _synthetic_emails(corpus, args.scale, args.tenants, args.seed)):
+            pending[raw["user_id"]].append(_to_ingest_item(raw))
+            if len(pending[raw["user_id"]]) >= args.ingest_batch:
+                flush(raw["user_id"])
+                if ingested and ingested % 10000 < args.ingest_batch:
+                    logger.info(f"Ingested {ingested} emails...")
+        for user_id in list(pending):
+            flush(user_id)
+    finally:
+        db.close()
+
+    from app.config import settings
+
+    if settings.SEARCH_BACKEND == "elasticsearch":
+        from app.services.search_index_es import es
+
+        es.indices.refresh(index=settings.ELASTICSEARCH_INDEX_EMAILS)
+    seconds = time.perf_counter() - start
+    logger.info(f"Ingested {ingested} new emails in {seconds:.1f}s")
+    return {"emails": len(corpus) + args.scale, "ingested": ingested, "ingest_seconds": round(seconds, 2)}
+
+
+def _ranked_external_ids(db, query: dict, target: str, max_results: int) -> List[str]:
+    from app.config import settings
+    from app.db import models
+    from app.services.ai_search import ai_search
+    from app.services.embeddings import embed_text
+    from app.services.search_backend import search_email_documents
+    from app.services.stage_timing import stage
+
+    if target == "ai_search":
+        fragments = ai_search(db, query["user_id"], query["question"], max_results=max_results)
+        return [fragment.email.external_id for fragment in fragments]
+
+    with stage("embed_query"):
+        query_vec = embed_text(query["question"])
+    with stage("search"):
+        hits = search_email_documents(
+            query["user_id"], query["question"], query_vec, size=max_results, collapse=settings.SEARCH_COLLAPSE
+        )
+    email_ids = list(dict.fromkeys(hit["_source"]["email_id"] for hit in hits))
+    rows = db.query(models.Email.id, models.Email.external_id).filter(models.Email.id.in_(email_ids)).all()
+    id2external = dict(rows)
+    return [id2external[i] for i in email_ids if i in id2external]
+
+
+def _quality(ranked: List[str], relevant: List[str], ks: List[int]) -> Dict[str, float]:
+    relevant_set = set(relevant)
+    metrics = {f"recall@{k}": len(relevant_set & set(ranked[:k])) / len(relevant_set) for k in ks}
+    first = next((rank for rank, external_id in enumerate(ranked, start=1) if external_id in relevant_set), None)
+    metrics["mrr"] = 1.0 / first if first else 0.0
+    return metrics
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    arr = np.asarray(values, dtype=np.float64)
+    return {
+        "count": len(values),
+        "mean": round(float(arr.mean()), 3),
+        "p50": round(float(np.percentile(arr, 50)), 3),
+        "p95": round(float(np.percentile(arr, 95)), 3),
+        "p99": round(float(np.percentile(arr, 99)), 3),
+        "max": round(float(arr.max()), 3),
+    }
+
+
+def _replay(queries: List[dict], args: argparse.Namespace, ks: List[int]) -> Dict[str, Any]:
+    from app.db.session import SessionLocal
+    from app.services.stage_timing import collect_stages
+
+    db = SessionLocal()
+    stage_ms: Dict[str, List[float]] = defaultdict(list)
+    payload_bytes: List[float] = []
+    per_query: List[Dict[str, Any]] = []
+    try:
+        for _ in range(args.warmup):
+            for query in queries:
+                _ranked_external_ids(db, query, args.target, args.max_results)
+        for rep in range(args.repeat):
+            for query in queries:
+                with collect_stages() as timings:
+                    start = time.perf_counter()
+                    ranked = _ranked_external_ids(db, query, args.target, args.max_results)
+                    timings.add("total", (time.perf_counter() - start) * 1000.0)
+                for name, ms in timings.ms.items():
+                    stage_ms[name].append(ms)
+                payload_bytes.append(timings.values.get("search_payload_bytes", 0.0))
+                if rep == 0:
+                    # 检索结果是确定的，质量指标只需算一遍
+                    per_query.append(
+                        {
+                            "question": query["question"],
+                            "relevant": query["relevant"],
+                            "ranked": ranked[:max(ks)],
+                            **_quality(ranked, query["relevant"], ks),
+                        }
+                    )
+    finally:
+        db.close()
+
+    metric_names = [f"recall@{k}" for k in ks] + ["mrr"]
+    return {
+        "latency_ms": {name: _percentiles(values) for name, values in sorted(stage_ms.items())},
+        "quality": {name: round(float(np.mean([q[name] for q in per_query])), 4) for name in metric_names},
+        "search_payload_bytes": _percentiles(payload_bytes),
+        "per_query": per_query,
+    }
+
+
+def _compare(result: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    def delta(new: Optional[float], old: Optional[float]) -> str:
+        if new is None or old is None:
+            return "n/a"
+        if not old:
+            return f"{new - old:+.3f}"
+        return f"{new - old:+.3f} ({(new - old) / old * 100:+.1f}%)"
+
+    logger.info(f"Compared with {baseline.get('timestamp')} ({baseline.get('settings')})")
+    for name, metric in result["quality"].items():
+        logger.info(f"  {name:<12} {metric:.4f}  {delta(metric, baseline.get('quality', {}).get(name))}")
+    for name, stats in result["latency_ms"].items():
+        old = baseline.get("latency_ms", {}).get(name, {})
+        for p in ("p50", "p95", "p99"):
+            logger.info(f"  {name:<22} {p} {stats.get(p, 0):9.3f} ms  {delta(stats.get(p), old.get(p))}")
+    new_bytes = result["search_payload_bytes"].get("mean")
+    old_bytes = baseline.get("search_payload_bytes", {}).get("mean")
+    logger.info(f"  payload bytes (mean) {new_bytes}  {delta(new_bytes, old_bytes)}")
+
+
+def main():
+    args = _parse_args()
+    _configure_env(args)
+
+    from fake_upstreams import install_openai_stub
+    from app.config import settings
+    from app.services.search_backend import ensure_email_index
+
+    install_openai_stub()
+    ks = sorted({int(k) for k in args.k.split(",") if k.strip()})
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    with open(args.queries, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+
+    ensure_email_index()
+    corpus_info: Dict[str, Any] = {"emails": len(corpus) + args.scale}
+    if not args.skip_ingest:
+        corpus_info = _ingest(corpus, args)
+
+    logger.info(
+        f"Replaying {len(queries)} queries x {args.repeat} through {args.target} "
+        f"({settings.SEARCH_BACKEND}, fusion={settings.SEARCH_FUSION})"
+    )
+    result = {
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "target": args.target,
+        "settings": {key: getattr(settings, key, None) for key in _SETTINGS_KEYS},
+        "corpus": {**corpus_info, "scale": args.scale, "tenants": args.tenants, "seed": args.seed},
+        "queries": len(queries),
+        "repeat": args.repeat,
+        "max_results": args.max_results,
+        **_replay(queries, args, ks),
+    }
+
+    output = args.output or os.path.join(
+        args.workdir,
+        "results",
+        f"{settings.SEARCH_BACKEND}_{settings.SEARCH_FUSION}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.json",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    for name, metric in result["quality"].items():
+        logger.info(f"{name:<12} {metric:.4f}")
+    for name, stats in result["latency_ms"].items():
+        logger.info(f"{name:<22} p50 {stats['p50']:9.3f}  p95 {stats['p95']:9.3f}  p99 {stats['p99']:9.3f} ms")
+    logger.info(f"search payload bytes: mean {result['search_payload_bytes'].get('mean')}")
+    logger.info(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            _compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
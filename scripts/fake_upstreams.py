@@ -0,0 +1,370 @@
+"""
+Deterministic local stand-ins for the OpenAI API, shared by the benchmark / load-test scripts.
+- stub_embedding(): feature-hashed bag of words (lower-cased words, simplified CJK characters and bigrams),
+  L2-normalized. Texts that share words get similar vectors, so kNN recall is meaningful without a model.
+- stub_chat_message(): JSON for query understanding / feature extraction (the question unchanged, no filters),
+  a select_tools call for tool selection, a short canned answer otherwise.
+- openai_response() answers /embeddings and /chat/completions requests with the shapes the SDK expects.
+- install_openai_stub() points the app's OpenAI clients at an in-process httpx.MockTransport (no sockets),
+  so the full SDK / cache / fallback code path still runs.
+- start_fake_servers() serves the same OpenAI stand-in and a minimal Elasticsearch-compatible index over
+  real HTTP, with configurable latency and error rates (Faults), for end-to-end load tests.
+"""
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from app.services.text_normalization import to_simplified
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CJK = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]+")
+
+
+def _features(text: str) -> List[str]:
+    text = to_simplified(text or "").lower()
+    features = _WORD.findall(text)
+    for run in _CJK.findall(text):
+        features.extend(run)
+        features.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return features
+
+
+def stub_embedding(text: str, dims: int) -> List[float]:
+    vector = np.zeros(dims, dtype=np.float32)
+    for feature in _features(text):
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % dims] += 1.0 if (h >> 31) & 1 else -1.0
+    norm = float(np.linalg.norm(vector))
+    if norm == 0.0:
+        # 空文本也给一个固定的非零向量，避免 ES cosine 拒绝零向量
+        vector[0] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+
+def _question(user_prompt: str) -> str:
+    for prefix in ("User question:", "Question:"):
+        if prefix in user_prompt:
+            return user_prompt.rsplit(prefix, 1)[1].strip().splitlines()[0].strip()
+    return user_prompt.strip()
+
+
+def stub_chat_message(params: Dict[str, Any]) -> Dict[str, Any]:
+    messages = params.get("messages") or []
+    system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+    user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+    question = _question(user)
+    features = {"sent_date_range": None, "people": [], "keywords": [], "recency_bias": False, "confidence": 0.5}
+
+    if params.get("tools"):
+        arguments = json.dumps({"tools": ["EmailHistory"]})
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {"id": "call_stub", "type": "function", "function": {"name": "select_tools", "arguments": arguments}}
+            ],
+        }
+    if "rewritten_query" in system:
+        return {"role": "assistant", "content": json.dumps({"rewritten_query": question, **features})}
+    if "extract structured search features" in system:
+        return {"role": "assistant", "content": json.dumps(features)}
+    if "query resolver" in system.lower():
+        return {"role": "assistant", "content": question}
+    return {"role": "assistant", "content": f"Stub answer for: {question[:200]}"}
+
+
+def openai_response(path: str, body: Dict[str, Any], dims: int) -> Tuple[int, Dict[str, Any]]:
+    if path.endswith("/embeddings"):
+        inputs = body.get("input") or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dims = int(body.get("dimensions") or dims)
+        return 200, {
+            "object": "list",
+            "model": body.get("model", "stub"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": stub_embedding(text, dims)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+    if path.endswith("/chat/completions"):
+        message = stub_chat_message(body)
+        return 200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [
+                {"index": 0, "message": message, "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}
+            ],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+    return 404, {"error": {"message": f"stub has no route for {path}", "type": "invalid_request_error"}}
+
+
+def install_openai_stub() -> None:
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+
+    from app.config import settings
+    from app.services import embeddings, llm_provider
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content or b"{}")
+        status, payload = openai_response(request.url.path, body, settings.EMBED_DIM)
+        return httpx.Response(status, json=payload)
+
+    transport = httpx.MockTransport(handler)
+    kwargs = {"api_key": "stub", "base_url": "http://openai.stub/v1"}
+    client = OpenAI(**kwargs, http_client=httpx.Client(transport=transport))
+    async_client = AsyncOpenAI(**kwargs, http_client=httpx.AsyncClient(transport=transport))
+    llm_provider._client = embeddings._client = client
+    llm_provider._async_client = embeddings._async_client = async_client
+
+
+class Faults:
+    """
+    每个请求先等待 latency_ms ± jitter_ms，再以 error_rate 的概率返回 error_status。
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def apply(self) -> Optional[int]:
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms))
+            fail = self._rng.random() < self.error_rate
+        if delay:
+            time.sleep(delay / 1000.0)
+        return self.error_status if fail else None
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    faults: Faults = Faults()
+    extra_headers: Dict[str, str] = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        return json.loads(raw) if raw.strip() else {}
+
+    def _raw_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status: int, payload: Any) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in self.extra_headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+
+class _OpenAIHandler(_JsonHandler):
+    dims = 3072
+
+    def do_POST(self):
+        body = self._body()
+        status = self.faults.apply()
+        if status:
+            return self._send(status, {"error": {"message": "injected upstream error", "type": "server_error"}})
+        self._send(*openai_response(urlsplit(self.path).path, body, self.dims))
+
+
+_TERM = re.compile(r"\w+")
+
+
+def _walk(node: Any) -> Iterator[Any]:
+    yield node
+    if isinstance(node, dict):
+        for value in node.values():
+            yield from _walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _walk(value)
+
+
+class FakeIndexStore:
+    """
+    进程内的极简 ES 索引：按 user_id 过滤，词重叠 + 向量点积打分，支持 collapse 与 _source 字段过滤。
+    分数大致落在 ES hybrid 查询的量级，让 ai_search 的分数阈值保留一部分命中。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.indices: Dict[str, Dict[str, Tuple[Dict[str, Any], set, Optional[np.ndarray]]]] = {}
+        self.mappings: Dict[str, Dict[str, Any]] = {}
+
+    def create(self, index: str, body: Dict[str, Any]) -> None:
+        with self._lock:
+            self.indices.setdefault(index, {})
+            self.mappings[index] = body.get("mappings") or {}
+
+    def put(self, index: str, doc_id: str, source: Dict[str, Any]) -> None:
+        terms = set(_TERM.findall(f"{source.get('subject') or ''} {source.get('body_text') or ''}".lower()))
+        vector = source.get("embedding")
+        vec = np.asarray(vector, dtype=np.float32) if vector else None
+        with self._lock:
+            self.indices.setdefault(index, {})[doc_id] = (source, terms, vec)
+
+    def search(self, index: str, body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        user_id = query = vector = None
+        for node in _walk(body):
+            if not isinstance(node, dict):
+                continue
+            if user_id is None and isinstance(node.get("term"), dict) and "user_id" in node["term"]:
+                user_id = node["term"]["user_id"]
+            if query is None and isinstance(node.get("multi_match"), dict):
+                query = node["multi_match"].get("query")
+            if vector is None and node.get("query_vector"):
+                vector = np.asarray(node["query_vector"], dtype=np.float32)
+        query_terms = set(_TERM.findall((query or "").lower()))
+        with self._lock:
+            docs = list(self.indices.get(index, {}).items())
+
+        scored = []
+        for doc_id, (source, terms, vec) in docs:
+            if user_id is not None and source.get("user_id") != user_id:
+                continue
+            score = 10.0 * len(query_terms & terms)
+            if vector is not None and vec is not None and vec.shape == vector.shape:
+                score += 50.0 * (1.0 + float(vec @ vector)) / 2.0
+            if score > 0:
+                scored.append((score, doc_id, source))
+        scored.sort(key=lambda item: item[0], reverse=True)
+
+        fields = body.get("_source")
+        hits, seen = [], set()
+        for score, doc_id, source in scored:
+            if body.get("collapse"):
+                if source.get("email_id") in seen:
+                    continue
+                seen.add(source.get("email_id"))
+            if isinstance(fields, list):
+                source = {key: source.get(key) for key in fields}
+            hits.append({"_id": doc_id, "_score": score, "_source": source})
+            if len(hits) >= int(body.get("size", 10)):
+                break
+        return hits
+
+
+class _ElasticsearchHandler(_JsonHandler):
+    store: FakeIndexStore = FakeIndexStore()
+    extra_headers = {"X-Elastic-Product": "Elasticsearch"}
+
+    def _parts(self) -> List[str]:
+        return [p for p in urlsplit(self.path).path.split("/") if p]
+
+    def do_HEAD(self):
+        parts = self._parts()
+        if not parts:
+            return self._send(200, {})
+        if parts[0] == "_alias":
+            # 没有独立租户索引
+            return self._send(404, {})
+        self._send(200 if parts[0] in self.store.indices else 404, {})
+
+    def do_GET(self):
+        parts = self._parts()
+        if not parts:
+            return self._send(200, {"version": {"number": "8.19.0"}, "tagline": "You Know, for Search"})
+        if parts[0] == "_alias" or (len(parts) > 1 and parts[1] == "_alias"):
+            return self._send(404, {})
+        if len(parts) > 1 and parts[1] == "_mapping":
+            return self._send(200, {parts[0]: {"mappings": self.store.mappings.get(parts[0], {})}})
+        self._send(200, {})
+
+    def do_PUT(self):
+        parts = self._parts()
+        if parts and parts[-1] == "_bulk":
+            return self.do_POST()
+        body = self._body()
+        if len(parts) == 1:
+            self.store.create(parts[0], body)
+            return self._send(200, {"acknowledged": True, "index": parts[0]})
+        if len(parts) == 3 and parts[1] == "_doc":
+            self.store.put(parts[0], parts[2], body)
+            return self._send(201, {"_id": parts[2], "result": "created"})
+        self._send(200, {"acknowledged": True})
+
+    def do_DELETE(self):
+        self._send(200, {"acknowledged": True})
+
+    def do_POST(self):
+        parts = self._parts()
+        if parts and parts[-1] == "_bulk":
+            return self._bulk(parts)
+        body = self._body()
+        status = self.faults.apply()
+        if status:
+            return self._send(status, {"error": {"type": "unavailable", "reason": "injected"}, "status": status})
+        if parts and parts[-1] == "_search":
+            start = time.perf_counter()
+            hits = self.store.search(parts[0], body)
+            took = int((time.perf_counter() - start) * 1000)
+            return self._send(200, {"took": took, "hits": {"total": {"value": len(hits)}, "hits": hits}})
+        self._send(200, {"acknowledged": True})
+
+    def _bulk(self, parts: List[str]) -> None:
+        lines = [line for line in self._raw_body().decode("utf-8").split("\n") if line.strip()]
+        status = self.faults.apply()
+        if status:
+            return self._send(status, {"error": {"type": "unavailable", "reason": "injected"}, "status": status})
+        items = []
+        default_index = parts[0] if len(parts) > 1 else None
+        i = 0
+        while i < len(lines):
+            op, meta = next(iter(json.loads(lines[i]).items()))
+            index = meta.get("_index") or default_index
+            if op == "delete":
+                items.append({op: {"_index": index, "_id": meta.get("_id"), "status": 200}})
+                i += 1
+                continue
+            self.store.put(index, meta.get("_id"), json.loads(lines[i + 1]))
+            items.append({op: {"_index": index, "_id": meta.get("_id"), "status": 201}})
+            i += 2
+        self._send(200, {"took": 1, "errors": False, "items": items})
+
+
+def _serve(handler: type, name: str, faults: Faults, **attrs: Any) -> ThreadingHTTPServer:
+    cls = type(name, (handler,), {"faults": faults, **attrs})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), cls)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=name, daemon=True).start()
+    return server
+
+
+def start_fake_servers(openai_faults: Faults, es_faults: Faults, dims: int = 3072) -> Dict[str, str]:
+    """
+    启动假的 OpenAI 与 Elasticsearch 服务（后台线程），返回可直接放进环境变量的地址。
+    """
+    openai = _serve(_OpenAIHandler, "FakeOpenAI", openai_faults, dims=dims)
+    es = _serve(_ElasticsearchHandler, "FakeElasticsearch", es_faults, store=FakeIndexStore())
+    return {
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai.server_port}/v1",
+        "ELASTICSEARCH_URL": f"http://127.0.0.1:{es.server_port}",
+    }
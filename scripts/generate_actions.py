@@ -8,6 +8,8 @@ from typing import List, Optional
 
 # Add the project root to sys.path to allow importing app modules
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Re-runs replay identical LLM calls from the on-disk cache instead of paying for them again
+os.environ.setdefault("LLM_CACHE_BACKEND", "sqlite")
 
 from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, JSON, Boolean
 from sqlalchemy.orm import sessionmaker, declarative_base
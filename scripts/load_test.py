@@ -0,0 +1,491 @@
+"""
+End-to-end load test: how many concurrent /ai/ask requests one app worker sustains before latency collapses.
+
+    python scripts/load_test.py --concurrency 1,4,16,64 --duration 20 --output runs/load.json
+    python scripts/load_test.py --openai-latency-ms 800 --openai-error-rate 0.02 --mix ask=1
+    SEARCH_FUSION=client_rrf python scripts/load_test.py --app-workers 2
+
+- Starts fake OpenAI and Elasticsearch-compatible servers (scripts/fake_upstreams.py) in a child process, with
+  configurable latency / jitter / error rate, then runs the app under uvicorn pointed at them. Other app settings
+  are taken from the environment (DATABASE_URL defaults to --workdir; caches are off unless --answer-cache).
+- Seeds --users tenants with mock_email.json, then runs one closed-loop step per --concurrency value: every
+  virtual client picks a request from --mix (/ai/ask, GET /emails, POST /ingestion/full/batch), waits for it and
+  sends the next one.
+- Reports throughput, p50/p95/p99 and a latency histogram per endpoint, error counts by status, and splits /ai/ask
+  time into pick_tools / ai_search / answer_completion from the Server-Timing header (SERVER_TIMING_ENABLED).
+- --slo-ms / --max-error-rate mark the highest concurrency that still meets the target.
+"""
+import sys
+import os
+import json
+import logging
+import argparse
+import asyncio
+import bisect
+import multiprocessing
+import random
+import socket
+import subprocess
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Add the project root to sys.path to allow importing app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+SCENARIOS = ("ask", "emails", "batch")
+# /ai/ask 的时间拆分；其余阶段（query_understand、search.* 等）也会写进结果文件
+ASK_STAGES = ("answer_cache", "pick_tools", "ai_search", "answer_completion")
+# 直方图桶上界（毫秒），大致按 2 倍递增
+HISTOGRAM_BOUNDS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test /ai/ask, /emails and /ingestion/full/batch against fake upstreams.")
+    parser.add_argument("--concurrency", default="1,4,16,32", help="Comma-separated concurrency steps")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per concurrency step")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds at the start of each step excluded from stats")
+    parser.add_argument("--mix", default="ask=8,emails=1,batch=1", help="Request weights, e.g. ask=1 or ask=6,emails=3,batch=1")
+    parser.add_argument("--users", type=int, default=4, help="Tenants seeded with the mock corpus; clients are spread over them")
+    parser.add_argument("--corpus", default=os.path.join(PROJECT_ROOT, "mock_email.json"), help="Mock email JSON file")
+    parser.add_argument("--queries", default=os.path.join(SCRIPT_DIR, "benchmark_queries.json"), help="Questions for /ai/ask")
+    parser.add_argument("--batch-size", type=int, default=5, help="Emails per /ingestion/full/batch request")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Client timeout per request (seconds)")
+    parser.add_argument("--seed", type=int, default=7, help="Seed for request selection")
+    parser.add_argument("--openai-latency-ms", type=float, default=300.0, help="Fake OpenAI latency per call")
+    parser.add_argument("--openai-jitter-ms", type=float, default=100.0, help="Uniform jitter around --openai-latency-ms")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0, help="Share of OpenAI calls answered with --openai-error-status")
+    parser.add_argument("--openai-error-status", type=int, default=500, help="Status for injected OpenAI errors (e.g. 429)")
+    parser.add_argument("--es-latency-ms", type=float, default=10.0, help="Fake Elasticsearch latency per search / bulk")
+    parser.add_argument("--es-jitter-ms", type=float, default=5.0, help="Uniform jitter around --es-latency-ms")
+    parser.add_argument("--es-error-rate", type=float, default=0.0, help="Share of searches / bulks answered with 503")
+    parser.add_argument("--app-workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the answer / LLM / embedding caches on")
+    parser.add_argument("--slo-ms", type=float, default=5000.0, help="p95 target for /ai/ask")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Error-rate target for /ai/ask")
+    parser.add_argument("--workdir", default=os.path.join(PROJECT_ROOT, "benchmark_data", "load"), help="Database and results")
+    parser.add_argument("--output", help="Result JSON path (default: <workdir>/results/load_<timestamp>.json)")
+    return parser.parse_args()
+
+
+def _parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario in --mix: {name} (expected one of {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# ---------------- Fake upstreams (child process) ----------------
+
+def _serve_fakes(config: Dict[str, Any], queue: "multiprocessing.Queue") -> None:
+    from fake_upstreams import Faults, start_fake_servers
+
+    urls = start_fake_servers(
+        Faults(config["openai_latency_ms"], config["openai_jitter_ms"], config["openai_error_rate"],
+               error_status=config["openai_error_status"], seed=1),
+        Faults(config["es_latency_ms"], config["es_jitter_ms"], config["es_error_rate"], seed=2),
+        dims=config["dims"],
+    )
+    queue.put(urls)
+    while True:
+        time.sleep(3600)
+
+
+def _start_fakes(args: argparse.Namespace) -> Tuple[multiprocessing.Process, Dict[str, str]]:
+    # 假上游放在独立进程：与压测客户端、被测应用都不争 GIL
+    config = {
+        "openai_latency_ms": args.openai_latency_ms,
+        "openai_jitter_ms": args.openai_jitter_ms,
+        "openai_error_rate": args.openai_error_rate,
+        "openai_error_status": args.openai_error_status,
+        "es_latency_ms": args.es_latency_ms,
+        "es_jitter_ms": args.es_jitter_ms,
+        "es_error_rate": args.es_error_rate,
+        "dims": int(os.getenv("EMBED_DIM", "3072")),
+    }
+    queue: multiprocessing.Queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve_fakes, args=(config, queue), daemon=True)
+    process.start()
+    return process, queue.get(timeout=30)
+
+
+# ---------------- App under test ----------------
+
+def _app_env(args: argparse.Namespace, upstreams: Dict[str, str]) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update(upstreams)
+    env["SERVER_TIMING_ENABLED"] = "true"
+    env.setdefault("OPENAI_API_KEY", "stub")
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(os.path.abspath(args.workdir), 'load.db')}")
+    env.setdefault("SEARCH_BACKEND", "elasticsearch")
+    env.setdefault("ELASTICSEARCH_INDEX_EMAILS", "emails_ai_load")
+    env.setdefault("EMBED_CACHE_PATH", os.path.join(args.workdir, "embedding_cache.db"))
+    if not args.answer_cache:
+        # 同一组问题会被反复提问；缓存打开时测到的只是缓存命中
+        env.setdefault("ANSWER_CACHE_ENABLED", "false")
+        env.setdefault("LLM_CACHE_BACKEND", "none")
+        env.setdefault("EMBED_CACHE_ENABLED", "false")
+    return env
+
+
+def _start_app(args: argparse.Namespace, env: Dict[str, str], port: int) -> subprocess.Popen:
+    cmd = [
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(args.app_workers),
+        "--log-level", "warning", "--no-access-log",
+    ]
+    process = subprocess.Popen(cmd, cwd=PROJECT_ROOT, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited during startup with code {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/metrics", timeout=2).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.3)
+    process.terminate()
+    raise RuntimeError("App did not become ready within 60s")
+
+
+# ---------------- Seeding ----------------
+
+def _split_csv_field(value: Optional[str]) -> List[str]:
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+
+def _ingest_payload(raw: dict) -> dict:
+    """
+    mock_email.json 的一条记录 -> EmailIngestItem 的 JSON（压测客户端不导入 app，避免连上应用的数据库）。
+    """
+    return {
+        "external_id": raw.get("external_id", ""),
+        "thread_id": raw.get("thread_id", ""),
+        "subject": raw.get("subject", ""),
+        "sender": raw.get("sender", ""),
+        "recipients": _split_csv_field(raw.get("recipients")),
+        "cc": _split_csv_field(raw.get("cc")) or None,
+        "bcc": _split_csv_field(raw.get("bcc")) or None,
+        "body_text": raw.get("body_text", ""),
+        "labels": _split_csv_field(raw.get("labels")) or None,
+        "ts": raw.get("ts") or datetime.utcnow().isoformat(),
+        "importance_score": float(raw.get("importance_score", 0.0) or 0.0),
+        "is_promotion": bool(raw.get("is_promotion", 0)),
+    }
+
+
+async def _seed(client: httpx.AsyncClient, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """
+    每个租户登录、导入语料，并开一个全量导入会话供 batch 场景使用。
+    """
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    emails = [_ingest_payload(raw) for raw in corpus]
+
+    users = []
+    for i in range(args.users):
+        user_id = f"load_user_{i:03d}"
+        resp = await client.post("/auth/login", json={"user_id": user_id, "password": "load-test"})
+        resp.raise_for_status()
+        headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+        resp = await client.post("/emails/ingest", json={"emails": emails}, headers=headers)
+        resp.raise_for_status()
+        resp = await client.post("/ingestion/full/start", json={"provider": "gmail"}, headers=headers)
+        resp.raise_for_status()
+        users.append({"user_id": user_id, "headers": headers, "session_id": resp.json()["session_id"]})
+        logger.info(f"Seeded {user_id} with {len(emails)} emails")
+    return users
+
+
+# ---------------- Load generation ----------------
+
+class _Request:
+    __slots__ = ("scenario", "status", "latency_ms", "stages", "finished_at")
+
+    def __init__(self, scenario: str, status: int, latency_ms: float, stages: Dict[str, float], finished_at: float):
+        self.scenario = scenario
+        self.status = status
+        self.latency_ms = latency_ms
+        self.stages = stages
+        self.finished_at = finished_at
+
+
+def _parse_server_timing(value: Optional[str]) -> Dict[str, float]:
+    stages: Dict[str, float] = {}
+    for part in (value or "").split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, dur = param.strip().partition("=")
+            if key == "dur" and name:
+                stages[name] = float(dur)
+    return stages
+
+
+class _Clients:
+    def __init__(self, args: argparse.Namespace, users: List[Dict[str, Any]], questions: List[str], corpus: List[dict]):
+        self.args = args
+        self.users = users
+        self.questions = questions
+        self.corpus = corpus
+        mix = _parse_mix(args.mix)
+        self.scenarios = list(mix)
+        self.weights = list(mix.values())
+        self._seq = 0
+
+    def _next_id(self) -> int:
+        self._seq += 1
+        return self._seq
+
+    async def _send(self, client: httpx.AsyncClient, scenario: str, user: Dict[str, Any], rng: random.Random) -> httpx.Response:
+        headers = user["headers"]
+        if scenario == "ask":
+            body = {"question": rng.choice(self.questions), "chat_id": f"load-{self._next_id()}"}
+            return await client.post("/ai/ask", json=body, headers=headers)
+        if scenario == "emails":
+            return await client.get("/emails", params={"page": rng.randint(1, 2), "page_size": 20}, headers=headers)
+        batch = []
+        for _ in range(self.args.batch_size):
+            email = _ingest_payload(rng.choice(self.corpus))
+            email["external_id"] = f"load_{email['external_id']}_{self._next_id()}"
+            batch.append(email)
+        body = {"session_id": user["session_id"], "emails": batch}
+        return await client.post("/ingestion/full/batch", json=body, headers=headers)
+
+    async def _client_loop(self, client: httpx.AsyncClient, worker: int, stop_at: float, out: List[_Request]) -> None:
+        rng = random.Random(self.args.seed * 100003 + worker)
+        user = self.users[worker % len(self.users)]
+        while time.monotonic() < stop_at:
+            scenario = rng.choices(self.scenarios, weights=self.weights)[0]
+            start = time.perf_counter()
+            try:
+                resp = await self._send(client, scenario, user, rng)
+                status, stages = resp.status_code, _parse_server_timing(resp.headers.get("server-timing"))
+            except httpx.TimeoutException:
+                status, stages = -1, {}
+            except httpx.HTTPError:
+                status, stages = -2, {}
+            out.append(_Request(scenario, status, (time.perf_counter() - start) * 1000.0, stages, time.monotonic()))
+
+    async def run_step(self, client: httpx.AsyncClient, concurrency: int) -> Tuple[List[_Request], float]:
+        started = time.monotonic()
+        stop_at = started + self.args.duration
+        results: List[_Request] = []
+        await asyncio.gather(*(self._client_loop(client, w, stop_at, results) for w in range(concurrency)))
+        # 预热期内完成的请求不计入统计；吞吐按剩余窗口计算
+        measured_from = started + min(self.args.warmup, self.args.duration / 2)
+        kept = [r for r in results if r.finished_at >= measured_from]
+        window = max(max((r.finished_at for r in kept), default=measured_from) - measured_from, 1e-6)
+        return kept, window
+
+
+# ---------------- Reporting ----------------
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[idx]
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 2) if ordered else 0.0,
+        "p50": round(_percentile(ordered, 50), 2),
+        "p95": round(_percentile(ordered, 95), 2),
+        "p99": round(_percentile(ordered, 99), 2),
+        "max": round(ordered[-1], 2) if ordered else 0.0,
+    }
+
+
+def _histogram(values: List[float]) -> Dict[str, int]:
+    counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+    for value in values:
+        counts[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, value)] += 1
+    labels = [f"<={bound}" for bound in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}"]
+    return dict(zip(labels, counts))
+
+
+def _step_report(concurrency: int, results: List[_Request], window: float) -> Dict[str, Any]:
+    by_scenario: Dict[str, List[_Request]] = defaultdict(list)
+    for r in results:
+        by_scenario[r.scenario].append(r)
+
+    endpoints = {}
+    for scenario, rows in by_scenario.items():
+        ok = [r for r in rows if 200 <= r.status < 300]
+        errors = Counter(str(r.status) if r.status > 0 else ("timeout" if r.status == -1 else "connection") for r in rows if r not in ok)
+        latencies = [r.latency_ms for r in ok]
+        entry = {
+            "requests": len(rows),
+            "throughput_rps": round(len(ok) / window, 2),
+            "error_rate": round((len(rows) - len(ok)) / len(rows), 4) if rows else 0.0,
+            "errors": dict(errors),
+            "latency_ms": _summary(latencies),
+            "histogram_ms": _histogram(latencies),
+        }
+        if ok and any(r.stages for r in ok):
+            stage_names = sorted({name for r in ok for name in r.stages})
+            total = sum(r.stages.get("total", 0.0) for r in ok)
+            entry["stages_ms"] = {
+                name: {
+                    **_summary([r.stages.get(name, 0.0) for r in ok]),
+                    "share_of_total": round(sum(r.stages.get(name, 0.0) for r in ok) / total, 4) if total else 0.0,
+                }
+                for name in stage_names
+            }
+        endpoints[scenario] = entry
+
+    ok_total = sum(1 for r in results if 200 <= r.status < 300)
+    return {
+        "concurrency": concurrency,
+        "window_seconds": round(window, 2),
+        "requests": len(results),
+        "throughput_rps": round(ok_total / window, 2),
+        "endpoints": endpoints,
+    }
+
+
+def _bar(count: int, peak: int, width: int = 40) -> str:
+    return "#" * (max(1, round(width * count / peak)) if count else 0)
+
+
+def _print_step(step: Dict[str, Any]) -> None:
+    print(f"\n=== concurrency {step['concurrency']}: {step['requests']} requests, {step['throughput_rps']} req/s ===")
+    print(f"{'endpoint':<8} {'req/s':>8} {'err%':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for scenario, entry in step["endpoints"].items():
+        lat = entry["latency_ms"]
+        print(
+            f"{scenario:<8} {entry['throughput_rps']:>8.2f} {entry['error_rate'] * 100:>5.1f}% "
+            f"{lat['p50']:>9.1f} {lat['p95']:>9.1f} {lat['p99']:>9.1f} {lat['max']:>9.1f}"
+        )
+        if entry["errors"]:
+            print(f"         errors: {entry['errors']}")
+
+    ask = step["endpoints"].get("ask")
+    if not ask:
+        return
+    stages = ask.get("stages_ms") or {}
+    if stages:
+        print("ask stages (ms)      p50       p95   share")
+        for name in [*ASK_STAGES, "total"]:
+            if name in stages:
+                s = stages[name]
+                print(f"  {name:<16} {s['p50']:>9.1f} {s['p95']:>9.1f} {s['share_of_total'] * 100:>6.1f}%")
+    peak = max(ask["histogram_ms"].values()) if ask["histogram_ms"] else 0
+    print("ask latency histogram (ms)")
+    for label, count in ask["histogram_ms"].items():
+        if count:
+            print(f"  {label:>7} {count:>6} {_bar(count, peak)}")
+
+
+def _sustained(steps: List[Dict[str, Any]], slo_ms: float, max_error_rate: float) -> Optional[int]:
+    best = None
+    for step in steps:
+        ask = step["endpoints"].get("ask")
+        if not ask or not ask["latency_ms"]["count"]:
+            continue
+        if ask["latency_ms"]["p95"] <= slo_ms and ask["error_rate"] <= max_error_rate:
+            best = step["concurrency"]
+        else:
+            break
+    return best
+
+
+async def _run(args: argparse.Namespace, base_url: str) -> Dict[str, Any]:
+    with open(args.queries, "r", encoding="utf-8") as f:
+        questions = [q["question"] for q in json.load(f)]
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    steps = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    limits = httpx.Limits(max_connections=max(steps) + 8, max_keepalive_connections=max(steps) + 8)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        users = await _seed(client, args)
+        clients = _Clients(args, users, questions, corpus)
+        reports = []
+        for concurrency in steps:
+            logger.info(f"Running {args.duration:.0f}s at concurrency {concurrency}")
+            results, window = await clients.run_step(client, concurrency)
+            report = _step_report(concurrency, results, window)
+            _print_step(report)
+            reports.append(report)
+        metrics = (await client.get("/metrics")).json()
+    return {"steps": reports, "app_metrics": metrics}
+
+
+def main() -> None:
+    args = _parse_args()
+    _parse_mix(args.mix)
+    os.makedirs(args.workdir, exist_ok=True)
+
+    fakes, upstreams = _start_fakes(args)
+    logger.info(f"Fake upstreams: {upstreams}")
+    app = None
+    try:
+        port = _free_port()
+        app = _start_app(args, _app_env(args, upstreams), port)
+        logger.info(f"App ready on port {port} ({args.app_workers} worker(s))")
+        result = asyncio.run(_run(args, f"http://127.0.0.1:{port}"))
+    finally:
+        if app is not None:
+            app.terminate()
+            try:
+                app.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                app.kill()
+        fakes.terminate()
+
+    sustained = _sustained(result["steps"], args.slo_ms, args.max_error_rate)
+    if sustained is None:
+        print(f"\n/ai/ask missed p95 <= {args.slo_ms:.0f}ms / errors <= {args.max_error_rate:.1%} at every step")
+    else:
+        print(f"\n/ai/ask sustained up to concurrency {sustained} (p95 <= {args.slo_ms:.0f}ms, errors <= {args.max_error_rate:.1%})")
+
+    output = args.output or os.path.join(
+        args.workdir, "results", f"load_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    payload = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("workdir", "output")},
+        "settings": {
+            key: os.environ[key]
+            for key in ("SEARCH_BACKEND", "SEARCH_FUSION", "EMBED_DIM", "TOOL_TIMEOUT_SECONDS", "INGESTION_WORKERS")
+            if key in os.environ
+        },
+        "sustained_concurrency": sustained,
+        **result,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    logger.info(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
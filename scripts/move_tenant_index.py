@@ -0,0 +1,157 @@
+"""
+Move a large tenant from the shared emails index to a dedicated index (and back with --to-shared).
+
+    python scripts/move_tenant_index.py --user-id alice@example.com
+
+- Copies the tenant's chunks into "<ELASTICSEARCH_INDEX_EMAILS>-tenant-<slug>-<hash>-<timestamp>" and points
+  the tenant alias (see app/services/index_routing.py) at it. Running processes switch reads and writes
+  within ES_TENANT_ALIAS_CACHE_SECONDS.
+- After that window a catch-up pass copies chunks written to the shared index meanwhile (op_type=create,
+  already copied ones are skipped), then the tenant's chunks are deleted from the shared index.
+"""
+import sys
+import os
+import logging
+import argparse
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+# Add the project root to sys.path to allow importing app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from elasticsearch.helpers import scan, streaming_bulk
+
+from app.config import settings
+from app.services.index_routing import shared_routing, tenant_index_name
+from app.services.search_index_es import email_index_body, es, restore_embeddings
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _tenant_docs(index: str, user_id: str, routing: Optional[str], batch_size: int) -> Iterator[Dict[str, Any]]:
+    kwargs = {"routing": routing} if routing else {}
+    return scan(es, index=index, query={"query": {"term": {"user_id": user_id}}}, size=batch_size, **kwargs)
+
+
+def _copy(user_id: str, source: str, source_routing: Optional[str], target: str, target_routing: Optional[str],
+          op_type: str, batch_size: int) -> Dict[str, int]:
+    def actions():
+        batch = []
+        for hit in _tenant_docs(source, user_id, source_routing, batch_size):
+            batch.append(hit)
+            if len(batch) >= batch_size:
+                yield from flush(batch)
+                batch = []
+        yield from flush(batch)
+
+    def flush(hits):
+        # _source 里不存 embedding 的索引需要先补回向量
+        restore_embeddings([hit["_source"] for hit in hits])
+        for hit in hits:
+            action = {"_op_type": op_type, "_index": target, "_id": hit["_id"], "_source": hit["_source"]}
+            if target_routing:
+                action["routing"] = target_routing
+            yield action
+
+    counters = {"copied": 0, "skipped": 0, "failed": 0}
+    for ok, item in streaming_bulk(
+            es,
+            actions(),
+            chunk_size=batch_size,
+            max_retries=settings.ES_BULK_MAX_RETRIES,
+            raise_on_error=False,
+    ):
+        if ok:
+            counters["copied"] += 1
+        elif next(iter(item.values())).get("status") == 409:
+            # catch-up 阶段 op_type=create，已存在的文档会冲突，直接跳过
+            counters["skipped"] += 1
+        else:
+            counters["failed"] += 1
+            logger.error(f"Failed to copy document: {item}")
+    return counters
+
+
+def _delete(index: str, user_id: str, routing: Optional[str]) -> int:
+    kwargs = {"routing": routing} if routing else {}
+    resp = es.options(request_timeout=3600).delete_by_query(
+        index=index, query={"term": {"user_id": user_id}}, conflicts="proceed", refresh=True, **kwargs
+    )
+    return int(resp.get("deleted", 0))
+
+
+def move_to_dedicated(user_id: str, batch_size: int, keep_shared: bool) -> None:
+    shared = settings.ELASTICSEARCH_INDEX_EMAILS
+    alias = tenant_index_name(user_id)
+    if es.indices.exists_alias(name=alias):
+        logger.error(f"{user_id} already has a dedicated index ({alias})")
+        return
+    physical = f"{alias}-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
+    es.indices.create(index=physical, body=email_index_body(shards=1))
+
+    counters = _copy(user_id, shared, shared_routing(user_id), physical, None, "index", batch_size)
+    logger.info(f"Copied {counters['copied']} chunks to {physical}")
+    if counters["failed"]:
+        logger.error(f"{counters['failed']} chunks failed; alias not created, {physical} kept for inspection")
+        return
+    es.indices.refresh(index=physical)
+    es.indices.put_alias(index=physical, name=alias)
+    logger.info(f"Alias {alias} -> {physical}; waiting for tenant lookups to expire")
+
+    time.sleep(settings.ES_TENANT_ALIAS_CACHE_SECONDS + 5)
+    es.indices.refresh(index=shared)
+    counters = _copy(user_id, shared, shared_routing(user_id), alias, None, "create", batch_size)
+    logger.info(f"Catch-up: {counters['copied']} new chunks, {counters['skipped']} already copied")
+    if counters["failed"] or keep_shared:
+        logger.warning(f"Tenant chunks left in {shared}")
+        return
+    logger.info(f"Deleted {_delete(shared, user_id, shared_routing(user_id))} chunks from {shared}")
+
+
+def move_to_shared(user_id: str, batch_size: int) -> None:
+    shared = settings.ELASTICSEARCH_INDEX_EMAILS
+    alias = tenant_index_name(user_id)
+    if not es.indices.exists_alias(name=alias):
+        logger.error(f"{user_id} has no dedicated index")
+        return
+    physical = sorted(es.indices.get_alias(name=alias).body.keys())
+
+    counters = _copy(user_id, alias, None, shared, shared_routing(user_id), "index", batch_size)
+    logger.info(f"Copied {counters['copied']} chunks to {shared}")
+    if counters["failed"]:
+        logger.error(f"{counters['failed']} chunks failed; dedicated index kept")
+        return
+    es.indices.refresh(index=shared)
+    es.indices.delete_alias(index=",".join(physical), name=alias)
+    logger.info(f"Removed alias {alias}; waiting for tenant lookups to expire")
+
+    time.sleep(settings.ES_TENANT_ALIAS_CACHE_SECONDS + 5)
+    for index in physical:
+        es.indices.refresh(index=index)
+        counters = _copy(user_id, index, None, shared, shared_routing(user_id), "create", batch_size)
+        logger.info(f"Catch-up: {counters['copied']} new chunks, {counters['skipped']} already copied")
+        if counters["failed"]:
+            logger.warning(f"{index} kept because some chunks failed to copy")
+            continue
+        es.indices.delete(index=index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move a tenant between the shared emails index and a dedicated index.")
+    parser.add_argument("--user-id", required=True, help="Tenant to move")
+    parser.add_argument("--to-shared", action="store_true", help="Move the tenant back into the shared index")
+    parser.add_argument("--batch-size", type=int, default=500, help="Documents per scroll page / bulk request")
+    parser.add_argument("--keep-shared", action="store_true", help="Do not delete the tenant's chunks from the shared index")
+    args = parser.parse_args()
+
+    if args.to_shared:
+        move_to_shared(args.user_id, args.batch_size)
+    else:
+        move_to_dedicated(args.user_id, args.batch_size, args.keep_shared)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Migrate the emails index to the current vector profile (EMBED_DIM / ES_VECTOR_PROFILE).
+
+    EMBED_DIM=1024 ES_VECTOR_PROFILE=bbq_hnsw python scripts/reindex_vectors.py
+
+- Creates a new physical index "<ELASTICSEARCH_INDEX_EMAILS>_<profile>_<dims>_<timestamp>" with the compact mapping.
+- Copies every tenant's chunks of the shared index (routed by user_id when ES_ROUTING_ENABLED; tenants moved
+  to a dedicated index by scripts/move_tenant_index.py are not touched). Vectors with more dims are Matryoshka-truncated locally (no API calls)
+  when the embedding model supports it (text-embedding-3-* or EMBED_SEND_DIMENSIONS), otherwise re-embedded;
+  missing (ES_SOURCE_EXCLUDE_EMBEDDING) / zero / shorter vectors are re-embedded from the indexed subject + chunk text.
+- Atomically points ELASTICSEARCH_INDEX_EMAILS (as an alias) at the new index and drops the old one
+  (use --keep-old to keep an aliased old index around for rollback).
+- Pause ingestion (INGESTION_WORKERS=0) while it runs: chunks written to the old index during the copy are not migrated.
+"""
+import sys
+import os
+import logging
+import argparse
+from datetime import datetime
+from typing import Any, Dict, List
+
+# Add the project root to sys.path to allow importing app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from elasticsearch.helpers import scan, streaming_bulk
+
+from app.config import settings
+from app.services.index_routing import shared_routing
+from app.services.search_index_es import email_index_body, es, indexed_embedding_dims, restore_embeddings
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _store_size(index: str) -> int:
+    stats = es.indices.stats(index=index, metric="store")
+    return int(stats["_all"]["primaries"]["store"]["size_in_bytes"])
+
+
+def _source_indices(name: str) -> tuple[List[str], bool]:
+    """
+    返回 (物理索引列表, name 是否为别名)。
+    """
+    if es.indices.exists_alias(name=name):
+        return sorted(es.indices.get_alias(name=name).body.keys()), True
+    if es.indices.exists(index=name):
+        return [name], False
+    return [], False
+
+
+def _actions(source: List[str], target: str, dims: int, batch_size: int, counters: Dict[str, int]):
+    batch: List[tuple[str, Dict[str, Any]]] = []
+
+    def flush():
+        counters["reembedded"] += restore_embeddings([doc for _, doc in batch], dims)
+        for doc_id, doc in batch:
+            action = {"_op_type": "index", "_index": target, "_id": doc_id, "_source": doc}
+            # 按当前路由策略写入，旧索引未按 user_id 路由时借此迁移
+            routing = shared_routing(doc["user_id"])
+            if routing:
+                action["routing"] = routing
+            yield action
+        batch.clear()
+
+    for hit in scan(es, index=",".join(source), query={"query": {"match_all": {}}}, size=batch_size):
+        batch.append((hit["_id"], hit["_source"]))
+        if len(batch) >= batch_size:
+            yield from flush()
+    if batch:
+        yield from flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reindex emails into the configured compact vector profile.")
+    parser.add_argument("--batch-size", type=int, default=500, help="Documents per scroll page / bulk request")
+    parser.add_argument("--keep-old", action="store_true", help="Keep the old physical index after the alias switch")
+    args = parser.parse_args()
+
+    alias = settings.ELASTICSEARCH_INDEX_EMAILS
+    dims = settings.EMBED_DIM
+    profile = settings.ES_VECTOR_PROFILE
+    source, is_alias = _source_indices(alias)
+    target = f"{alias}_{profile}_{dims}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
+
+    old_dims = indexed_embedding_dims(alias) if source else None
+    logger.info(f"Migrating {source or '(no index)'} ({old_dims} dims) -> {target} ({dims} dims, {profile})")
+
+    body = email_index_body(dims, profile)
+    # 拷贝期间关闭 refresh，结束后恢复默认
+    body["settings"]["index"]["refresh_interval"] = "-1"
+    es.indices.create(index=target, body=body)
+
+    counters = {"copied": 0, "failed": 0, "reembedded": 0}
+    if source:
+        before_bytes = sum(_store_size(i) for i in source)
+        for ok, item in streaming_bulk(
+                es,
+                _actions(source, target, dims, args.batch_size, counters),
+                chunk_size=args.batch_size,
+                max_retries=settings.ES_BULK_MAX_RETRIES,
+                raise_on_error=False,
+        ):
+            if ok:
+                counters["copied"] += 1
+            else:
+                counters["failed"] += 1
+                logger.error(f"Failed to copy document: {item}")
+            if counters["copied"] and counters["copied"] % 10000 == 0:
+                logger.info(f"Copied {counters['copied']} documents...")
+    else:
+        before_bytes = 0
+
+    es.indices.put_settings(index=target, settings={"index": {"refresh_interval": None}})
+    es.indices.refresh(index=target)
+    # 合并段后 HNSW 图只有一份，检索更快；大索引耗时较长
+    es.options(request_timeout=3600).indices.forcemerge(index=target, max_num_segments=1)
+
+    if counters["failed"]:
+        logger.error(f"{counters['failed']} documents failed; alias left unchanged, new index {target} kept for inspection")
+        return
+
+    actions: List[Dict[str, Any]] = []
+    for index in source:
+        if is_alias:
+            actions.append({"remove": {"index": index, "alias": alias}})
+        else:
+            # 旧索引与别名同名，只能在同一个原子操作里删掉
+            actions.append({"remove_index": {"index": index}})
+    actions.append({"add": {"index": target, "alias": alias}})
+    es.indices.update_aliases(actions=actions)
+    if is_alias and not args.keep_old:
+        for index in source:
+            es.indices.delete(index=index)
+    elif not is_alias and args.keep_old and source:
+        logger.warning(f"{alias} was a concrete index and had to be removed to create the alias; --keep-old ignored")
+
+    after_bytes = _store_size(target)
+    logger.info(
+        f"Done: copied {counters['copied']} documents ({counters['reembedded']} re-embedded); "
+        f"store size {before_bytes / 1e6:.1f} MB -> {after_bytes / 1e6:.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
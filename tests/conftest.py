@@ -0,0 +1,24 @@
+"""
+Shared test environment: local search backend, throwaway SQLite database, no caches, no network.
+settings 在导入时读取环境变量，这里必须先于任何 app 模块的导入执行。
+"""
+import os
+import sys
+import tempfile
+
+_WORKDIR = tempfile.mkdtemp(prefix="email_ai_test_")
+os.environ.update(
+    OPENAI_API_KEY="stub",
+    DATABASE_URL=f"sqlite:///{os.path.join(_WORKDIR, 'test.db')}",
+    SEARCH_BACKEND="local",
+    LOCAL_INDEX_PATH=os.path.join(_WORKDIR, "local_index"),
+    EMBED_DIM="64",
+    EMBED_CACHE_ENABLED="false",
+    LLM_CACHE_BACKEND="none",
+    INGESTION_WORKERS="0",
+)
+for _name in ("SEARCH_FUSION", "SEARCH_MIN_SCORE", "LOCAL_SEARCH_MIN_SCORE"):
+    os.environ.pop(_name, None)
+
+# scripts/fake_upstreams.py 提供 OpenAI 的进程内替身
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
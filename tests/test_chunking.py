@@ -0,0 +1,89 @@
+"""
+Quoted-history / signature stripping in chunk_email_body: forwarded content is kept, reply history is cut.
+"""
+from app.services.chunking import chunk_email_body
+
+
+def _text(body: str, subject: str = None) -> str:
+    return "\n\n".join(c.text for c in chunk_email_body(body, max_tokens=400, overlap_tokens=0, subject=subject))
+
+
+def test_gmail_forward_keeps_forwarded_body():
+    body = (
+        "FYI, see below.\n\n"
+        "---------- Forwarded message ---------\n"
+        "From: Bob <bob@example.com>\n"
+        "Date: Mon, Mar 3, 2025 at 9:00 AM\n"
+        "Subject: Contract\n"
+        "To: Alice <alice@example.com>\n\n"
+        "The signed contract is attached; payment due March 3."
+    )
+    text = _text(body, subject="Fwd: Contract")
+    assert "FYI, see below." in text
+    assert "payment due March 3" in text
+
+
+def test_apple_mail_forward_keeps_forwarded_body():
+    body = (
+        "Forwarding this to you.\n\n"
+        "Begin forwarded message:\n\n"
+        "From: Bob <bob@example.com>\n"
+        "Subject: Contract\n"
+        "Date: March 3, 2025 at 9:00:00 AM PST\n"
+        "To: Alice <alice@example.com>\n\n"
+        "The signed contract is attached; payment due March 3."
+    )
+    assert "payment due March 3" in _text(body)
+
+
+def test_outlook_forward_keeps_forwarded_body():
+    body = (
+        "Please review.\n\n"
+        "________________________________\n"
+        "From: Bob <bob@example.com>\n"
+        "Sent: Monday, March 3, 2025 9:00 AM\n"
+        "To: Alice <alice@example.com>\n"
+        "Subject: Contract\n\n"
+        "The signed contract is attached; payment due March 3.\n\n"
+        "-----Original Message-----\n"
+        "From: Alice\n"
+        "Sent: Sunday, March 2, 2025 8:00 AM\n\n"
+        "Can you send the contract?"
+    )
+    text = _text(body, subject="FW: Contract")
+    assert "payment due March 3" in text
+    # 被转发邮件自己的回复历史仍然去掉
+    assert "Can you send the contract?" not in text
+
+
+def test_chinese_forward_keeps_forwarded_body():
+    body = (
+        "请看下面的邮件。\n\n"
+        "------------------ 原始邮件 ------------------\n"
+        "发件人: 张三\n"
+        "发送时间: 2025年3月3日 9:00\n"
+        "主题: 合同\n\n"
+        "合同已签署，三月三日前付款。"
+    )
+    assert "三月三日前付款" in _text(body, subject="转发：合同")
+
+
+def test_reply_with_quoted_header_is_cut():
+    body = (
+        "Sounds good, thanks!\n\n"
+        "From: Bob <bob@example.com>\n"
+        "Sent: Monday, March 3, 2025 9:00 AM\n"
+        "To: Alice <alice@example.com>\n"
+        "Subject: Contract\n\n"
+        "The signed contract is attached; payment due March 3."
+    )
+    text = _text(body, subject="RE: Contract")
+    assert text == "Sounds good, thanks!"
+
+
+def test_signature_delimiter_only_cuts_at_the_tail():
+    body = "Run the migration:\n\n--\nstep one\nstep two\n" + "\n".join(f"line {i}" for i in range(12))
+    assert "line 11" in _text(body)
+
+    signed = "See you tomorrow.\n\n-- \nAlice Smith\nProduct Manager"
+    assert _text(signed) == "See you tomorrow."
@@ -0,0 +1,65 @@
+"""
+Gmail history sync must checkpoint on history record ids, so a failure mid-sync never skips unprocessed records.
+"""
+import httpx
+import pytest
+
+from app.db import models
+from app.db.base import Base
+from app.db.session import SessionLocal, engine
+from app.services import gmail_client
+from app.services.gmail_ingest import sync_gmail_incremental
+from fake_upstreams import install_openai_stub
+
+
+def _message(mid: str, history_id: str) -> dict:
+    return {
+        "id": mid,
+        "threadId": mid,
+        "historyId": history_id,
+        "internalDate": "1735689600000",
+        "snippet": f"body of {mid}",
+        "payload": {"headers": [{"name": "Subject", "value": f"subject {mid}"}, {"name": "From", "value": "bob@example.com"}]},
+    }
+
+
+def _handler(request: httpx.Request) -> httpx.Response:
+    path = request.url.path
+    if path.endswith("/users/me/history"):
+        if request.url.params.get("pageToken") == "page-2":
+            return httpx.Response(401, json={"error": "expired token"})
+        return httpx.Response(200, json={
+            "history": [
+                {"id": "110", "messagesAdded": [{"message": {"id": "m1"}}]},
+                {"id": "120", "messagesAdded": [{"message": {"id": "m2"}}]},
+            ],
+            "nextPageToken": "page-2",
+            "historyId": "900",
+        })
+    mid = path.rsplit("/", 1)[-1]
+    # message 的 historyId 是它最近一次变更的 id，可能远超当前页的 history 记录
+    return httpx.Response(200, json=_message(mid, "500" if mid == "m2" else "110"))
+
+
+@pytest.fixture
+def db(monkeypatch):
+    install_openai_stub()
+    Base.metadata.create_all(bind=engine)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+    monkeypatch.setattr(gmail_client, "get_async_http_client", lambda name: client)
+    monkeypatch.setattr(gmail_client.settings, "GMAIL_USE_BATCH_API", False)
+    session = SessionLocal()
+    session.add(models.MailboxSyncState(user_id="gmail_user", provider="gmail_user@example.com", access_token="t", delta_link="100"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_failure_on_page_two_keeps_history_record_checkpoint(db):
+    with pytest.raises(httpx.HTTPStatusError):
+        sync_gmail_incremental(db, user_id="gmail_user", email="gmail_user@example.com")
+
+    state = db.query(models.MailboxSyncState).filter_by(user_id="gmail_user").one()
+    db.refresh(state)
+    assert state.delta_link == "120"
+    assert db.query(models.Email).filter_by(user_id="gmail_user").count() == 2
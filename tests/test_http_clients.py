@@ -0,0 +1,37 @@
+"""
+Async upstream clients are bound to their event loop and are closed by the async shutdown hook.
+"""
+import asyncio
+
+from app.services import http_clients, llm_provider
+from app.services.http_clients import aclose_http_clients, get_async_http_client, run_in_background_loop
+
+
+async def _current_clients():
+    return llm_provider._get_async_client(), get_async_http_client("gmail")
+
+
+def test_async_openai_client_is_per_event_loop(monkeypatch):
+    monkeypatch.setattr(llm_provider, "_async_client", None)
+    first, _ = asyncio.run(_current_clients())
+    second, _ = asyncio.run(_current_clients())
+    assert first is not second
+
+    async def same_loop():
+        return llm_provider._get_async_client() is llm_provider._get_async_client()
+
+    assert asyncio.run(same_loop())
+
+
+def test_aclose_closes_clients_on_every_running_loop(monkeypatch):
+    monkeypatch.setattr(llm_provider, "_async_client", None)
+    _, background = run_in_background_loop(_current_clients())
+
+    async def shutdown():
+        _, local = await _current_clients()
+        await aclose_http_clients()
+        return local
+
+    local = asyncio.run(shutdown())
+    assert background.is_closed and local.is_closed
+    assert not http_clients._async_clients and not http_clients._loop_bound
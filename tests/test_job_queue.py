@@ -0,0 +1,82 @@
+"""
+Ingestion queue leases: two worker pools stand in for two processes sharing the same database.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.db import models
+from app.db.base import Base
+from app.db.session import SessionLocal, engine, ensure_ingestion_job_lease
+from app.services import job_queue
+from app.services.job_queue import IngestionWorkerPool
+
+
+def _job(db, user_id: str, **fields) -> models.IngestionJob:
+    job = models.IngestionJob(user_id=user_id, kind="full_batch", payload={}, status=fields.pop("status", "queued"), attempts=0, **fields)
+    db.add(job)
+    db.commit()
+    return job
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    ensure_ingestion_job_lease()
+    session = SessionLocal()
+    session.query(models.IngestionJob).delete()
+    session.commit()
+    yield session
+    session.query(models.IngestionJob).delete()
+    session.commit()
+    session.close()
+
+
+def test_claim_allows_one_running_job_per_user_across_pools(db):
+    first, second = IngestionWorkerPool(), IngestionWorkerPool()
+    a1 = _job(db, "alice")
+    _job(db, "alice")
+    b1 = _job(db, "bob")
+
+    claimed = first._claim_next_job(db)
+    assert claimed.id == a1.id
+    assert claimed.worker_id == first.worker_id and claimed.heartbeat_at is not None
+
+    # alice 已有 running 任务，另一个 "进程" 只能领到 bob 的任务
+    claimed = second._claim_next_job(db)
+    assert claimed.id == b1.id
+    assert second._claim_next_job(db) is None
+
+
+def test_heartbeat_requeues_only_expired_leases(db):
+    pool = IngestionWorkerPool()
+    stale = datetime.utcnow() - timedelta(hours=1)
+    mine = _job(db, "alice", status="running", worker_id=pool.worker_id, heartbeat_at=stale)
+    alive = _job(db, "bob", status="running", worker_id="other-host:1:live", heartbeat_at=datetime.utcnow())
+    dead = _job(db, "carol", status="running", worker_id="other-host:2:dead", heartbeat_at=stale)
+
+    pool._heartbeat()
+
+    db.expire_all()
+    assert db.get(models.IngestionJob, mine.id).status == "running"
+    assert db.get(models.IngestionJob, alive.id).status == "running"
+    requeued = db.get(models.IngestionJob, dead.id)
+    assert requeued.status == "queued" and requeued.worker_id is None
+
+
+def test_result_is_written_only_while_holding_the_lease(db, monkeypatch):
+    monkeypatch.setitem(job_queue._HANDLERS, "full_batch", lambda db, job: {"ingested": 1})
+    pool = IngestionWorkerPool()
+    kept = _job(db, "alice")
+    pool._run_job(db, pool._claim_next_job(db))
+    db.expire_all()
+    assert db.get(models.IngestionJob, kept.id).status == "completed"
+
+    lost = _job(db, "bob")
+    job = pool._claim_next_job(db)
+    # 租约过期后被另一个 worker 接手
+    db.query(models.IngestionJob).filter_by(id=lost.id).update({"worker_id": "other-host:1:live"})
+    db.commit()
+    pool._run_job(db, job)
+    db.expire_all()
+    assert db.get(models.IngestionJob, lost.id).status == "running"
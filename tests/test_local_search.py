@@ -0,0 +1,46 @@
+"""
+SEARCH_BACKEND=local with default score settings must return hits through ai_search.
+LLM / embedding calls go to the in-process stand-in from scripts/fake_upstreams.py.
+"""
+from datetime import datetime
+
+import pytest
+
+from app.db.base import Base
+from app.db.session import SessionLocal, engine
+from app.schemas.email import EmailIngestItem
+from app.services.ai_search import ai_search
+from app.services.email_ingest import ingest_emails
+from fake_upstreams import install_openai_stub
+
+
+@pytest.fixture(scope="module")
+def db():
+    install_openai_stub()
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    emails = [
+        EmailIngestItem(
+            external_id=f"msg_{i}",
+            thread_id=f"thread_{i}",
+            subject=subject,
+            sender="alice@example.com",
+            recipients=["bob@example.com"],
+            body_text=body,
+            ts=datetime(2025, 1, i + 1),
+        )
+        for i, (subject, body) in enumerate([
+            ("Incident bridge: public API 5xx errors", "The public API is returning 5xx errors, join the incident bridge."),
+            ("Invoice overdue", "Your cloud invoice is overdue, please pay the outstanding balance."),
+            ("Package at the mailroom", "A package is waiting for you at the mailroom."),
+        ])
+    ]
+    ingest_emails(session, "user_1", emails)
+    yield session
+    session.close()
+
+
+def test_local_backend_returns_hits_with_default_min_score(db):
+    fragments = ai_search(db, "user_1", "public API 5xx errors incident bridge")
+    assert fragments
+    assert fragments[0].email.external_id == "msg_0"
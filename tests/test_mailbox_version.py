@@ -0,0 +1,34 @@
+"""
+bump_mailbox_version upserts: the first bump inserts version 1, later and concurrent bumps increment it.
+"""
+import threading
+
+from app.db import models
+from app.db.base import Base
+from app.db.session import SessionLocal, engine
+from app.services.mailbox_version import bump_mailbox_version, get_mailbox_version
+
+
+def _bump(user_id: str) -> None:
+    db = SessionLocal()
+    try:
+        bump_mailbox_version(db, user_id)
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_bump_inserts_then_increments():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        db.query(models.MailboxVersion).filter_by(user_id="version_user").delete()
+        db.commit()
+        threads = [threading.Thread(target=_bump, args=("version_user",)) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert get_mailbox_version(db, "version_user") == 8
+    finally:
+        db.close()
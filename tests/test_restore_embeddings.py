@@ -0,0 +1,37 @@
+"""
+restore_embeddings only truncates longer vectors for Matryoshka embedding models; other models re-embed from text.
+"""
+import numpy as np
+
+from app.config import settings
+from app.services import embeddings
+from app.services.search_index_es import restore_embeddings
+from fake_upstreams import install_openai_stub
+
+
+def _docs():
+    dims = settings.EMBED_DIM
+    return [
+        {"subject": "s", "body_text": "long", "embedding": [1.0] * (dims * 2)},
+        {"subject": "s", "body_text": "exact", "embedding": [0.5] * dims},
+    ]
+
+
+def test_matryoshka_model_truncates_locally(monkeypatch):
+    monkeypatch.setattr(settings, "OPENAI_MODEL_EMBEDDING", "text-embedding-3-small")
+    monkeypatch.setattr(settings, "EMBED_SEND_DIMENSIONS", False)
+    docs = _docs()
+    assert restore_embeddings(docs) == 0
+    assert len(docs[0]["embedding"]) == settings.EMBED_DIM
+    assert np.isclose(np.linalg.norm(docs[0]["embedding"]), 1.0)
+
+
+def test_other_models_reembed_longer_vectors(monkeypatch):
+    install_openai_stub()
+    monkeypatch.setattr(settings, "OPENAI_MODEL_EMBEDDING", "bge-m3")
+    monkeypatch.setattr(settings, "EMBED_SEND_DIMENSIONS", False)
+    docs = _docs()
+    assert restore_embeddings(docs) == 1
+    assert len(docs[0]["embedding"]) == settings.EMBED_DIM
+    assert docs[0]["embedding"] != [1.0] * settings.EMBED_DIM
+    assert docs[1]["embedding"] == [0.5] * settings.EMBED_DIM
@@ -0,0 +1,51 @@
+"""
+Sync tools share a bounded thread pool: tools that time out keep their slot until they finish,
+and new tools are shed (empty result) instead of queueing behind them.
+"""
+import asyncio
+import threading
+import time
+
+from app.config import settings
+from app.db.session import SessionLocal
+from app.services import answer_engine
+from app.services.answer_engine import run_tools_async, run_tools_parallel
+from app.tools import CurrentThreadTool
+from app.tools.base import ToolContext, ToolResult
+
+
+def test_saturated_tool_pool_sheds_new_tools(monkeypatch):
+    release = threading.Event()
+
+    def stuck(self, ctx):
+        release.wait(5)
+        return ToolResult(name=self.name, content="thread", metadata={})
+
+    monkeypatch.setattr(CurrentThreadTool, "run", stuck)
+    slots = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(answer_engine, "_tool_slots", slots)
+    monkeypatch.setattr(settings, "TOOL_TIMEOUT_SECONDS", 0.2)
+    ctx = ToolContext(user_id="u", question="q")
+    db = SessionLocal()
+    try:
+        [first] = run_tools_parallel(db, ["CurrentThread"], ctx)
+        assert first.metadata.get("timed_out")
+
+        # 超时的工具仍占着唯一的槽位：同步 / 异步路径都直接降级，不等待
+        [shed] = run_tools_parallel(db, ["CurrentThread"], ctx)
+        assert shed.metadata.get("shed")
+        [shed] = asyncio.run(run_tools_async(db, ["CurrentThread"], ctx))
+        assert shed.metadata.get("shed")
+
+        # 卡住的线程结束后才归还槽位
+        release.set()
+        deadline = time.monotonic() + 5
+        while not slots.acquire(blocking=False):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        slots.release()
+        [ok] = asyncio.run(run_tools_async(db, ["CurrentThread"], ctx))
+        assert ok.content == "thread"
+    finally:
+        release.set()
+        db.close()
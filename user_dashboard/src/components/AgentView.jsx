@@ -214,20 +214,75 @@ const AgentView = ({ theme }) => {
     setChatInput('');
     setIsThinking(true);
 
+    // Update the streaming bot message (always the last one) in place
+    const updateBotMessage = (patch) => {
+      setChatMessages(prev => {
+        const next = [...prev];
+        const last = next[next.length - 1];
+        if (last && last.role === 'bot' && last.streaming) {
+          next[next.length - 1] = { ...last, ...patch(last) };
+        } else {
+          next.push({ role: 'bot', content: '', sources: [], streaming: true, ...patch({ content: '', sources: [] }) });
+        }
+        return next;
+      });
+    };
+
     try {
-      const res = await axios.post(`${apiBase}/ai/ask`, {
-        question,
-        current_thread_id: selectedEmail?.thread_id || null,
-        chat_id: chatId
-      }, getAuthHeaders());
+      // Server-Sent Events: tools / sources arrive after retrieval, then answer tokens, then done
+      const res = await fetch(`${apiBase}/ai/ask/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          Authorization: `Bearer ${authToken}`
+        },
+        body: JSON.stringify({
+          question,
+          current_thread_id: selectedEmail?.thread_id || null,
+          chat_id: chatId
+        })
+      });
+      if (!res.ok || !res.body) {
+        throw new Error(`Request failed with status code ${res.status}`);
+      }
 
-      const answer = res.data.answer || '(No response)';
-      // Capture sources from response
-      const sources = res.data.sources || [];
-      
-      setChatMessages(prev => [...prev, { role: 'bot', content: answer, sources }]);
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const raw of events) {
+          const eventLine = raw.split('\n').find(l => l.startsWith('event: '));
+          const dataLine = raw.split('\n').find(l => l.startsWith('data: '));
+          if (!eventLine || !dataLine) continue;
+          const event = eventLine.slice(7);
+          const data = JSON.parse(dataLine.slice(6));
+          if (event === 'sources') {
+            setIsThinking(false);
+            updateBotMessage(() => ({ sources: data.sources || [] }));
+          } else if (event === 'token') {
+            setIsThinking(false);
+            updateBotMessage(last => ({ content: last.content + data.text }));
+          } else if (event === 'done') {
+            updateBotMessage(() => ({
+              content: data.answer || '(No response)',
+              sources: data.sources || [],
+              streaming: false
+            }));
+          } else if (event === 'error') {
+            throw new Error(data.detail);
+          }
+        }
+      }
     } catch (err) {
-      setChatMessages(prev => [...prev, { role: 'bot', content: `Error: ${err.message}` }]);
+      setChatMessages(prev => [
+        ...prev.filter(m => !m.streaming),
+        { role: 'bot', content: `Error: ${err.message}` }
+      ]);
     } finally {
       setIsThinking(false);
     }
@@ -298,6 +353,15 @@ const AgentView = ({ theme }) => {
     window.open(authUrl.toString(), "gmail_oauth", "width=520,height=700");
   };
 
+  // Imports run as background jobs; poll until the job finishes
+  const waitForJob = async (jobId) => {
+    while (true) {
+      const res = await axios.get(`${apiBase}/ingestion/jobs/${jobId}`, getAuthHeaders());
+      if (res.data.status === 'completed' || res.data.status === 'failed') return res.data;
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+    }
+  };
+
   const handleGmailAccessToken = async (accessToken, refreshToken) => {
     setStatus('Linking Gmail...', 'info');
     try {
@@ -308,13 +372,16 @@ const AgentView = ({ theme }) => {
       const email = profileRes.data.emailAddress;
       
       // 2. Connect to backend
-      await axios.post(`${apiBase}/gmail/connect`, {
+      const connectRes = await axios.post(`${apiBase}/gmail/connect`, {
         email,
         access_token: accessToken,
         refresh_token: refreshToken,
         days_back: 90
       }, getAuthHeaders());
       
+      setStatus(`Linked ${email}, importing emails...`, 'info');
+      const job = await waitForJob(connectRes.data.job_id);
+      if (job.status === 'failed') throw new Error(job.last_error || 'import failed');
       setStatus(`Linked ${email} successfully`, 'info');
       fetchMailboxes();
       fetchEmails();
@@ -330,7 +397,9 @@ const AgentView = ({ theme }) => {
         email,
         fallback_days_back: 7
       }, getAuthHeaders());
-      setStatus(`Sync complete: ${res.data.ingested} emails`, 'info');
+      const job = await waitForJob(res.data.job_id);
+      if (job.status === 'failed') throw new Error(job.last_error || 'sync failed');
+      setStatus(`Sync complete: ${job.result?.ingested ?? 0} emails`, 'info');
       fetchEmails();
       fetchMailboxes(); // Update last sync time
     } catch (err) {